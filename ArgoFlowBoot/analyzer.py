@@ -0,0 +1,267 @@
+import json
+import re
+from pyutilb.log import log
+from ArgoFlowBoot.emitter import write_file_if_changed
+from ArgoFlowBoot.dag_parser import parse_depends, check_cycle
+
+'''
+流程的静态分析: 分析生成的流程, 估算其宽度(最大并行任务数)、深度(最长的串行任务数)、关键路径与耗时
+    1 steps: 外层list是串行, 内层list是并行
+    2 dag: 根据 dependencies 或 depends 按最早开始时间排期, depends 中的任务都当作要等待的依赖(如 A || B 也等A与B都结束)
+    3 调用其他模板则递归分析, 调用其他流程模板(templateRef)则视为单个任务
+    4 withItems/withSequence 按元素数展开为并行任务, withParam 的元素数未知, 按1个算
+    5 耗时: 模板选项中的 duration 来标注耗时(如 30s/5m/1h30m), 其次是 suspend 的 duration, 未标注的按默认耗时算
+    6 最大并行任务数超过 spec.parallelism 则警告
+'''
+
+# 耗时单位对秒数
+duration_units = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_duration(val):
+    '''
+    解析耗时
+    :param val: 数字(秒数)或字符串, 如 30, '30s', '5m', '1h30m'
+    :return: 秒数
+    '''
+    if isinstance(val, (int, float)):
+        return float(val)
+    txt = str(val).strip()
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([smhd]?)', txt)
+    if not parts or re.sub(r'[\d\.\s]+[smhd]?', '', txt):
+        raise Exception(f"无法识别耗时: {val}, 格式如 30s/5m/1h30m")
+    return sum(float(num) * duration_units[unit] for num, unit in parts)
+
+def to_go_duration(val):
+    '''
+    转为go的时长格式, 如 24h/1h30m/90s, 用于argo的时长选项
+    :param val: 数字(秒数)或字符串, 如 30, '1d', '1h30m'
+    '''
+    if isinstance(val, str) and re.match(r'^(\d+(\.\d+)?(ns|us|ms|s|m|h))+$', val.strip()):
+        return val.strip()
+    return f"{parse_duration(val):g}s"
+
+class Metric(object):
+    '''
+    模板/步骤的分析指标
+    '''
+
+    def __init__(self, duration=0.0, width=0, depth=0, path=None):
+        self.duration = duration # 耗时
+        self.width = width # 最大并行任务数
+        self.depth = depth # 最长的串行任务数
+        self.path = path or [] # 关键路径
+
+class FlowAnalyzer(object):
+
+    def __init__(self, default_duration=1):
+        '''
+        构造函数
+        :param default_duration: 未标注耗时的模板的默认耗时(秒)
+        '''
+        self.default_duration = default_duration
+        self.reports = {} # 流程的分析报告, key是流程名
+
+    def analyse(self, flow, durations=None):
+        '''
+        分析流程
+        :param flow: 生成的流程, 即 Workflow/WorkflowTemplate/ClusterWorkflowTemplate/CronWorkflow
+        :param durations: 模板标注的耗时, key是模板名, value是秒数
+        :return: 分析报告
+        '''
+        spec = flow['spec']
+        if flow['kind'] == 'CronWorkflow':
+            spec = spec['workflowSpec']
+        meta = flow['metadata']
+        name = meta.get('name') or meta.get('generateName', '').rstrip('-')
+        report = {
+            'kind': flow['kind'],
+            'entrypoint': spec.get('entrypoint'),
+            'parallelism': spec.get('parallelism'),
+            'warnings': [],
+        }
+        self.reports[name] = report
+        if not spec.get('entrypoint'): # 流程模板可以没有入口
+            return report
+
+        ctx = AnalyseContext(spec.get('templates', []), durations or {}, self.default_duration)
+        metric = ctx.measure_template(spec['entrypoint'])
+        report.update({
+            'max_width': metric.width,
+            'depth': metric.depth,
+            'makespan_seconds': metric.duration,
+            'critical_path': metric.path,
+            'unhinted_templates': sorted(ctx.unhinted),
+        })
+        # 警告
+        warnings = report['warnings']
+        parallelism = spec.get('parallelism')
+        if isinstance(parallelism, int) and metric.width > parallelism:
+            warnings.append(f"最大并行任务数{metric.width}超过了 spec.parallelism={parallelism}, 多出的任务要排队, 估算耗时未考虑排队")
+        if ctx.dynamic:
+            warnings.append(f"以下步骤用 withParam 动态展开, 元素数未知, 按1个算: {', '.join(sorted(ctx.dynamic))}")
+        if ctx.recursive:
+            warnings.append(f"以下模板递归调用, 只分析一层: {', '.join(sorted(ctx.recursive))}")
+        # 打印
+        log.info(f"流程[%s]的分析: 最大并行任务数=%s, 深度=%s, 估算耗时=%ss, 关键路径=%s", name, metric.width, metric.depth, metric.duration, ' -> '.join(metric.path))
+        for warning in warnings:
+            log.warning(f"流程[%s]: %s", name, warning)
+        return report
+
+    def save(self, file):
+        '''
+        保存分析报告
+        :param file: json文件
+        '''
+        write_file_if_changed(file, json.dumps(self.reports, indent=1, ensure_ascii=False))
+        log.info(f"流程分析报告已保存到 %s", file)
+
+class AnalyseContext(object):
+    '''
+    单个流程的分析上下文, 缓存各模板的指标
+    '''
+
+    def __init__(self, templates, durations, default_duration):
+        self.templates = {tpl['name']: tpl for tpl in templates}
+        self.durations = durations
+        self.default_duration = default_duration
+        self.metrics = {} # 模板的指标缓存
+        self.visiting = set() # 正在分析的模板, 用于识别递归
+        self.unhinted = set() # 未标注耗时的模板
+        self.dynamic = set() # 用withParam动态展开的步骤
+        self.recursive = set() # 递归调用的模板
+
+    def measure_template(self, name):
+        if name in self.metrics:
+            return self.metrics[name]
+        if name in self.visiting: # 递归
+            self.recursive.add(name)
+            return Metric()
+        tpl = self.templates.get(name)
+        if tpl is None: # 未知模板, 当作单个任务
+            return self.measure_leaf(name, None)
+        self.visiting.add(name)
+        try:
+            if 'steps' in tpl:
+                metric = self.measure_steps(tpl['steps'])
+            elif 'dag' in tpl:
+                metric = self.measure_dag(tpl['dag'].get('tasks', []))
+            else:
+                metric = self.measure_leaf(name, tpl)
+        finally:
+            self.visiting.discard(name)
+        self.metrics[name] = metric
+        return metric
+
+    def measure_leaf(self, name, tpl):
+        '''
+        单个任务的模板, 如 container/script/resource/http/suspend
+        '''
+        width = 1
+        if name in self.durations:
+            duration = self.durations[name]
+        elif tpl is not None and 'suspend' in tpl: # 暂停: 不占pod
+            width = 0
+            duration = tpl['suspend'].get('duration', 0)
+            if '{{' in str(duration): # 时长是变量, 按默认耗时算
+                self.unhinted.add(name)
+                duration = self.default_duration
+            else:
+                duration = parse_duration(duration)
+        else:
+            self.unhinted.add(name)
+            duration = self.default_duration
+        return Metric(duration, width, 1, [name])
+
+    def measure_step(self, step):
+        '''
+        单个步骤/任务: 调用模板, 有循环则展开为并行任务
+        '''
+        if 'templateRef' in step: # 其他流程模板的模板, 当作单个任务
+            ref = step['templateRef']
+            metric = self.measure_leaf(f"{ref['name']}.{ref['template']}", None)
+        else:
+            metric = self.measure_template(step.get('template'))
+        # 循环
+        n = 1
+        if 'withItems' in step:
+            n = len(step['withItems'])
+        elif 'withSequence' in step:
+            n = count_sequence(step['withSequence'])
+        elif 'withParam' in step:
+            self.dynamic.add(step.get('name'))
+        path = [f"{step.get('name')}/{p}" for p in metric.path]
+        return Metric(metric.duration, metric.width * n, metric.depth, path)
+
+    def measure_steps(self, groups):
+        '''
+        steps: 外层list是串行, 内层list是并行
+        '''
+        ret = Metric()
+        for group in groups:
+            if isinstance(group, dict):
+                group = [group]
+            metrics = [self.measure_step(step) for step in group]
+            if not metrics:
+                continue
+            slowest = max(metrics, key=lambda m: m.duration)
+            ret.duration += slowest.duration
+            ret.path += slowest.path
+            ret.width = max(ret.width, sum(m.width for m in metrics))
+            ret.depth += max(m.depth for m in metrics)
+        return ret
+
+    def measure_dag(self, tasks):
+        '''
+        dag: 按依赖关系排期, 每个任务都尽早开始
+        '''
+        name2task = {task['name']: task for task in tasks}
+        metrics = {name: self.measure_step(task) for name, task in name2task.items()}
+        name2deps = {name: [d for d in get_task_deps(task) if d in name2task] for name, task in name2task.items()}
+        # 拓扑排序
+        order = check_cycle(name2deps)
+        finish = {} # 结束时间
+        depth = {} # 到该任务的最长串行任务数
+        prev = {} # 关键路径上的前一个任务
+        events = [] # 排期事件, 用于统计最大并行任务数
+        for name in order:
+            deps = name2deps[name]
+            start = max((finish[d] for d in deps), default=0)
+            metric = metrics[name]
+            finish[name] = start + metric.duration
+            depth[name] = max((depth[d] for d in deps), default=0) + metric.depth
+            prev[name] = max(deps, key=lambda d: finish[d]) if deps else None
+            events.append((start, 1, metric.width))
+            events.append((finish[name], 0, -metric.width)) # 同一时刻先结束再开始
+        if not order:
+            return Metric()
+        # 最大并行任务数: 扫描排期事件
+        width = running = 0
+        for _, _, w in sorted(events):
+            running += w
+            width = max(width, running)
+        # 关键路径: 从最晚结束的任务往前回溯
+        name = max(order, key=lambda n: finish[n])
+        path = []
+        while name is not None:
+            path = metrics[name].path + path
+            name = prev[name]
+        return Metric(max(finish.values()), width, max(depth.values()), path)
+
+def get_task_deps(task):
+    '''
+    dag任务依赖的任务: dependencies 或 depends 表达式
+    '''
+    if 'depends' in task:
+        return parse_depends(task['depends'])
+    return task.get('dependencies', [])
+
+def count_sequence(seq):
+    '''
+    withSequence的元素数: count 或 end-start+1, 是变量则按1个算
+    '''
+    try:
+        if 'count' in seq:
+            return int(seq['count'])
+        return int(seq.get('end', 0)) - int(seq.get('start', 0)) + 1
+    except (TypeError, ValueError):
+        return 1
@@ -1,17 +1,37 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import copy
 import json
 import os
 import re
-from K8sBoot.boot import Boot as K8sBoot
-from pyutilb.curl import parse_curl
+import shutil
+import tempfile
 from pyutilb.util import *
 from pyutilb.file import *
 from pyutilb.cmd import *
 from pyutilb import YamlBoot, BreakException
 from pyutilb.log import log
+from pyutilb.lazy import lazyproperty
+from ArgoFlowBoot.expr import replace_var, replace_var_on_params, parse_func # 覆盖 pyutilb.util 的同名函数
 from ArgoFlowBoot.task_namer import *
+from ArgoFlowBoot.dag_parser import parse_deps, check_cycle
+from ArgoFlowBoot.options import parse_boot_options
+from ArgoFlowBoot.pool import run_in_pool, list_step_files
+from ArgoFlowBoot.manifest import BuildManifest
+from ArgoFlowBoot.emitter import dump_yaml, write_file_if_changed, BundleWriter, redirect_log_to_stderr
+from ArgoFlowBoot.wft_cache import WftSignatureCache, fetch_argo_wfts
+from ArgoFlowBoot.parse_cache import ParseCache
+from ArgoFlowBoot.watcher import Watcher
+from ArgoFlowBoot.profiler import Profiler
+from ArgoFlowBoot.analyzer import FlowAnalyzer, parse_duration, to_go_duration
+from ArgoFlowBoot.size_guard import SizeGuard, add_input, param_prefix
+from ArgoFlowBoot.items_file import ItemsConfigMap
+from ArgoFlowBoot.presets import build_profile, merge_profile, log_profile, preset_key
+from ArgoFlowBoot.dedup import TemplateDeduper
+from ArgoFlowBoot.submitter import ArgoSubmitter
+from ArgoFlowBoot.manifest_diff import ManifestDiffer
+from ArgoFlowBoot.http_batch import parse_curl_request, build_batch_request, build_batch_source, default_timeout, default_success_condition, default_concurrency, results_path, default_image as http_batch_image
 
 '''
 代理工件对象, 并改写tostring(), 以便支持
@@ -27,11 +47,26 @@ class ArtifactProxy(dict):
     def __repr__(self):
         return self.repr
 
+'''
+未知流程模板的异常: 在不允许从集群拉取流程模板时(如多进程并行生成), 引用了未知的流程模板
+'''
+class WftNotFoundException(Exception):
+
+    def __init__(self, wft):
+        super().__init__(f"未知流程模板: {wft}")
+        self.wft = wft # 流程模板名
+
+# 信号量的ConfigMap名
+semaphore_configmap = 'argoflowboot-semaphores'
+
 '''
 argo flow配置生成的基于yaml的启动器
 '''
 class Boot(YamlBoot):
 
+    # k8sboot的自定义函数
+    k8s_funs = ['ref_pod_field', 'ref_resource_field', 'ref_config', 'ref_secret']
+
     def __init__(self, output_dir):
         super().__init__()
         self.output_dir = os.path.abspath(output_dir or 'out')
@@ -48,6 +83,9 @@ class Boot(YamlBoot):
             'cwf': self.cwf,
             'labels': self.labels,
             'spec': self.spec,
+            'limits': self.limits,
+            'semaphores': self.semaphores,
+            'profile': self.profile,
             'args': self.args,
             'cron': self.cron,
             'vc_templates': self.vc_templates,
@@ -58,8 +96,8 @@ class Boot(YamlBoot):
         }
         self.add_actions(actions)
 
-        # 自定义函数
-        K8sBoot('.').register_custom_funs()
+        # 自定义函数: k8sboot的自定义函数, 延迟到调用时才创建k8sboot
+        custom_funs.update({name: self.wrap_k8s_fun(name) for name in self.k8s_funs})
 
         # 任务命名者
         self.namer = FuncIncrTaskNamer()
@@ -77,6 +115,7 @@ class Boot(YamlBoot):
             'delete': self.build_delete,
             'create_wf_by_wft': self.build_create_wf_by_wft,
             'http': self.build_http,
+            'http_batch': self.build_http_batch,
         }
         # python版本
         py_versions = '3.6/3.7/3.8/3.9/3.10/3.11'.split('/')
@@ -90,6 +129,9 @@ class Boot(YamlBoot):
         self._flow = '' # 流程名
         self._labels = {}  # 记录标签
         self._spec = {}  # 记录流程其他配置
+        self._limits = {}  # 记录流程的并发限制
+        self._flow_profile = {}  # 记录流程的性能预设
+        self._profile_resources = 0  # 记录用了默认资源的容器数
         self._args = None  # 记录流程级传参
         self._cron_spec = None  # 记录cron选项
         self._templates = {}  # 记录模板，key是模板名，value是模板定义
@@ -97,9 +139,52 @@ class Boot(YamlBoot):
         self._template_outputs = {} # 记录模板的输出参数名
         self._vc_templates = None # 记录vs模板
         self._vc_mounts = [] # 记录vs挂载路径
+        self._template_durations = {} # 记录模板标注的耗时(秒), 用于流程分析
+        self._items_cm = None # 记录循环元素的ConfigMap
+        self._step_inputs = [] # 记录步骤给当前模板添加的输入参数, 元素为(参数名, configMapKeyRef)
 
         # 跨flow的属性
         self._wft2template_inputs = {}  # 记录所有流程模板的模板输入参数名, 对key=''表示流程级输入参数名
+        self.pull_wft = True # 遇到未知流程模板时是否从集群拉取, 否则抛出 WftNotFoundException
+        self.output_files = [] # 记录生成的文件
+        self.manifest = None # 增量构建的清单, 为None则全量构建
+        self.wft_cache = None # 远程流程模板签名的磁盘缓存, 为None则不缓存
+        self.parse_cache = None # 步骤文件与模板库的解析缓存, 为None则不缓存
+        self._pulled_wfts = set() # 已批量拉取过的命名空间, ClusterWorkflowTemplate记为'~'
+        self._semaphores = {} # 声明的信号量, key是命名空间, value是dict{信号量名: 并发上限}
+        self._profile = {} # 全局的性能预设
+        self._k8s_containers = {} # 缓存k8sboot构建的容器, key是容器选项的hash
+        self.analyzer = None # 流程分析器, 为None则不分析
+        self.size_guard = SizeGuard() # 流程大小的检查, 过大则将大段内容转移到ConfigMap
+        self.deduper = None # 跨流程的模板去重, 为None则不去重
+        self.bundle = None # 多文档输出, 为None则每个资源单独输出一个文件
+        self.submitter = None # 提交到argo服务器, 为None则不提交
+        self.differ = None # 与快照做语义比较, 为None则不比较
+
+        # 步骤文件作用域的属性, 用于增量构建
+        self._deps = [] # 记录依赖的文件
+        self._wft_refs = {} # 记录引用的流程模板入参
+
+    @lazyproperty
+    def k8s(self):
+        '''
+        k8s资源的构建者: 用来构建容器与定时选项, 整个Boot共用一个
+            延迟创建: 导入k8sboot(会导入kubernetes库)很慢, 只有构建容器或定时选项时才需要
+        '''
+        from K8sBoot.boot import Boot as K8sBoot
+        k8s = K8sBoot('.')
+        # 注册自定义函数, 会覆盖 wrap_k8s_fun() 的包装
+        k8s.register_custom_funs()
+        return k8s
+
+    def wrap_k8s_fun(self, name):
+        '''
+        包装k8sboot的自定义函数, 调用时才创建k8sboot
+        :param name: 函数名
+        '''
+        def wrapper(*args, **kwargs):
+            return getattr(self.k8s, name)(*args, **kwargs)
+        return wrapper
 
     # 清空flow相关的属性
     def clear_flow(self):
@@ -108,6 +193,9 @@ class Boot(YamlBoot):
         set_var('flow', None)
         self._labels = {}  # 记录标签
         self._spec = {}  # 记录流程其他配置
+        self._limits = {}  # 记录流程的并发限制
+        self._flow_profile = {}  # 记录流程的性能预设
+        self._profile_resources = 0  # 记录用了默认资源的容器数
         self._args = None  # 记录流程级传参
         self._cron_spec = None  # 记录cron选项
         self._templates = {}  # 记录模板，key是模板名，value是模板定义
@@ -115,8 +203,85 @@ class Boot(YamlBoot):
         self._template_outputs = {} # 记录模板的输出参数名
         self._vc_templates = None # 记录vs模板
         self._vc_mounts = [] # 记录vs挂载路径
+        self._template_durations = {} # 记录模板标注的耗时(秒), 用于流程分析
+        if self._items_cm is not None: # 流程出错了则放弃写
+            self._items_cm.abort()
+            self._items_cm = None
+        self._step_inputs = []
         clear_vars('*') # 清理全部变量
-        self.namer = FuncIncrTaskNamer() # 重置命名器，因为他内部有状态(计数)
+        self.namer.clear() # 重置命名器，因为他内部有状态(计数)
+
+    def get_run_state(self):
+        '''
+        获得跨步骤文件的执行状态: 流程外的动作(ns/semaphores/profile)设置的属性, 串行执行时会带到之后的步骤文件
+            多进程并行生成时, 要传给执行后续步骤文件的工作进程
+        :return: dict, 可pickle与比较
+        '''
+        return {
+            'ns': self._ns,
+            'semaphores': copy.deepcopy(self._semaphores),
+            'profile': copy.deepcopy(self._profile),
+        }
+
+    def set_run_state(self, state):
+        '''
+        恢复跨步骤文件的执行状态
+        :param state: get_run_state() 的结果
+        '''
+        self._ns = state['ns']
+        self._semaphores = copy.deepcopy(state['semaphores'])
+        self._profile = copy.deepcopy(state['profile'])
+
+    def do_run(self, step_files):
+        '''
+        执行步骤文件: 用 list_step_files() 展开步骤文件, 以便串行/多进程并行/监视模式遍历的文件一致
+        :param step_files: 步骤配置文件或目录的列表
+        '''
+        for file in list_step_files(step_files):
+            self.run_1file(file)
+
+    def run_1file(self, step_file, include = False):
+        '''
+        执行单个步骤文件
+            增量构建时, 如果步骤文件及其依赖都没变, 则跳过
+        :param step_file 步骤配置文件路径
+        :param include 是否inlude动作触发
+        '''
+        if include or self.manifest is None or is_http_file(step_file):
+            return super().run_1file(step_file, include)
+
+        step_file = os.path.abspath(step_file)
+        state = self.get_run_state()
+        entry = self.manifest.check(step_file, self._wft2template_inputs, state)
+        if entry is not None:
+            # 恢复定义的流程模板入参与执行状态, 以便其他步骤文件引用
+            self._wft2template_inputs.update(entry['wfts'])
+            self.set_run_state(entry['end'])
+            self.output_files.extend(entry['outputs'])
+            log.info(f"步骤文件[%s]及其依赖都没变, 跳过构建", step_file)
+            return
+
+        self._deps = []
+        self._wft_refs = {}
+        start = len(self.output_files)
+        wfts = dict(self._wft2template_inputs)
+        super().run_1file(step_file, include)
+        # 记录构建
+        wfts = {k: v for k, v in self._wft2template_inputs.items() if wfts.get(k) is not v} # 本文件定义的流程模板入参
+        self.manifest.record(step_file, self._deps, self._wft_refs, wfts, self.output_files[start:], state, self.get_run_state())
+
+    # 加载并执行其他步骤文件
+    def include(self, step_file):
+        if not is_http_file(step_file):
+            self.add_dep(step_file if os.path.isabs(step_file) else os.path.join(self.step_dir, step_file))
+        super().include(step_file)
+
+    def add_dep(self, file):
+        '''
+        记录依赖的文件, 用于增量构建
+        :param file: 文件路径, 相对路径是相对于当前目录(即步骤文件所在目录)
+        '''
+        self._deps.append(os.path.abspath(file))
 
     def save_yaml(self, data, file):
         '''
@@ -127,24 +292,88 @@ class Boot(YamlBoot):
         # 检查文件
         if not file:
             raise Exception(f"未指定输出文件")
+        # 与快照比较: 只输出新增/修改的资源
+        if self.differ is not None:
+            data = self.differ.accept(data, file)
+            if data is None:
+                return
+        # 暂存要提交到argo服务器的资源
+        if self.submitter is not None:
+            self.submitter.add(data, self.get_output_path(file))
+        # 多文档输出: 马上输出, 不写文件
+        if self.bundle is not None:
+            for doc in (data if isinstance(data, list) else [data]):
+                if not isinstance(doc, str):
+                    doc = dump_yaml(doc, sort_keys=isinstance(data, list))
+                self.bundle.write_doc(doc, file)
+            return
         # 转yaml
         if isinstance(data, list): # 多个资源
-            data = list(map(yaml.dump, data))
+            data = list(map(dump_yaml, data))
             data = "\n---\n\n".join(data)
         elif not isinstance(data, str):
-            data = yaml.dump(data, sort_keys=False)
+            data = dump_yaml(data, sort_keys=False)
         # 创建目录
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-        # 保存文件
+        os.makedirs(self.output_dir, exist_ok=True) # 多进程并行生成时可能同时创建
+        # 保存文件: 内容没变则不写
         file = os.path.join(self.output_dir, file)
-        write_file(file, data)
+        write_file_if_changed(file, data)
+        self.output_files.append(file)
+
+    def on_end(self):
+        '''
+        执行结束的后置处理: 跨流程的模板去重, 并保存暂存的流程; 再保存与快照比较的变更清单, 并提交到argo服务器
+        '''
+        if self.deduper is not None:
+            for data, file in self.deduper.dedup():
+                self.save_yaml(data, file)
+                if data['kind'] == 'WorkflowTemplate':
+                    log.info(f"共享流程模板[%s]的定义文件已生成, 提交流程前请先执行: argo template create %s", data['metadata']['name'], self.get_output_path(file))
+        if self.differ is not None:
+            self.differ.save()
+        if self.submitter is not None:
+            self.submitter.submit()
+
+    def read_cached_step_file(self, step_file):
+        '''
+        读步骤文件: 有解析缓存则用解析缓存
+        '''
+        if self.parse_cache is None:
+            return super().read_cached_step_file(step_file)
+        # 内存缓存
+        if self.step_file_cache is not None:
+            if step_file not in self.step_file_cache:
+                self.step_file_cache[step_file] = self.parse_cache.read_yaml(step_file)
+            return self.step_file_cache[step_file]
+        return self.parse_cache.read_yaml(step_file)
+
+    def read_yaml_file(self, file, safe=False):
+        '''
+        读yaml文件(模板库/argo流程模板原生文件): 有解析缓存则用解析缓存
+        :param file: yaml文件
+        :param safe: 是否用SafeLoader解析
+        '''
+        if self.parse_cache is not None:
+            return self.parse_cache.read_yaml(file, safe)
+        if safe:
+            with open(file, 'r') as f:
+                return yaml.load(f, Loader=yaml.SafeLoader)
+        return read_yaml(file)
+
+    def get_output_path(self, file):
+        '''
+        获得输出文件的路径, 用于打印提交命令; 多文档输出时则为其输出文件
+        :param file: 文件名
+        '''
+        if self.bundle is not None:
+            return self.bundle.path
+        return os.path.join(self.output_dir, file)
 
     def print_create_cmd(self):
         '''
         打印argo创建命令
         '''
-        cmd = f'流程[{self._flow}]的定义文件已生成完毕, 如要提交到到集群中请手动执行: {self.get_create_cmd_pref(self._type)} {self.output_dir}/{self._flow}.yml'
+        cmd = f'流程[{self._flow}]的定义文件已生成完毕, 如要提交到到集群中请手动执行: {self.get_create_cmd_pref(self._type)} {self.get_output_path(self._flow + ".yml")}'
         log.info(cmd)
 
     def get_create_cmd_pref(self, type):
@@ -209,9 +438,28 @@ class Boot(YamlBoot):
             yaml = self.build_cron_flow()
         else: # 生成flow
             yaml = self.build_flow()
+        # 打印性能预设
+        if self._profile or self._flow_profile:
+            spec = yaml['spec']['workflowSpec'] if self._type == 'cwf' else yaml['spec']
+            log_profile(self._flow, self.get_profile_fields(), spec, self._profile_resources)
+        # 分析流程: 并行度/深度/关键路径, 要在转移withItems前分析
+        if self.analyzer is not None:
+            self.analyzer.analyse(yaml, self._template_durations)
+        # 检查大小: 过大则将大段内容转移到ConfigMap
+        configmaps = self.size_guard.guard(yaml, self._flow, self._ns)
+        # 保存引用的ConfigMap: 先于流程输出
+        if configmaps:
+            self.save_yaml(configmaps, f"{self._flow}-src.yml")
+            log.info(f"流程[%s]引用了ConfigMap, 提交流程前请先执行: kubectl apply -f %s", self._flow, self.get_output_path(f"{self._flow}-src.yml"))
+        if self._items_cm is not None:
+            self.save_items_configmap()
+            log.info(f"流程[%s]的循环元素在ConfigMap中, 提交流程前请先执行: kubectl apply -f %s", self._flow, self.get_output_path(f"{self._flow}-items.yml"))
         # 保存为yaml文件
         file = f"{self._flow}.yml"
-        self.save_yaml(yaml, file)
+        if self.deduper is not None and self.deduper.accept(yaml): # 去重: 暂存流程, 执行结束时统一去重再保存
+            self.deduper.add(yaml, file)
+        else:
+            self.save_yaml(yaml, file)
         # 记录全局的入参
         if self._type == 'wft' or self._type == 'cwft':
             self._wft2template_inputs[name] = self._template_inputs # 记录所有流程模板的模板输入参数名
@@ -272,7 +520,9 @@ class Boot(YamlBoot):
                 "entrypoint": entrypoint,
                 "onExit": exit_handler,
                 "arguments": self._args,
+                **self.build_profile_spec(),
                 **self._spec,
+                **self._limits,
                 "volumeClaimTemplates": self._vc_templates,
                 "templates": list(self._templates.values()),
                 # "ttlStrategy": {
@@ -367,6 +617,122 @@ class Boot(YamlBoot):
     def spec(self, option):
         self._spec = option
 
+    @replace_var_on_params
+    def limits(self, option):
+        '''
+        设置流程的并发限制, 参考 https://argoproj.github.io/argo-workflows/synchronization/
+        :param option: {parallelism: 最大并行任务数, semaphore: 信号量名(可多个), mutex: 互斥锁名(可多个)}
+        '''
+        self._limits = self.build_limits(option, f"流程[{self._flow}]")
+
+    @replace_var_on_params
+    def profile(self, option):
+        '''
+        设置性能预设: podGC/ttlStrategy/activeDeadlineSeconds/容器的默认资源
+            在流程外声明则作用于之后的所有流程(包括之后的步骤文件, -j 并行生成时也会传给工作进程), 在流程内声明则只作用于当前流程: 指定了预设名则替换前者, 否则覆盖前者的字段;
+            spec 动作与模板选项(如容器的resources)会覆盖预设
+        :param option: 预设名(throughput/low-latency/debug), 或dict{preset: 预设名(可省), 字段: 值}
+        '''
+        if self._flow:
+            self._flow_profile = build_profile(option)
+        else:
+            self._profile = build_profile(option)
+
+    def get_profile_fields(self):
+        '''
+        获得当前流程最终的预设字段
+        :return: dict{字段: (值, 来源)}
+        '''
+        if preset_key in self._flow_profile: # 流程指定了预设名, 则替换全局的预设
+            return merge_profile(('流程', self._flow_profile))
+        return merge_profile(('全局', self._profile), ('流程', self._flow_profile))
+
+    def build_profile_spec(self):
+        '''
+        构建预设的spec字段
+        '''
+        if not self._profile and not self._flow_profile:
+            return {}
+        return {k: v for k, (v, _) in self.get_profile_fields().items() if k != 'resources'}
+
+    @replace_var_on_params
+    def semaphores(self, caps):
+        '''
+        声明信号量, 即跨流程的共享资源的并发上限(如数据库迁移最多同时5个), 每个命名空间只需声明一次
+            生成信号量的ConfigMap: argoflowboot-semaphores.yml, 流程只能引用所在命名空间的ConfigMap, 因此每个命名空间一个ConfigMap(多文档)
+        :param caps: dict, key是信号量名, value是并发上限
+        '''
+        for name, cap in caps.items():
+            if not isinstance(cap, int) or cap < 1:
+                raise Exception(f"信号量[{name}]的并发上限必须是正整数: {cap}")
+        self._semaphores.setdefault(self._ns, {}).update(caps)
+        configmaps = []
+        for ns, ns_caps in self._semaphores.items():
+            meta = {
+                'name': semaphore_configmap
+            }
+            if ns:
+                meta['namespace'] = ns
+            configmaps.append({
+                'apiVersion': 'v1',
+                'kind': 'ConfigMap',
+                'metadata': meta,
+                'data': {name: str(cap) for name, cap in ns_caps.items()}
+            })
+        self.save_yaml(configmaps[0] if len(configmaps) == 1 else configmaps, f"{semaphore_configmap}.yml")
+        log.info(f"信号量的定义文件已生成, 提交流程前请先执行: kubectl apply -f %s", self.get_output_path(f"{semaphore_configmap}.yml"))
+
+    def build_limits(self, option, owner):
+        '''
+        构建并发限制: parallelism 与 synchronization
+        :param option: {parallelism: 最大并行任务数, semaphore: 信号量名(可多个), mutex: 互斥锁名(可多个)}
+        :param owner: 所属的流程或模板, 用于报错
+        :return:
+        '''
+        option = dict(option)
+        ret = {}
+        parallelism = get_and_del_dict_item(option, 'parallelism')
+        if parallelism is not None:
+            ret['parallelism'] = int(parallelism)
+        sync = {}
+        # 信号量: 多个则用argo3.6+的复数形式
+        sems = get_and_del_dict_item(option, 'semaphore')
+        if sems:
+            sems = [self.build_semaphore_ref(sem) for sem in (sems if isinstance(sems, list) else [sems])]
+            if len(sems) == 1:
+                sync['semaphore'] = sems[0]
+            else:
+                sync['semaphores'] = sems
+        # 互斥锁
+        mutexes = get_and_del_dict_item(option, 'mutex')
+        if mutexes:
+            mutexes = [{'name': mutex} for mutex in (mutexes if isinstance(mutexes, list) else [mutexes])]
+            if len(mutexes) == 1:
+                sync['mutex'] = mutexes[0]
+            else:
+                sync['mutexes'] = mutexes
+        if option:
+            raise Exception(f"{owner}的limits不支持选项: {', '.join(option)}, 只支持 parallelism/semaphore/mutex")
+        if sync:
+            ret['synchronization'] = sync
+        return ret
+
+    def build_semaphore_ref(self, sem):
+        '''
+        构建信号量的引用
+        :param sem: 信号量名, 即用 semaphores 动作声明的; 或dict{name: ConfigMap名, key: 信号量名}, 即自行管理的ConfigMap
+        '''
+        if isinstance(sem, dict):
+            return {'configMapKeyRef': sem}
+        if sem not in self._semaphores.get(self._ns, {}):
+            log.warning(f"信号量[%s]未在命名空间[%s]中用 semaphores 动作声明, 请确保该命名空间的ConfigMap[%s]中有该信号量", sem, self._ns or '未指定', semaphore_configmap)
+        return {
+            'configMapKeyRef': {
+                'name': semaphore_configmap,
+                'key': sem
+            }
+        }
+
     @replace_var_on_params
     def args(self, args):
         '''
@@ -384,7 +750,7 @@ class Boot(YamlBoot):
                 'schedule': option
             }
         # 调用k8sboot来构建cron选项
-        self._cron_spec = K8sBoot('.').build_cron(option)
+        self._cron_spec = self.k8s.build_cron(option)
 
     def templates(self, options):
         # 模板名:模板配置
@@ -392,10 +758,14 @@ class Boot(YamlBoot):
             self.build_template(name, option)
 
     # 流程内模板配置放一个yaml文件中，引入他的内容并调用 templates() 动作
+    # 有解析缓存则用其内存缓存, 多个流程共享同一份模板库数据, 因为模板构建不修改模板选项
     def include_templates(self, file):
-        with open(file, 'r') as file:
-            data = yaml.load(file, Loader=yaml.SafeLoader)
-            self.templates(data)
+        self.add_dep(file)
+        if self.parse_cache is not None:
+            data = self.parse_cache.read_template_library(file)
+        else:
+            data = self.read_yaml_file(file, True)
+        self.templates(data)
 
     def build_template_body(self, option):
         ret = {}
@@ -445,14 +815,21 @@ class Boot(YamlBoot):
         }
 
     def build_container_body(self, option):
+        option = dict(option) # 不修改入参, 以便模板库可被多个流程共享
         # imagePullPolicy置空
         # if 'imagePullPolicy' not in option:
         #     option['imagePullPolicy'] = None
         # 默认镜像
         if 'image' not in option:
             option['image'] = self.get_default_image(option)
+        # 性能预设的默认资源
+        if 'resources' not in option and (self._profile or self._flow_profile):
+            resources = self.get_profile_fields().get('resources')
+            if resources and resources[0]:
+                option['resources'] = copy.deepcopy(resources[0])
+                self._profile_resources += 1
         # 调用k8sboot来构建容器
-        ret = K8sBoot('.').build_container(None, option)
+        ret = self.build_k8s_container(option)
         # 添加vc模板的挂载
         if self._vc_mounts:
             if "volumeMounts" not in ret:
@@ -460,12 +837,28 @@ class Boot(YamlBoot):
             ret["volumeMounts"] += self._vc_mounts
         return ret
 
+    def build_k8s_container(self, option):
+        '''
+        调用k8sboot来构建容器, 并缓存: 大量模板的容器选项是相同的(如矩阵构建)
+        :param option: 容器选项
+        :return: 容器, 每次都是新的拷贝, 可放心修改
+        '''
+        key = json.dumps(option, sort_keys=True, default=str)
+        # 不缓存: 1 有变量或函数调用, 其结果依赖于当前变量 2 有.env文件, 其内容可能会变
+        if '$' in key or 'env_file' in option:
+            return self.k8s.build_container(None, option)
+        key = md5(key)
+        if key not in self._k8s_containers:
+            self._k8s_containers[key] = self.k8s.build_container(None, option)
+        return copy.deepcopy(self._k8s_containers[key])
+
     def build_script(self, option):
         '''
         构建script模板，参考 https://argoproj.github.io/argo-workflows/walk-through/scripts-and-results/
         :param option:
         :return:
         '''
+        option = dict(option) # 不修改入参
         # 默认命令
         if 'command' not in option:
             option['command'] = "bash"
@@ -473,15 +866,16 @@ class Boot(YamlBoot):
             option['command'] = [option['command']]
         # 源码
         if 'file' in option:
-            option["source"] = read_file(get_and_del_dict_item(option, "file"))
+            file = get_and_del_dict_item(option, "file")
+            self.add_dep(file)
+            option["source"] = read_file(file)
         return {
             "script": self.build_container_body(option)
         }
 
     def wrap_build_python(self, version):
         def wrapper(option):
-            option['command'] = f'python{version}'
-            return self.build_script(option)
+            return self.build_script({**option, 'command': f'python{version}'})
         return wrapper
 
     # 构建边车模板
@@ -499,10 +893,12 @@ class Boot(YamlBoot):
     def build_template(self, name: str, option: dict):
         '''
         构建任务模板
+            不修改入参(模板选项), 因此 include_templates 的模板库可被多个流程共享, 无需每次都拷贝
         :param name: 任务模板名，函数调用的形式
         :param option: 任务模板选项
         :return:
         '''
+        option = dict(option) # 浅拷贝: 以下只会删改顶层的选项, 下层的选项由各构建器自行拷贝
         push_vars_stack() # 变量入栈
         # 解析函数调用
         name, args = parse_func(name, True)
@@ -519,12 +915,23 @@ class Boot(YamlBoot):
         self._template_inputs[name] = get_and_del_dict_item(inputs, 'name')
         if 'steps' not in option and 'dag' not in option and 'create_wf_by_wft' not in option: # steps延迟替换变量, 因为下一步的输入变量会依赖上一步的输出, 同时会涉及到函数调用形式中参数值是变量的情况
             option = replace_var(option, False) # 替换变量
+        # 标注的耗时: 只用于流程分析, 不输出到模板
+        duration = get_and_del_dict_item(option, 'duration')
+        if duration is not None:
+            self._template_durations[name] = parse_duration(replace_var(duration))
+        # 记忆化选项
+        memo = get_and_del_dict_item(option, 'memo')
+        # 并发限制
+        limits = get_and_del_dict_item(option, 'limits')
         # 构建主体
         body = self.build_template_body(option)
         if body is None:
             raise Exception(f'不确定任务[{name}]的类型')
         # 构建输出
         out = get_and_del_dict_item(option, 'out')
+        body_out = get_and_del_dict_item(body, 'out') # 主体构建器附加的输出, 如http_batch的结果工件
+        if body_out:
+            out = {**body_out, **(out or {})}
         outputs = self.build_dict_args(out, 'outputs') # 构建输出
         if out: # 记录模板的输出参数名
             self._template_outputs[name] = out.keys()
@@ -537,8 +944,54 @@ class Boot(YamlBoot):
         }
         pop_vars_stack(False) # 变量出栈
         del_dict_none_item(tpl)
+        # 步骤添加的输入参数, 如引用循环元素的ConfigMap
+        for param, ref in self._step_inputs:
+            add_input(tpl, param, ref)
+        self._step_inputs = []
+        if limits:
+            tpl.update(self.build_limits(replace_var(limits), f"模板[{name}]"))
+        if memo:
+            tpl['memoize'] = self.build_memoize(name, replace_var(memo), tpl)
         self._templates[name] = tpl
 
+    def build_memoize(self, name, option, tpl):
+        '''
+        构建记忆化(memoize)选项, 参考 https://argoproj.github.io/argo-workflows/memoization/
+            缓存key自动由模板名、模板内容的hash(模板变了则缓存失效)、输入参数值的hash组成,
+            缓存的ConfigMap默认为每个流程一个, 即 流程名-memo
+        :param name: 模板名
+        :param option: memo选项: true, 或有效期(如24h), 或dict{maxAge: 有效期, key: 缓存key, cache: ConfigMap名}
+        :param tpl: 模板
+        :return:
+        '''
+        if option is True:
+            option = {}
+        elif isinstance(option, (str, int)):
+            option = {'maxAge': option}
+        elif not isinstance(option, dict):
+            raise Exception(f"模板[{name}]的memo选项只接收true, 有效期, 或dict")
+        key = option.get('key')
+        if key is None:
+            inputs = self._template_inputs.get(name) or []
+            params = [p for p in inputs if not p.startswith('@')]
+            if len(params) < len(inputs):
+                log.warning(f"模板[%s]的记忆化缓存key不包含输入工件, 只包含输入参数", name)
+            key = f"{name}-{md5(json.dumps(tpl, sort_keys=True, default=str))[:8]}"
+            if params: # 参数值可能带有ConfigMap key不支持的字符, 因此用hash
+                expr = " + '|' + ".join(f"inputs.parameters['{p}']" for p in params)
+                key += '-{{=sprig.sha1sum(' + expr + ')}}'
+        ret = {
+            'key': key
+        }
+        if 'maxAge' in option:
+            ret['maxAge'] = to_go_duration(option['maxAge'])
+        ret['cache'] = {
+            'configMap': {
+                'name': option.get('cache') or f"{self._flow}-memo"
+            }
+        }
+        return ret
+
     # 构建输入变量
     def build_input_vars(self, type, k, v=None):
         if k.startswith('@'):  # artifacts
@@ -791,7 +1244,7 @@ class Boot(YamlBoot):
         if isinstance(value, dict):
             # value 如 expression: "steps['flip-coin'].outputs.result == 'heads' ? steps.heads.outputs.result : steps.tails.outputs.result"
             if 'expression' in value:
-                value['expression'] = self.fix_expression(value['expression'])
+                value = {**value, 'expression': self.fix_expression(value['expression'])}
             return {
                 "name": key,
                 "valueFrom": value
@@ -842,7 +1295,12 @@ class Boot(YamlBoot):
             step = {
                 'template': step
             }
+        else:
+            step = dict(step) # 不修改入参
         template = get_and_del_dict_item(step, 'template')
+        # 从数据文件加载循环元素
+        items_file = get_and_del_dict_item(step, 'items_file')
+        items_format = get_and_del_dict_item(step, 'items_format')
         # 解析步骤名
         if isinstance(template, str) and '=' in template:  # 遇到有=，则 步骤名=模板调用
             # name, template = template.split('=') # 检查分割, 不能处理参数带=的情况
@@ -856,7 +1314,7 @@ class Boot(YamlBoot):
             # 根据模板表达式自动命名步骤，必须根据模板+参数，不能根据解析后的模板(只有函数名, 不带参数, 无法确定唯一名)
             if name is None:
                 if type == 'steps':
-                    name = self.namer.build_name(template)  # steps生成步骤名, 不缓存(遇同名模板计数递增)
+                    name = self.namer.new_name(template)  # steps生成步骤名, 不缓存(遇同名模板计数递增)
                 else:
                     name = self.namer.get_name(template)  # tasks生成步骤名, 带缓存
         # 解析模板(函数调用)
@@ -874,10 +1332,71 @@ class Boot(YamlBoot):
             }
         if args:
             step['arguments'] = self.build_step_call_args(template, args, wft_ref)
+        if items_file:
+            if 'withItems' in step or 'withParam' in step:
+                raise Exception(f"步骤[{name}]的items_file不能与withItems/withParam同时使用")
+            step['withParam'] = self.build_items_param(name, items_file, items_format)
         # 输出变量
         self.build_step_output_vars(template, name, type)
         return step
 
+    def save_items_configmap(self):
+        '''
+        保存循环元素的ConfigMap
+        '''
+        cm = self._items_cm
+        self._items_cm = None
+        cm.close()
+        file = f"{self._flow}-items.yml"
+        if self.bundle is None and self.differ is None:
+            self.output_files.append(os.path.join(self.output_dir, file))
+            self.skip_submit(file)
+            return
+        # 多文档输出/与快照比较: 已写到临时文件
+        try:
+            if self.differ is not None and not self.differ.accept_file(cm.writer.path, file): # 没变则不输出
+                return
+            self.skip_submit(file)
+            if self.bundle is not None: # 多文档输出: 流式输出临时文件
+                self.bundle.write_doc_file(cm.writer.path, file)
+            else:
+                os.makedirs(self.output_dir, exist_ok=True)
+                path = os.path.join(self.output_dir, file)
+                shutil.copyfile(cm.writer.path, path)
+                self.output_files.append(path)
+        finally:
+            os.remove(cm.writer.path)
+
+    def skip_submit(self, file):
+        '''
+        提交到argo服务器时, 提示要另行提交的资源
+        :param file: 输出文件
+        '''
+        if self.submitter is not None:
+            self.submitter.skip(self.get_output_path(file))
+
+    def build_items_param(self, step, file, format=None):
+        '''
+        从数据文件(json/jsonl/csv)流式加载循环元素到流程的ConfigMap(流程名-items), 步骤通过当前模板的输入参数(valueFrom.configMapKeyRef)引用
+        :param step: 步骤名
+        :param file: 数据文件
+        :param format: 数据文件格式, 默认根据扩展名识别
+        :return: withParam的值
+        '''
+        file = replace_var(file)
+        self.add_dep(file)
+        if self._items_cm is None:
+            if self.bundle is not None or self.differ is not None: # 多文档输出/与快照比较: 先写临时文件, 流程结束时再输出
+                path = os.path.join(tempfile.gettempdir(), f"argoflowboot-{os.getpid()}-{self._flow}-items.yml")
+            else:
+                os.makedirs(self.output_dir, exist_ok=True)
+                path = os.path.join(self.output_dir, f"{self._flow}-items.yml")
+            self._items_cm = ItemsConfigMap(path, f"{self._flow}-items", self._flow, self._ns)
+        key = self._items_cm.add(step, file, format)
+        param = 'items-' + key
+        self._step_inputs.append((param, {'name': self._items_cm.name, 'key': key}))
+        return '{{inputs.parameters.' + param_prefix + param + '}}'
+
     def parse_step_call(self, template):
         '''
         解析模板(函数)调用
@@ -956,37 +1475,49 @@ class Boot(YamlBoot):
                        str类型： curl命令
         :return:
         '''
+        if isinstance(option, dict):
+            option = dict(option) # 不修改入参
         if isinstance(option, str):
             # 解析curl
-            curl = re.sub(r'^curl +', '', option)
-            req = parse_curl(curl, True)
-            # 拼接请求头
-            headers = []
-            if req.header:
-                headers = [{'name': k, 'value': v} for k, v in req.header.items()]
-            # 补全请求方法
-            method = req.request
-            if method is None:
-                if req.data:
-                    method = 'POST'
-                else:
-                    method = 'GET'
-            option = {
-                "url": req.url,
-                "method": method,
-                "body": req.data,
-                "headers": headers,
-            }
+            option = parse_curl_request(option)
         # 默认超时
         if "timeoutSeconds" not in option:
-            option["timeoutSeconds"] = 20  # Default 30
+            option["timeoutSeconds"] = default_timeout  # Default 30
         # 默认成功校验条件
         if "successCondition" not in option:
-            option["successCondition"] = "response.statusCode == 200"
+            option["successCondition"] = default_success_condition
         return {
             "http": option
         }
 
+    def build_http_batch(self, option):
+        '''
+        构建批量http请求: 生成python脚本模板, 在一个节点中并发执行多个请求, 每个请求的结果输出到工件 results
+        :param option: list类型： 请求的list, 请求是curl命令或http模板选项
+                       dict类型： requests为请求的list, concurrency为并发数(默认20), timeoutSeconds/successCondition/insecureSkipVerify为请求的默认选项, 其他为容器选项(如image/resources)
+        :return:
+        '''
+        if isinstance(option, list):
+            option = {'requests': option}
+        option = dict(option) # 不修改入参
+        requests = get_and_del_dict_item(option, 'requests')
+        if not requests:
+            raise Exception("http_batch模板未指定请求: requests")
+        concurrency = get_and_del_dict_item(option, 'concurrency') or default_concurrency
+        defaults = {}
+        for key in ('timeoutSeconds', 'successCondition', 'insecureSkipVerify'):
+            if key in option:
+                defaults[key] = get_and_del_dict_item(option, key)
+        requests = [build_batch_request(req, defaults) for req in requests]
+        if 'image' not in option:
+            option['image'] = http_batch_image
+        option['command'] = 'python3'
+        option['source'] = build_batch_source(requests, int(concurrency))
+        return {
+            **self.build_script(option),
+            'out': {'@results': results_path}, # 结果工件, 由 build_template() 合并到输出
+        }
+
     # 创建k8s资源
     def build_create(self, option):
         return self.build_res_action("create", option)
@@ -1001,10 +1532,13 @@ class Boot(YamlBoot):
 
     # 操作k8s资源
     def build_res_action(self, action, option):
+        option = dict(option) # 不修改入参
         # 源码
         src = get_and_del_dict_item(option, "manifest")
         if 'file' in option:
-            src = read_file(get_and_del_dict_item(option, "file"))
+            file = get_and_del_dict_item(option, "file")
+            self.add_dep(file)
+            src = read_file(file)
         return {
             "resource": {
                 "action": action,
@@ -1066,7 +1600,7 @@ class Boot(YamlBoot):
         return {
             "resource": {
                 "action": "create",
-                "manifest": yaml.dump(flow),
+                "manifest": dump_yaml(flow),
                 "successCondition": "status.phase == Succeeded",
                 "failureCondition": "status.phase in (Failed, Error)"
             }
@@ -1115,25 +1649,31 @@ class Boot(YamlBoot):
     # 根据依赖关系表达式，来构建任务
     def build_dag_deps(self, option: dict):
         deps = get_and_del_dict_item(option, 'deps')
+        if isinstance(deps, str):
+            deps = [deps]
+        # 1 解析依赖关系: 节点与依赖都去重
+        nodes, node2deps = parse_deps(deps)
+        # 2 每个节点只构建一次任务
         tasks = {} # dict: key是任务名(去重), value是任务
-        for dep in deps:
-            # 去掉空格
-            # dep = dep.replace(' ', '')
-            dep = re.sub(r'\s*(->|;|,)\s*', lambda m: m.group(1), dep)
-            if not dep:
-                continue
-            items = dep.split('->')  # 分割每个点
-            items = list(map(lambda x: x.split(';'), items))  # 点中有点, 分号分割
-            # 首个点: 无依赖
-            for node in items[0]:
-                task = self.build_dag_task_dep(node)
-                self.merge_task(task, tasks)
-            # 后续的点: 依赖于前一个点
-            for i in range(1, len(items)):
-                item = items[i]
-                for node in item:
-                    task = self.build_dag_task_dep(node, items[i - 1])  # 前一个点为依赖节点
-                    self.merge_task(task, tasks)
+        node2name = {} # 节点对任务名
+        for node in nodes:
+            task = self.build_step(node, type='tasks')
+            name = task['name']
+            node2name[node] = name
+            if name not in tasks:
+                tasks[name] = task
+        # 3 任务依赖: 同名任务合并依赖
+        name2deps = {name: {} for name in tasks} # 用dict来去重且保序
+        for node in nodes:
+            deps = name2deps[node2name[node]]
+            for dep in node2deps[node]:
+                deps[node2name[dep]] = True
+        name2deps = {name: list(deps) for name, deps in name2deps.items()}
+        # 4 检查环: 报错信息中带上任务表达式
+        check_cycle(name2deps, lambda name: f"{name}[{self.namer.get_task(name) or name}]")
+        for name, deps in name2deps.items():
+            if deps:
+                tasks[name]["dependencies"] = deps
         return {
             "dag": {
                 "tasks": list(tasks.values()),
@@ -1141,33 +1681,6 @@ class Boot(YamlBoot):
             }
         }
 
-    def merge_task(self, task, tasks: dict):
-        '''
-        添加任务，要考虑去重
-            如果存在，则合并依赖
-            否则，直接添加
-        :param task: 要添加的任务
-        :param tasks: 收集任务, dict: key是任务名(去重), value是任务
-        :return:
-        '''
-        name = task['name']
-        if name in tasks:  # 如果存在，则合并依赖
-            tasks[name]["dependencies"] += task.get("dependencies", [])
-        else:
-            tasks[name] = task
-
-    def build_dag_task_dep(self, node, dep_nodes=None):
-        '''
-        构建dag的单个任务依赖
-        :param node: 当前节点
-        :param dep_nodes: 依赖的节点
-        :return:
-        '''
-        task = self.build_step(node, type='tasks')
-        if dep_nodes:
-            task["dependencies"] = list(map(self.namer.get_name, dep_nodes))
-        return task
-
     # ------------------------ 引用其他流程(模板)，以便构建当前流程(模板) ------------------------
     def get_wft_arg_names(self, wft_ref):
         '''
@@ -1185,41 +1698,74 @@ class Boot(YamlBoot):
         :return:
         '''
         if wft_ref not in self._wft2template_inputs:
+            if not self.pull_wft:
+                raise WftNotFoundException(wft_ref)
             self.pull_argo_wft(wft_ref)
+        self._wft_refs[wft_ref] = self._wft2template_inputs[wft_ref]
         return self._wft2template_inputs[wft_ref][tpl_name]
 
     # 加载argo流程模板原生文件，主要是为了获知其入参 -- 主动引入
     def include_argo_wft(self, argo_file):
-        flow = read_yaml(argo_file)
+        self.add_dep(argo_file)
+        flow = self.read_yaml_file(argo_file)
         self.analyse_input_names(flow)
 
-    def pull_argo_wft(self, name, ns='argo'):
+    def pull_argo_wft(self, name, ns=None):
         '''
-        拉取argo流程模板的yaml文件 -- 被动拉取
+        拉取argo流程模板的签名 -- 被动拉取
+            1 先查磁盘缓存
+            2 没有则批量拉取该命名空间下的所有流程模板, 每个命名空间只拉取一次
         :param name: 流程模板名, 如果是~开头，则为ClusterWorkflowTemplate，否则为WorkflowTemplate
-        :param ns:
+        :param ns: 命名空间, 默认为当前命名空间或argo
         :return:
         '''
-        if name.startswith('~'):
-            res = 'cluster-template'
-            name = name[1:]
-        else:
-            res = 'template'
-        cmd = f"argo {res} get {name} -n {ns} -o yaml"
-        txt = run_command(cmd)
-        if not txt:
-            raise Exception(f"无法通过命令获得流程模板定义: {cmd}")
-        flow = yaml.load(txt, Loader=yaml.FullLoader)
-        self.analyse_input_names(flow)
+        ns = ns or self._ns or 'argo'
+        # 1 查磁盘缓存
+        if self.wft_cache is not None:
+            inputs = self.wft_cache.get(ns, name)
+            if inputs is not None:
+                self._wft2template_inputs[name] = inputs
+                return
+        # 2 批量拉取
+        cluster = name.startswith('~')
+        key = '~' if cluster else ns
+        if key not in self._pulled_wfts:
+            self._pulled_wfts.add(key)
+            for flow in fetch_argo_wfts(ns, cluster):
+                ret = self.parse_input_names(flow)
+                if ret is None:
+                    continue
+                flow_name, tpl2inputs = ret
+                if self.wft_cache is not None:
+                    self.wft_cache.put(ns, flow_name, tpl2inputs)
+                # 不覆盖本地定义的流程模板
+                if flow_name not in self._wft2template_inputs:
+                    self._wft2template_inputs[flow_name] = tpl2inputs
+            if self.wft_cache is not None:
+                self.wft_cache.save()
+        if name not in self._wft2template_inputs:
+            raise Exception(f"集群中不存在流程模板: {name}")
 
     # 分析流程模板的inputs，抽取流程入参+内部模板入参
     def analyse_input_names(self, flow):
+        ret = self.parse_input_names(flow)
+        if ret is None:
+            log.debug(f"忽略非流程模板的资源: %s", flow.get('kind'))
+            return
+        flow_name, tpl2inputs = ret
+        self._wft2template_inputs[flow_name] = tpl2inputs
+
+    def parse_input_names(self, flow):
+        '''
+        解析流程模板的签名
+        :param flow: 流程模板定义
+        :return: (流程模板名, dict{模板名: 模板入参名}), 其中key=''表示流程级输入参数名; 非流程模板则返回None
+        '''
         kind = flow['kind']
         if kind == 'Workflow' or kind == 'CronWorkflow':
-            print("忽略")
-            return
+            return None
         # 流程名
-        flow_name = flow['name']
+        flow_name = flow['metadata']['name']
         if kind == 'ClusterWorkflowTemplate':
             flow_name = '~' + flow_name
         # 1 记录流程内模板入参
@@ -1228,11 +1774,10 @@ class Boot(YamlBoot):
         tpl2inputs = {}
         for tpl in tpls:
             tpl2inputs[tpl['name']] = self.build_input_names(tpl.get('inputs'))
-        # 记录流程内模板入参
-        self._wft2template_inputs[flow_name] = tpl2inputs
 
         # 2 记录流程入参
-        self._wft2template_inputs[flow_name][''] = self.build_input_names(flow.get('arguments'))
+        tpl2inputs[''] = self.build_input_names(flow['spec'].get('arguments'))
+        return flow_name, tpl2inputs
 
     def build_input_names(self, inputs):
         '''
@@ -1308,7 +1853,7 @@ class Boot(YamlBoot):
         # 保存为yaml文件
         file = f"{name}.yml"
         self.save_yaml(bind, file)
-        apply_cmd = f'流程绑定事件[{name}]的定义文件已生成完毕, 如要提交到到集群中请手动执行: kubectl apply -f {self.output_dir}/{name}.yml'
+        apply_cmd = f'流程绑定事件[{name}]的定义文件已生成完毕, 如要提交到到集群中请手动执行: kubectl apply -f {self.get_output_path(name + ".yml")}'
         log.info(apply_cmd)
         send_event_cmd  = '发送事件命令如:\nARGO_TOKEN="Bearer $(kubectl get secret default.service-account-token -n argo -o=jsonpath=\'{.data.token}\' | base64 --decode)"\n' + \
                     'curl https://localhost:2746/api/v1/events/argo/' + discriminator + ' -H "Authorization: $ARGO_TOKEN" -d \'' + json.dumps(mevent) + '\' -k'
@@ -1345,18 +1890,123 @@ def main():
     # 读元数据：author/version/description
     dir = os.path.dirname(__file__)
     meta = read_init_file_meta(dir + os.sep + '__init__.py')
+    # 本项目特有的选项
+    boot_option = parse_boot_options()
     # 步骤配置的yaml
     step_files, option = parse_cmd('ArgoFlowBoot', meta['version'])
     if len(step_files) == 0:
         raise Exception("Miss step config file or directory")
-    # 基于yaml的执行器
-    boot = Boot(option.output)
+    # 多文档输出: -o - 输出到标准输出, --bundle 输出到单个文件
+    bundle = '-' if option.output == '-' else boot_option.bundle
+    if bundle == '-':
+        redirect_log_to_stderr()
+        option.output = None
+    if bundle and boot_option.watch:
+        raise Exception("监视模式不支持多文档输出(-o - 或 --bundle)")
+    if bundle and boot_option.incr:
+        log.warning("多文档输出时忽略 --incr 选项, 全量构建")
+        boot_option.incr = False
+    # 提交到argo服务器: 要提交所有资源, 因此不能跳过步骤文件
+    submit = boot_option.submit
+    if submit and boot_option.watch:
+        raise Exception("监视模式不支持提交到argo服务器(--submit)")
+    if submit and boot_option.incr:
+        log.warning("提交到argo服务器时忽略 --incr 选项, 全量构建")
+        boot_option.incr = False
+    # 与快照比较: 要比较所有资源才能识别出删除的, 因此不能跳过步骤文件
+    diff = boot_option.diff_against is not None
+    if diff and boot_option.watch:
+        raise Exception("监视模式不支持与快照比较(--diff-against)")
+    if diff and boot_option.incr:
+        log.warning("与快照比较时忽略 --incr 选项, 全量构建")
+        boot_option.incr = False
+    # 增量构建的清单
+    manifest = None
+    if boot_option.incr:
+        manifest = BuildManifest(option.output, get_vars(True), meta['version'])
+    # 远程流程模板签名的磁盘缓存
+    wft_cache = WftSignatureCache(boot_option.wft_cache_ttl, boot_option.refresh_wft)
+    # 流程大小的检查
+    size_guard = SizeGuard(boot_option.size_limit, boot_option.size_strict, boot_option.size_report)
+    # 步骤文件与模板库的解析缓存
+    parse_cache = ParseCache(boot_option.parse_cache_dir, not boot_option.no_parse_cache)
+    # 去重要处理所有流程: 要在当前进程中执行, 且不能跳过步骤文件
+    if boot_option.dedup:
+        if boot_option.watch:
+            log.warning("监视模式下忽略 --dedup 选项")
+            boot_option.dedup = False
+        if manifest is not None:
+            log.warning("模板去重时忽略 --incr 选项, 全量构建")
+            manifest = None
+    # 监视模式: 常驻进程, 文件变化时只重新生成受影响的流程
+    if boot_option.watch:
+        boot = Boot(option.output)
+        boot.wft_cache = wft_cache
+        boot.size_guard = size_guard
+        boot.parse_cache = parse_cache
+        try:
+            Watcher(boot, step_files, boot_option.watch_interval).run()
+        finally:
+            if boot_option.cache_stats:
+                parse_cache.log_stats()
+        return
     try:
-        # 执行yaml配置的步骤
-        boot.run(step_files)
-    except Exception as ex:
-        log.error(f"Exception occurs: current step file is %s", boot.step_file, exc_info=ex)
-        raise ex
+        # 性能剖析/流程分析/模板去重/多文档输出/提交/比较只支持在当前进程中执行
+        if (boot_option.profile or boot_option.analyze or boot_option.dedup or bundle or submit or diff) and boot_option.jobs > 1:
+            log.warning("性能剖析/流程分析/模板去重/多文档输出/提交/比较时忽略 -j/--jobs 选项, 串行执行")
+            boot_option.jobs = 1
+        # 多进程并行执行
+        if boot_option.jobs > 1:
+            run_in_pool(step_files, option.output, boot_option.jobs, option.funs, manifest, wft_cache, size_guard, parse_cache)
+            return
+        # 基于yaml的执行器
+        boot = Boot(option.output)
+        boot.manifest = manifest
+        boot.wft_cache = wft_cache
+        boot.size_guard = size_guard
+        boot.parse_cache = parse_cache
+        if boot_option.dedup:
+            boot.deduper = TemplateDeduper(boot_option.dedup_name)
+        # 性能剖析
+        profiler = None
+        if boot_option.profile:
+            profiler = Profiler()
+            profiler.install(boot)
+        # 流程分析
+        if boot_option.analyze:
+            boot.analyzer = FlowAnalyzer()
+        # 多文档输出
+        if bundle:
+            boot.bundle = BundleWriter(bundle)
+        # 与快照比较
+        if diff:
+            boot.differ = ManifestDiffer(boot_option.diff_against, boot_option.diff_out)
+        # 提交到argo服务器
+        if submit:
+            boot.submitter = ArgoSubmitter(boot_option.argo_server, boot_option.token, boot_option.submit_ns, boot_option.submit_jobs, boot_option.submit_retries, insecure=boot_option.insecure or None)
+        try:
+            # 执行yaml配置的步骤
+            boot.run(step_files)
+            if boot.bundle is not None:
+                boot.bundle.close()
+                log.info(f"共输出%s个文档到%s", boot.bundle.count, '标准输出' if bundle == '-' else bundle)
+        except Exception as ex:
+            if boot.bundle is not None: # 出错了则不替换输出文件
+                boot.bundle.abort()
+            log.error(f"Exception occurs: current step file is %s", boot.step_file, exc_info=ex)
+            raise ex
+        finally:
+            # 保存性能剖析报告: 出错了也保存, 以便定位
+            if profiler is not None:
+                profiler.save(boot_option.profile_out)
+            if boot.analyzer is not None:
+                boot.analyzer.save(boot_option.analyze_out)
+    finally:
+        # 保存增量构建的清单: 只记录了成功构建的步骤文件
+        if manifest is not None:
+            manifest.save()
+        if boot_option.cache_stats:
+            parse_cache.log_stats()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,133 @@
+import re
+
+'''
+dag依赖关系表达式的解析
+    每行格式如 echo(A) -> echo(B);echo(C) -> echo(D)
+    1 `->` 分割多个点, 后一个点依赖于前一个点
+    2 `;` 分割点中的多个节点(即任务调用), 表示并行
+    3 括号与引号内的 `->` `;` 不作为分隔符, 如 echo('a;b')
+另外也解析argo的 depends 表达式, 如 A && (B.Succeeded || C.Failed), 用于分析生成的流程
+'''
+
+def parse_deps(lines):
+    '''
+    解析多行依赖关系表达式, 线性复杂度
+    :param lines: 多行依赖关系表达式
+    :return: (节点列表, 依赖关系), 其中节点按首次出现的顺序排列, 依赖关系是dict{节点: 依赖节点列表(去重且保持首次出现的顺序)}
+    '''
+    nodes = {} # 用dict来去重且保序, key是节点, value是依赖节点(也用dict来去重且保序)
+    for line in lines:
+        groups = split_line(line)
+        prev = None # 前一个点
+        for group in groups:
+            for node in group:
+                deps = nodes.setdefault(node, {})
+                if prev:
+                    for dep in prev:
+                        deps[dep] = True
+            prev = group
+    return list(nodes), {node: list(deps) for node, deps in nodes.items()}
+
+def split_line(line):
+    '''
+    分割单行依赖关系表达式
+    :param line: 如 echo(A) -> echo(B);echo(C) -> echo(D)
+    :return: 点的列表, 每个点是节点的列表, 如 [['echo(A)'], ['echo(B)', 'echo(C)'], ['echo(D)']]
+    '''
+    # 去掉分隔符两边的空格
+    line = re.sub(r'\s*(->|;|,)\s*', lambda m: m.group(1), line.strip())
+    groups = []
+    group = []
+    depth = 0 # 括号深度
+    quote = None # 当前所在的引号
+    start = 0 # 当前节点的开始位置
+    i = 0
+    n = len(line)
+    while i < n:
+        c = line[i]
+        if quote is not None: # 引号内
+            if c == quote:
+                quote = None
+        elif c == '"' or c == "'":
+            quote = c
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0:
+            if c == ';': # 节点结束
+                add_node(group, line[start:i])
+                start = i + 1
+            elif c == '-' and line.startswith('->', i): # 点结束
+                add_node(group, line[start:i])
+                groups.append(group)
+                group = []
+                i += 2
+                start = i
+                continue
+        i += 1
+    if quote is not None or depth != 0:
+        raise Exception(f"dag依赖关系表达式的括号或引号不匹配: {line}")
+    add_node(group, line[start:])
+    groups.append(group)
+    # 去掉空的点, 如 a ->  -> b
+    return [g for g in groups if g]
+
+def add_node(group, node):
+    if node and node not in group:
+        group.append(node)
+
+def parse_depends(expr):
+    '''
+    解析argo的 depends 表达式, 找出依赖的任务
+    :param expr: 如 A && (B.Succeeded || !C.Failed)
+    :return: 依赖的任务名列表(去重且保持首次出现的顺序), 如 ['A', 'B', 'C']
+    '''
+    names = {}
+    for token in re.split(r'[&|!()\s]+', expr or ''):
+        if token:
+            names[token.split('.', 1)[0]] = True # 去掉任务结果, 如 .Succeeded
+    return list(names)
+
+def check_cycle(deps, label=str):
+    '''
+    检查依赖关系中是否有环(Kahn拓扑排序), 有则抛异常
+    :param deps: dict{节点: 依赖节点列表}
+    :param label: 节点在报错信息中的显示
+    :return: 拓扑排序的节点列表, 依赖节点在前
+    '''
+    # 入度 = 依赖节点数
+    degrees = {node: len(ds) for node, ds in deps.items()}
+    # 反向索引: 节点 -> 依赖于它的节点
+    dependents = {node: [] for node in deps}
+    for node, ds in deps.items():
+        for dep in ds:
+            dependents.setdefault(dep, []).append(node)
+            degrees.setdefault(dep, 0)
+    order = [node for node, d in degrees.items() if d == 0]
+    for node in order: # 遍历时追加入度变为0的节点, 即广度优先
+        for child in dependents.get(node, []):
+            degrees[child] -= 1
+            if degrees[child] == 0:
+                order.append(child)
+    if len(order) == len(degrees):
+        return order
+    # 有环: 从剩下的节点中找出一个环, 用于报错
+    remain = {node for node, d in degrees.items() if d > 0}
+    raise Exception(f"dag依赖关系存在环: {' -> '.join(map(label, find_cycle(deps, remain)))}")
+
+def find_cycle(deps, remain):
+    '''
+    在剩下的节点中找出一个环: 剩下的节点都有剩下的依赖节点, 沿着依赖一直走必然会回到走过的节点
+    :return: 环上的节点, 首尾相同, 按依赖方向的反方向排列(即 a -> b 表示b依赖a)
+    '''
+    node = next(iter(remain))
+    path = []
+    pos = {}
+    while node not in pos:
+        pos[node] = len(path)
+        path.append(node)
+        node = next(dep for dep in deps.get(node, []) if dep in remain)
+    cycle = path[pos[node]:] + [node]
+    cycle.reverse()
+    return cycle
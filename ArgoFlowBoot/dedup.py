@@ -0,0 +1,190 @@
+import json
+from pyutilb.util import md5
+from pyutilb.log import log
+from ArgoFlowBoot.size_guard import measure, format_size
+
+'''
+跨流程的模板去重: 同一次执行生成的多个流程(Workflow/CronWorkflow)中, 相同的模板会在每个流程中重复嵌入, 占用etcd与控制器内存
+    1 暂存所有流程, 执行结束时(on_end)统一处理再保存
+    2 对模板(去掉模板名)计算指纹, 出现在多个流程中的相同模板, 移到生成的共享流程模板(WorkflowTemplate)中
+    3 只处理叶子模板(即不调用其他模板的), 且不能是入口模板或退出处理模板
+    4 调用处改为 templateRef, 跟 build_step() 调用 wft.tpl(...) 时生成的一样
+    5 共享流程模板按命名空间生成, 模板名冲突时加上指纹后缀
+    6 打印去重率与节省的字节数
+'''
+
+# 去重的流程类型
+dedup_kinds = ('Workflow', 'CronWorkflow')
+
+# 模板名的最大长度
+max_name_len = 63
+
+class TemplateDeduper(object):
+
+    def __init__(self, name='argoflowboot-shared'):
+        '''
+        构造函数
+        :param name: 共享流程模板名
+        '''
+        self.name = name
+        self.flows = [] # 暂存的流程, 元素为 (流程, 文件)
+
+    def accept(self, flow):
+        '''
+        是否去重的流程
+        '''
+        return flow['kind'] in dedup_kinds
+
+    def add(self, flow, file):
+        '''
+        暂存流程
+        :param flow: 流程
+        :param file: 输出文件
+        '''
+        self.flows.append((flow, file))
+
+    def dedup(self):
+        '''
+        去重, 会直接修改暂存的流程, 并清空暂存
+        :return: 要保存的资源列表, 元素为 (资源, 文件), 先是共享流程模板, 后是流程
+        '''
+        flows = self.flows
+        self.flows = []
+        if not flows:
+            return []
+        before = sum(measure(flow) for flow, _ in flows)
+        # 1 统计: 指纹 -> 出现的流程
+        fp2flows = {}
+        total = 0 # 可去重的模板实例数
+        for i, (flow, _) in enumerate(flows):
+            for tpl in self.find_leaf_templates(get_spec(flow)):
+                fp = fingerprint(tpl)
+                fp2flows.setdefault(fp, set()).add(i)
+                total += 1
+        shared_fps = {fp for fp, idxes in fp2flows.items() if len(idxes) > 1}
+        if not shared_fps:
+            log.info(f"模板去重: %s个模板实例中没有跨流程重复的", total)
+            return flows
+
+        # 2 移到共享流程模板: 按命名空间分组
+        ns2wft = {} # 命名空间 -> (共享流程模板, {指纹: 共享模板名})
+        moved = 0
+        for flow, _ in flows:
+            ns = flow['metadata'].get('namespace') or ''
+            if ns not in ns2wft:
+                ns2wft[ns] = (build_shared_wft(self.name, ns), {})
+            wft, fp2name = ns2wft[ns]
+            spec = get_spec(flow)
+            name2ref = {} # 移走的模板名 -> 共享模板名
+            for tpl in self.find_leaf_templates(spec):
+                fp = fingerprint(tpl)
+                if fp not in shared_fps:
+                    continue
+                if fp not in fp2name:
+                    fp2name[fp] = alloc_name(tpl['name'], fp, fp2name.values())
+                    wft['spec']['templates'].append(dict(tpl, name=fp2name[fp]))
+                name2ref[tpl['name']] = fp2name[fp]
+            if not name2ref:
+                continue
+            moved += len(name2ref)
+            spec['templates'] = [tpl for tpl in spec['templates'] if tpl['name'] not in name2ref]
+            replace_calls(spec['templates'], name2ref, self.name)
+
+        # 3 报告
+        ret = []
+        for ns, (wft, _) in ns2wft.items():
+            if wft['spec']['templates']:
+                file = f"{self.name}-{ns}.yml" if ns else f"{self.name}.yml"
+                ret.append((wft, file))
+        ret += flows
+        after = sum(measure(data) for data, _ in ret)
+        shared = sum(len(wft['spec']['templates']) for wft, _ in ret[:len(ret) - len(flows)])
+        log.info(f"模板去重: %s个模板实例中有%s个跨流程重复, 合并为%s个共享模板, 去重率%.1f%%, 节省%s(%s -> %s)",
+                 total, moved, shared, (moved - shared) * 100 / total, format_size(before - after), format_size(before), format_size(after))
+        return ret
+
+    def find_leaf_templates(self, spec):
+        '''
+        找出可去重的叶子模板: 不调用其他模板, 且不是入口模板或退出处理模板
+        '''
+        excludes = {spec.get('entrypoint'), spec.get('onExit')}
+        for tpl in spec.get('templates', []):
+            for step in iterate_steps(tpl):
+                excludes.add(step.get('onExit'))
+        for tpl in spec.get('templates', []):
+            if 'steps' in tpl or 'dag' in tpl or tpl['name'] in excludes:
+                continue
+            yield tpl
+
+def get_spec(flow):
+    if flow['kind'] == 'CronWorkflow':
+        return flow['spec']['workflowSpec']
+    return flow['spec']
+
+def fingerprint(tpl):
+    '''
+    模板的指纹: 去掉模板名
+    '''
+    data = {k: v for k, v in tpl.items() if k != 'name'}
+    return md5(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str))
+
+def alloc_name(name, fp, used):
+    '''
+    分配共享模板名: 冲突则加上指纹后缀
+    '''
+    used = set(used)
+    if name not in used:
+        return name
+    suffix = '-' + fp[:8]
+    return name[:max_name_len - len(suffix)] + suffix
+
+def iterate_steps(tpl):
+    '''
+    遍历模板的步骤/任务
+    '''
+    if 'steps' in tpl:
+        for group in tpl['steps']:
+            yield from (group if isinstance(group, list) else [group])
+    elif 'dag' in tpl:
+        yield from tpl['dag'].get('tasks', [])
+
+def replace_calls(templates, name2ref, wft):
+    '''
+    将调用处改为 templateRef, 保持字段顺序
+    :param templates: 流程的模板
+    :param name2ref: 移走的模板名 -> 共享模板名
+    :param wft: 共享流程模板名
+    '''
+    for tpl in templates:
+        for step in iterate_steps(tpl):
+            name = step.get('template')
+            if name not in name2ref:
+                continue
+            items = list(step.items())
+            step.clear()
+            for k, v in items:
+                if k == 'template':
+                    step['templateRef'] = {
+                        'name': wft,
+                        'template': name2ref[name],
+                    }
+                else:
+                    step[k] = v
+
+def build_shared_wft(name, ns):
+    meta = {
+        'name': name,
+        'labels': {
+            'flow': name
+        }
+    }
+    if ns:
+        meta['namespace'] = ns
+    return {
+        'apiVersion': 'argoproj.io/v1alpha1',
+        'kind': 'WorkflowTemplate',
+        'metadata': meta,
+        'spec': {
+            'templates': []
+        }
+    }
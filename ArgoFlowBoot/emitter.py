@@ -0,0 +1,210 @@
+import filecmp
+import logging
+import os
+import sys
+import tempfile
+import yaml
+import pyutilb.log
+from pyutilb.file import read_byte_file
+
+'''
+yaml输出
+    1 优先用 libyaml 的C实现(CDumper)来转yaml, 比纯python实现快数倍;
+      但二者对部分字符串的输出格式不一致(如双引号字符串的折行、空字符串的key), 为保证生成的文件跟纯python实现逐字节一致, 遇到这类字符串则退回纯python实现
+    2 写文件时, 内容没变则不写, 否则先写临时文件再改名, 保证文件不会写一半
+    3 大文件可流式写(StreamFileWriter), 同样是内容没变则不替换
+    4 多文档输出(BundleWriter): 所有文档输出到标准输出或单个文件, 用于 kubectl apply -f - 与GitOps
+'''
+
+# 没安装libyaml时, 退回纯python实现
+CDumper = getattr(yaml, 'CDumper', None)
+
+# 当前umask, 用于让临时文件的权限跟直接open()创建的文件一致
+_umask = os.umask(0)
+os.umask(_umask)
+
+def dump_yaml(data, sort_keys=True):
+    '''
+    转yaml
+    :param data: 资源数据
+    :param sort_keys: 是否对key排序
+    :return: yaml文本
+    '''
+    dumper = yaml.Dumper
+    if CDumper is not None and not has_diff_str(data):
+        dumper = CDumper
+    return yaml.dump(data, Dumper=dumper, sort_keys=sort_keys)
+
+def has_diff_str(data, is_key=False):
+    '''
+    检查是否有C实现跟纯python实现输出格式不一致的字符串:
+    1 包含非ascii或不可打印字符(如换行)的字符串, 会输出为双引号字符串, 其折行不一致
+    2 空字符串的key
+    '''
+    if isinstance(data, str):
+        return not (data.isascii() and data.isprintable()) or (is_key and data == '')
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if has_diff_str(k, True) or has_diff_str(v):
+                return True
+        return False
+    if isinstance(data, (list, tuple)):
+        for v in data:
+            if has_diff_str(v):
+                return True
+    return False
+
+def write_file_if_changed(path, content):
+    '''
+    写文件: 内容没变则不写, 否则原子性的写(先写临时文件再改名)
+    :param path: 文件路径
+    :param content: 文件内容
+    :return: 是否写了文件
+    '''
+    data = content.encode('utf-8')
+    # 内容没变则不写
+    if os.path.isfile(path) and os.path.getsize(path) == len(data) and read_byte_file(path) == data:
+        return False
+    # 先写同目录下的临时文件, 再改名
+    dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=dir, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o666 & ~_umask)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+class StreamFileWriter(object):
+    '''
+    流式写文件: 先写同目录下的临时文件, 关闭时内容变了才改名替换, 用于内容太大而不宜整个放在内存中的文件
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        dir = os.path.dirname(os.path.abspath(path))
+        fd, self.tmp = tempfile.mkstemp(dir=dir, prefix='.' + os.path.basename(path), suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.size = 0 # 已写的字节数
+
+    def write(self, txt):
+        data = txt.encode('utf-8')
+        self.size += len(data)
+        self.file.write(data)
+
+    def close(self):
+        '''
+        关闭, 内容变了才替换
+        :return: 是否写了文件
+        '''
+        self.file.close()
+        try:
+            if os.path.isfile(self.path) and os.path.getsize(self.path) == self.size and filecmp.cmp(self.path, self.tmp, shallow=False):
+                os.remove(self.tmp)
+                return False
+            os.chmod(self.tmp, 0o666 & ~_umask)
+            os.replace(self.tmp, self.path)
+        except BaseException:
+            self.abort()
+            raise
+        return True
+
+    def abort(self):
+        '''
+        放弃写: 删掉临时文件
+        '''
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+def redirect_log_to_stderr():
+    '''
+    日志改为输出到标准错误, 因为标准输出用于输出文档
+        pyutilb的日志配置是延迟加载的, 且每个日志对象都会加载一次, 因此也要包装加载函数
+    '''
+    load_log_conf = pyutilb.log.load_log_conf
+
+    def redirect():
+        for logger in [logging.getLogger()] + [l for l in logging.Logger.manager.loggerDict.values() if isinstance(l, logging.Logger)]:
+            for handler in logger.handlers:
+                if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+                    handler.setStream(sys.stderr)
+
+    def wrapper():
+        load_log_conf()
+        redirect()
+
+    pyutilb.log.load_log_conf = wrapper
+    redirect()
+
+class BundleWriter(object):
+    '''
+    多文档输出: 每个文档生成完就马上输出到标准输出或单个文件, 文档间以---分隔, 内存中最多只有一个文档
+    '''
+
+    def __init__(self, path):
+        '''
+        构造函数
+        :param path: 输出文件, -表示标准输出
+        '''
+        self.path = path
+        self.writer = None if path == '-' else StreamFileWriter(path)
+        self.count = 0 # 已输出的文档数
+
+    def write(self, txt):
+        if self.writer is None:
+            sys.stdout.write(txt)
+        else:
+            self.writer.write(txt)
+
+    def begin_doc(self, name):
+        '''
+        开始输出文档
+        :param name: 文档名(即单独输出时的文件名), 作为注释
+        '''
+        self.write(f"---\n# {name}\n")
+        self.count += 1
+
+    def write_doc(self, txt, name):
+        '''
+        输出文档
+        :param txt: 文档内容
+        :param name: 文档名(即单独输出时的文件名), 作为注释
+        '''
+        self.begin_doc(name)
+        self.write(txt if txt.endswith("\n") else txt + "\n")
+        self.flush()
+
+    def write_doc_file(self, file, name):
+        '''
+        流式输出文件中的文档, 用于大文档
+        :param file: 文件
+        :param name: 文档名
+        '''
+        self.begin_doc(name)
+        with open(file, encoding='utf-8') as f:
+            for line in f:
+                self.write(line)
+        self.flush()
+
+    def flush(self):
+        if self.writer is None:
+            sys.stdout.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        else:
+            sys.stdout.flush()
+
+    def abort(self):
+        '''
+        放弃输出: 单个文件则不替换
+        '''
+        if self.writer is not None:
+            self.writer.abort()
@@ -0,0 +1,172 @@
+import re
+from collections import OrderedDict
+from functools import wraps
+from pyutilb import util
+from pyutilb.util import reg_exprs, replace_pure_var_expr
+
+'''
+编译的变量替换与函数调用解析: 构建模板时会对整个选项树递归替换变量, 并反复解析同样的函数调用(如模板调用`tpl(a, b)`),
+跟 pyutilb.util 的 replace_var()/parse_func() 结果一致, 但:
+    1 变量表达式(`$var`/`${...}`)只编译一次: 记下是否整体匹配及其匹配结果, 局部匹配的则用预编译的正则来替换, 且跳过不可能匹配的正则
+    2 函数调用表达式只解析一次
+    3 编译结果缓存在有上限的LRU中, 满了则淘汰最久未用的
+    4 递归替换时跳过不含变量的叶子: 不含$的字符串与数字等直接复制, 不再逐个调用替换函数;
+      dict/list仍跟原来一样拷贝, 因为调用方会修改返回值, 且同一对象多次输出时yaml会生成锚点与别名
+'''
+
+# 缓存的容量(个数)
+cache_size = 4096
+
+class LruCache(OrderedDict):
+    '''
+    有上限的缓存, 满了则淘汰最久未用的
+    '''
+
+    def __init__(self, size):
+        super().__init__()
+        self.size = size
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self.size:
+            self.popitem(last=False)
+
+# 整体匹配的正则
+regs_whole = [re.compile(rf'{reg}$') for reg in reg_exprs]
+# 局部匹配的正则, (?<!\\)\$ 表示 $ 前面不能是 \, 也就是 \$ 是不替换参数的
+regs_part = [re.compile(rf'(?<!\\){reg}') for reg in reg_exprs]
+# 转义的 \$
+reg_escaped = re.compile(r'\\\$')
+
+# 局部匹配的编译结果
+partial = object()
+
+# 编译的变量表达式: 整体匹配的为匹配结果, 局部匹配的为 partial
+compiled_vars = LruCache(cache_size)
+
+# 解析的函数调用: (函数名, 参数)
+parsed_funcs = LruCache(cache_size)
+
+def compile_var_expr(txt):
+    '''
+    编译变量表达式
+    :param txt: 含$的字符串
+    :return: 整体匹配的为匹配结果, 局部匹配的为 partial
+    '''
+    ret = compiled_vars.get(txt)
+    if ret is None:
+        ret = partial
+        for reg in regs_whole:
+            mat = reg.match(txt)
+            if mat:
+                ret = mat
+                break
+        compiled_vars.put(txt, ret)
+    return ret
+
+def replace_str_var(txt, to_str=True):
+    '''
+    替换字符串中的变量, 同 pyutilb.util.do_replace_var()
+    '''
+    if txt is None:
+        return '' if to_str else None
+    if not isinstance(txt, str):
+        raise Exception("Variable expression is not a string")
+    if '$' not in txt: # 无需替换
+        return txt
+    # 1 整体匹配: 整个是纯变量表达式
+    mat = compile_var_expr(txt)
+    if mat is not partial:
+        return replace_pure_var_expr(mat, to_str)
+    # 2 局部匹配: 由 普通字符串 + 变量表达式 组成, 依次用各正则替换
+    for i, reg in enumerate(regs_part):
+        if '$' not in txt: # 都替换完了
+            break
+        if i > 0 and '${' not in txt: # 后面的正则都要求 ${
+            break
+        txt = reg.sub(replace_pure_var_expr, txt)
+    if '\\$' in txt:
+        txt = reg_escaped.sub('$', txt)  # 将 \$ 反转义为 $
+    return txt
+
+# 无需替换的基础类型
+scalar_types = (int, float, complex, bool)
+
+def replace_tree_var(data, to_str):
+    '''
+    递归替换变量, 同 pyutilb.util.replace_var(): 对dict/list拷贝, 对字符串替换
+        常见的 dict/list/str 用精确类型判断, 不含$的字符串与数字不调用替换函数
+    '''
+    t = type(data)
+    if t is str:
+        return replace_str_var(data, to_str) if '$' in data else data
+    if t is dict:
+        ret = {}
+        for k, v in data.items():
+            tv = type(v)
+            if tv is str and '$' not in v or tv in scalar_types:
+                ret[k] = v
+            else:
+                ret[k] = replace_tree_var(v, to_str)
+        return ret
+    if t is list:
+        ret = []
+        for v in data:
+            tv = type(v)
+            if tv is str and '$' not in v or tv in scalar_types:
+                ret.append(v)
+            else:
+                ret.append(replace_tree_var(v, to_str))
+        return ret
+    # 少见的类型
+    if isinstance(data, scalar_types):
+        return data
+    if isinstance(data, (list, tuple, set, range)):
+        return [replace_tree_var(v, to_str) for v in data]
+    if isinstance(data, dict):
+        data = data.copy()
+        for k, v in data.items():
+            data[k] = replace_tree_var(v, to_str)
+        return data
+    return replace_str_var(data, to_str) # None或其他类型(报错)
+
+def replace_var(txt, to_str=True):
+    '''
+    替换变量: 将 $变量名 或 ${变量表达式} 替换为 变量值, 同 pyutilb.util.replace_var()
+    :param txt: 兼容基础类型+字符串+列表+字典等类型, 如果是字符串, 则是带变量的表达式
+    :param to_str: 是否转为字符串, 否则原样返回, 可能是int/dict之类的; 只针对整体匹配的情况
+    '''
+    return replace_tree_var(txt, to_str)
+
+def replace_var_on_params(func):
+    '''
+    对动作参数替换变量的装饰器, 同 pyutilb.util.replace_var_on_params()
+    '''
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        args = [replace_var(arg, False) for arg in args]
+        return func(self, *args, **kwargs)
+    return wrapper
+
+def parse_func(expr, allow_no_bracket=False):
+    '''
+    解析函数调用, 同 pyutilb.util.parse_func(), 但有缓存
+    :param expr: 函数+参数, str类型: 函数表达式, 如 xxx(1,a); list类型: 第一个是函数名, 其他为参数
+    :param allow_no_bracket: 是否允许无括号, 如xxx
+    :return: (函数名, 参数列表), 参数列表是新的拷贝, 可修改
+    '''
+    if not isinstance(expr, str):
+        return util.parse_func(expr, allow_no_bracket)
+    key = (expr, allow_no_bracket)
+    ret = parsed_funcs.get(key)
+    if ret is None:
+        ret = util.parse_func(expr, allow_no_bracket)
+        parsed_funcs.put(key, ret)
+    return ret[0], list(ret[1])
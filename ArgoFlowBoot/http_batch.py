@@ -0,0 +1,328 @@
+import json
+import re
+
+'''
+批量http请求: 每个http模板都是流程中的一个节点, 如对300个接口做健康检查就会有300个节点, 拖慢控制器;
+http_batch 模板则生成一个python脚本模板, 在一个节点中并发执行所有请求
+    1 请求跟http模板一样, 可以是curl命令, 或http模板选项(url/method/headers/body/timeoutSeconds/successCondition/insecureSkipVerify)
+    2 脚本只依赖python标准库: 用asyncio控制并发数, 请求由 http.client 在线程池中发送, 按主机复用长连接(连接池)
+    3 每个请求有自己的超时与成功条件(successCondition), 条件的语法跟http模板一样(expr语法), 生成时转为python表达式
+    4 每个请求的结果(状态码/是否成功/耗时/出错信息/响应体开头部分)写到json文件, 作为输出工件 results; 有请求失败则节点失败
+'''
+
+# 默认超时(秒)
+default_timeout = 20
+
+# 默认成功条件
+default_success_condition = "response.statusCode == 200"
+
+# 默认并发数
+default_concurrency = 20
+
+# 默认镜像
+default_image = 'python:3-alpine'
+
+# 结果文件
+results_path = '/tmp/artifacts/results.json'
+
+# 结果中保留的响应体的字符数
+body_limit = 1024
+
+# 请求的选项
+request_fields = ('name', 'curl', 'url', 'method', 'headers', 'body', 'timeoutSeconds', 'successCondition', 'insecureSkipVerify')
+
+def parse_curl_request(curl):
+    '''
+    解析curl命令为http模板选项, http 与 http_batch 模板共用
+    :param curl: curl命令
+    :return: dict{url, method, body, headers}
+    '''
+    from pyutilb.curl import parse_curl # 延迟导入: 只有curl命令才需要
+    curl = re.sub(r'^curl +', '', curl)
+    req = parse_curl(curl, True)
+    # 拼接请求头
+    headers = []
+    if req.header:
+        headers = [{'name': k, 'value': v} for k, v in req.header.items()]
+    # 补全请求方法
+    method = req.request
+    if method is None:
+        if req.data:
+            method = 'POST'
+        else:
+            method = 'GET'
+    return {
+        "url": req.url,
+        "method": method,
+        "body": req.data,
+        "headers": headers,
+    }
+
+# successCondition 中的关键字: expr语法 -> python语法
+cond_keywords = {
+    '&&': 'and',
+    '||': 'or',
+    '!': 'not',
+    'and': 'and',
+    'or': 'or',
+    'not': 'not',
+    'in': 'in',
+    'true': 'True',
+    'false': 'False',
+    'nil': 'None',
+    # 中缀函数, 脚本中用 a |_contains| b 实现
+    'contains': '|_contains|',
+    'startsWith': '|_startsWith|',
+    'endsWith': '|_endsWith|',
+    'matches': '|_matches|',
+}
+
+# successCondition 的词法单元: 字符串/数字/运算符/标识符
+reg_cond_token = re.compile(r'''\s*(?:("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(\d+(?:\.\d+)?)|(&&|\|\||==|!=|<=|>=|[<>!()\[\],.])|([A-Za-z_]\w*))''')
+
+def to_py_condition(cond):
+    '''
+    将成功条件(expr语法)转为python表达式
+        支持: response.statusCode/body/headers, 字符串/数字/列表, == != < <= > >=, && || !, and or not in, contains startsWith endsWith matches
+    :param cond: 成功条件, 如 response.statusCode == 200 && response.body contains "ok"
+    :return: python表达式
+    '''
+    cond = cond.strip()
+    ret = ''
+    pos = 0
+    prev = None
+    word_prev = False # 上一个是否标识符(非关键字)
+    while pos < len(cond):
+        mat = reg_cond_token.match(cond, pos)
+        if mat is None:
+            raise Exception(f"http_batch的成功条件[{cond}]中有不支持的语法: {cond[pos:]}")
+        pos = mat.end()
+        txt, num, op, word = mat.groups()
+        if txt or num:
+            token = txt or num
+        elif op:
+            token = cond_keywords.get(op, op)
+        elif prev == '.': # 属性名
+            token = word
+        elif word in cond_keywords:
+            token = cond_keywords[word]
+        elif word == 'response':
+            token = word
+        else:
+            raise Exception(f"http_batch的成功条件[{cond}]中有不支持的标识符: {word}, 仅支持 response 与 {'/'.join(cond_keywords)}")
+        # 拼接: . ( [ 后面与 . ) ] , 前面不加空格, 下标的 [ 前面也不加空格
+        index = token == '[' and (prev in (')', ']') or word_prev)
+        if ret and prev not in ('.', '(', '[') and token not in ('.', ')', ']', ',') and not index:
+            ret += ' '
+        ret += token
+        prev = op or word
+        word_prev = word is not None and word not in cond_keywords
+    return ret
+
+def to_seconds(val):
+    '''
+    转为秒数, 超时要在生成时确定
+    '''
+    try:
+        val = float(val)
+    except (TypeError, ValueError):
+        raise Exception(f"http_batch的超时必须是秒数: {val}")
+    return int(val) if val.is_integer() else val
+
+def build_batch_request(option, defaults):
+    '''
+    构建单个请求
+    :param option: curl命令, 或http模板选项(也可用curl指定curl命令, 其他选项覆盖curl的)
+    :param defaults: 公共选项: timeoutSeconds/successCondition/insecureSkipVerify
+    :return: 脚本中的请求
+    '''
+    if isinstance(option, str):
+        option = {'curl': option}
+    if not isinstance(option, dict):
+        raise Exception(f"http_batch的请求只接收curl命令, 或dict: {option}")
+    unknown = [k for k in option if k not in request_fields]
+    if unknown:
+        raise Exception(f"http_batch的请求不支持选项: {', '.join(unknown)}, 仅支持 {'/'.join(request_fields)}")
+    req = {}
+    insecure = None
+    if 'curl' in option:
+        curl = option['curl']
+        req = parse_curl_request(curl)
+        if re.search(r'(^|\s)(-k|--insecure)(\s|$)', curl):
+            insecure = True
+    req.update({k: v for k, v in option.items() if k != 'curl'})
+    if not req.get('url'):
+        raise Exception(f"http_batch的请求未指定url: {option}")
+    # 请求头: list[{name, value}] 或 dict
+    headers = req.get('headers') or {}
+    if isinstance(headers, list):
+        headers = {h['name']: h['value'] for h in headers}
+    # 请求体: 非字符串则转json
+    body = req.get('body')
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+        headers.setdefault('Content-Type', 'application/json')
+    method = req.get('method') or ('POST' if body else 'GET')
+    cond = req.get('successCondition') or defaults.get('successCondition') or default_success_condition
+    if insecure is None:
+        insecure = req.get('insecureSkipVerify', defaults.get('insecureSkipVerify', False))
+    return {
+        'name': req.get('name') or f"{method} {req['url']}",
+        'method': method.upper(),
+        'url': req['url'],
+        'headers': {str(k): str(v) for k, v in headers.items()},
+        'body': body,
+        'timeout': to_seconds(req.get('timeoutSeconds') or defaults.get('timeoutSeconds') or default_timeout),
+        'condition': to_py_condition(cond),
+        'insecure': bool(insecure),
+    }
+
+def build_batch_source(requests, concurrency=default_concurrency):
+    '''
+    构建批量请求的python脚本
+    :param requests: 请求的list, 元素是 build_batch_request() 的结果
+    :param concurrency: 并发数
+    :return: 脚本源码
+    '''
+    if concurrency < 1:
+        raise Exception(f"http_batch的并发数必须大于0: {concurrency}")
+    return f'''import json
+requests = json.loads({json.dumps(requests, ensure_ascii=False)!r})
+concurrency = {int(concurrency)}
+results_path = {results_path!r}
+body_limit = {body_limit}
+''' + runner_source
+
+# 批量请求的执行脚本, 只依赖python标准库, 要求python3.7+; 脚本会输出到流程中, 因此不写中文注释
+#   Infix: 中缀函数 a |f| b, 用于实现成功条件中的 contains/startsWith/endsWith/matches
+#   ConnectionPool: 按 (协议, 主机, 端口, 是否不校验证书) 复用长连接; 复用的长连接可能已被服务端关闭, 则换个连接重试
+#   run_one(): 用信号量控制并发数, 用 wait_for() 控制单个请求的超时, 出错或不满足成功条件则该请求失败
+runner_source = r'''
+import asyncio
+import http.client
+import os
+import re
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+class Infix(object):
+    def __init__(self, fun, left=None):
+        self.fun = fun
+        self.left = left
+
+    def __ror__(self, left):
+        return Infix(self.fun, left)
+
+    def __or__(self, right):
+        return self.fun(self.left, right)
+
+env = {
+    '__builtins__': {},
+    '_contains': Infix(lambda a, b: b in a),
+    '_startsWith': Infix(lambda a, b: a.startswith(b)),
+    '_endsWith': Infix(lambda a, b: a.endswith(b)),
+    '_matches': Infix(lambda a, b: re.search(b, a) is not None),
+}
+
+class Response(object):
+    def __init__(self, res, body):
+        self.statusCode = res.status
+        self.headers = dict(res.getheaders())
+        self.body = body.decode('utf-8', 'replace')
+
+class ConnectionPool(object):
+    def __init__(self):
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, timeout):
+        with self.lock:
+            conns = self.idle.get(key)
+            conn = conns.pop() if conns else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port, insecure = key
+        if scheme == 'https':
+            ctx = ssl._create_unverified_context() if insecure else ssl.create_default_context()
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=ctx), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def put(self, key, conn):
+        with self.lock:
+            self.idle.setdefault(key, []).append(conn)
+
+    def close(self):
+        for conns in self.idle.values():
+            for conn in conns:
+                conn.close()
+
+pool = ConnectionPool()
+
+def send(req):
+    url = urlsplit(req['url'])
+    key = (url.scheme, url.hostname, url.port, req['insecure'])
+    path = (url.path or '/') + ('?' + url.query if url.query else '')
+    body = req['body'].encode('utf-8') if req['body'] is not None else None
+    while True:
+        conn, reused = pool.get(key, req['timeout'])
+        try:
+            conn.request(req['method'], path, body, req['headers'])
+            res = conn.getresponse()
+            data = res.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if reused:
+                continue
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        if res.will_close:
+            conn.close()
+        else:
+            pool.put(key, conn)
+        return Response(res, data)
+
+async def run_one(i, req, sem, executor):
+    result = {'index': i, 'name': req['name'], 'method': req['method'], 'url': req['url']}
+    async with sem:
+        start = time.monotonic()
+        try:
+            future = asyncio.get_event_loop().run_in_executor(executor, send, req)
+            res = await asyncio.wait_for(future, req['timeout'])
+            result['statusCode'] = res.statusCode
+            result['ok'] = bool(eval(req['condition'], env, {'response': res}))
+            result['body'] = res.body[:body_limit]
+        except asyncio.TimeoutError:
+            result['ok'] = False
+            result['error'] = 'timeout after %ss' % req['timeout']
+        except Exception as ex:
+            result['ok'] = False
+            result['error'] = '%s: %s' % (type(ex).__name__, ex)
+        result['elapsed'] = round(time.monotonic() - start, 3)
+    return result
+
+async def run_all():
+    sem = asyncio.Semaphore(concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return await asyncio.gather(*[run_one(i, req, sem, executor) for i, req in enumerate(requests)])
+
+start = time.monotonic()
+results = asyncio.run(run_all())
+pool.close()
+os.makedirs(os.path.dirname(results_path), exist_ok=True)
+with open(results_path, 'w') as f:
+    json.dump(results, f, indent=1, ensure_ascii=False)
+failed = [r for r in results if not r['ok']]
+for r in failed:
+    print('FAIL %s: %s' % (r['name'], r.get('error') or 'statusCode=%s' % r.get('statusCode')), file=sys.stderr)
+print(json.dumps({'total': len(results), 'ok': len(results) - len(failed), 'failed': len(failed), 'elapsed': round(time.monotonic() - start, 3)}))
+sys.exit(1 if failed else 0)
+'''
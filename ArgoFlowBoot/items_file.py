@@ -0,0 +1,176 @@
+import csv
+import json
+import os
+from ArgoFlowBoot.emitter import dump_yaml, StreamFileWriter
+from ArgoFlowBoot.size_guard import configmap_limit, format_size
+
+'''
+从数据文件加载步骤的循环元素: 大的withItems不内嵌到流程中, 而是放到生成的ConfigMap中, 步骤改用withParam引用
+    1 支持json(元素的数组)/jsonl(每行一个元素)/csv(每行一个元素, 元素是以表头为key的dict)
+    2 流式读写: 边读数据文件边写ConfigMap文件, 大文件也不会整个加载到内存中
+    3 ConfigMap的值是json数组, 每行一个元素, 以yaml的块字符串输出
+'''
+
+# 读json的块大小
+chunk_size = 64 * 1024
+
+# 文件扩展名对格式
+ext2format = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+}
+
+def iterate_items(file, format=None):
+    '''
+    流式遍历数据文件中的元素
+    :param file: 数据文件
+    :param format: 格式: json/jsonl/csv, 默认根据扩展名识别
+    '''
+    if format is None:
+        format = ext2format.get(os.path.splitext(file)[1].lower())
+        if format is None:
+            raise Exception(f"无法根据扩展名识别数据文件[{file}]的格式, 请用 items_format 指定: json/jsonl/csv")
+    if format == 'json':
+        return iterate_json_array(file)
+    if format == 'jsonl':
+        return iterate_json_lines(file)
+    if format == 'csv':
+        return iterate_csv(file)
+    raise Exception(f"不支持数据文件格式: {format}, 仅支持 json/jsonl/csv")
+
+def iterate_json_lines(file):
+    with open(file, encoding='utf-8') as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as ex:
+                    raise Exception(f"数据文件[{file}]第{i + 1}行不是合法的json: {ex}")
+
+def iterate_csv(file):
+    with open(file, encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+def iterate_json_array(file):
+    '''
+    流式解析json数组: 分块读取, 逐个解码元素
+    '''
+    decoder = json.JSONDecoder()
+    with open(file, encoding='utf-8') as f:
+        buf = ''
+        pos = 0
+        eof = False
+        started = False # 是否读到了 [
+
+        def fill():
+            # 丢掉已解析的部分, 再读一块
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+
+        while True:
+            # 跳过空白与逗号
+            while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+                pos += 1
+            if pos >= len(buf):
+                if eof:
+                    raise Exception(f"数据文件[{file}]不是完整的json数组")
+                fill()
+                continue
+            if not started:
+                if buf[pos] != '[':
+                    raise Exception(f"数据文件[{file}]不是json数组")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError as ex:
+                if eof:
+                    raise Exception(f"数据文件[{file}]不是合法的json: {ex}")
+                fill()
+                continue
+            # 解码到块的末尾, 可能是被截断的数字(如 12 实际是 123), 要再读一块
+            if end >= len(buf) and not eof:
+                fill()
+                continue
+            pos = end
+            yield item
+
+class ItemsConfigMap(object):
+    '''
+    流程的循环元素的ConfigMap: 每个步骤一个key, 流式写文件
+    '''
+
+    def __init__(self, file, name, flow, ns=None):
+        '''
+        构造函数
+        :param file: ConfigMap文件
+        :param name: ConfigMap名
+        :param flow: 流程名
+        :param ns: 命名空间
+        '''
+        self.name = name
+        self.keys = set()
+        meta = {
+            'name': name,
+            'labels': {
+                'flow': flow
+            }
+        }
+        if ns:
+            meta['namespace'] = ns
+        self.writer = StreamFileWriter(file)
+        self.writer.write(dump_yaml({'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': meta}, sort_keys=False))
+        self.writer.write("data:\n")
+
+    def add(self, step, file, format=None):
+        '''
+        添加步骤的循环元素
+        :param step: 步骤名
+        :param file: 数据文件
+        :param format: 数据文件格式
+        :return: ConfigMap中的key
+        '''
+        key = step
+        i = 1
+        while key in self.keys:
+            i += 1
+            key = f"{step}-{i}"
+        self.keys.add(key)
+        try:
+            # 块字符串: 每行一个元素
+            self.writer.write(f"  {key}: |-\n    [\n")
+            sep = "    "
+            for item in iterate_items(file, format):
+                self.writer.write(sep + json.dumps(item))
+                sep = ",\n    "
+                self.check_size(file) # 边写边检查, 超过上限就不用读完整个数据文件了
+            self.writer.write("\n    ]\n")
+            self.check_size(file)
+        except BaseException:
+            # 出错则删掉临时文件, 以免执行中断时残留
+            self.abort()
+            raise
+        return key
+
+    def check_size(self, file):
+        '''
+        检查ConfigMap的大小
+        :param file: 正在写的数据文件
+        '''
+        if self.writer.size > configmap_limit:
+            raise Exception(f"ConfigMap[{self.name}]的大小超过上限{format_size(configmap_limit)}, 请拆分数据文件[{file}]")
+
+    def close(self):
+        return self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from pyutilb.file import read_byte_file, read_file, write_file
+from pyutilb.var_parser import VarParser
+
+'''
+增量构建的清单, 保存在输出目录下, 记录每个步骤文件上次构建时的输入与输出:
+    hash: 步骤文件的内容hash
+    deps: 依赖文件(include/include_templates/include_argo_wft/script与create等的file)的内容hash
+    vars: 读到的外部变量(命令行 -d/-D 传入)的值hash
+    refs: 引用的流程模板入参的hash
+    wfts: 定义的流程模板入参, 跳过构建时要恢复, 以便其他步骤文件引用
+    outputs: 生成的文件的内容hash
+    start/end: 开始与结束时的执行状态(见 Boot.get_run_state()), 跳过构建时要恢复结束状态, 以便之后的步骤文件继承
+如果步骤文件及以上输入都没变, 开始状态也一样, 且生成的文件都没被改过(如被其他步骤文件的同名流程覆盖), 则跳过该步骤文件
+'''
+class BuildManifest(object):
+
+    # 清单文件名
+    file_name = '.argoflowboot-manifest.json'
+
+    def __init__(self, output_dir, vars=None, version=''):
+        '''
+        构造函数
+        :param output_dir: 输出目录
+        :param vars: 外部变量, 即开始构建前通过命令行设置的变量
+        :param version: ArgoFlowBoot版本, 版本变了则清单失效
+        '''
+        self.file = os.path.join(os.path.abspath(output_dir or 'out'), self.file_name)
+        self.vars = vars or {}
+        self.version = version
+        self.entries = self.load()
+
+    def load(self):
+        if not os.path.exists(self.file):
+            return {}
+        try:
+            data = json.loads(read_file(self.file))
+        except ValueError: # 清单损坏则全量构建
+            return {}
+        if data.get('version') != self.version:
+            return {}
+        return data.get('entries', {})
+
+    def save(self):
+        dir = os.path.dirname(self.file)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        data = {
+            'version': self.version,
+            'entries': self.entries,
+        }
+        write_file(self.file, json.dumps(data, indent=1, sort_keys=True))
+
+    def check(self, step_file, wft2template_inputs, state=None):
+        '''
+        检查步骤文件是否需要重新构建
+        :param step_file: 步骤文件的绝对路径
+        :param wft2template_inputs: 当前已知的流程模板入参
+        :param state: 开始时的执行状态
+        :return: 无需重新构建则返回清单项, 否则返回None
+        '''
+        entry = self.entries.get(step_file)
+        if entry is None or entry.get('start') != state:
+            return None
+        # 1 步骤文件与依赖文件
+        if file_hash(step_file) != entry['hash']:
+            return None
+        for dep, hash in entry['deps'].items():
+            if file_hash(dep) != hash:
+                return None
+        # 2 外部变量
+        if self.build_vars_hash(entry['vars'].keys()) != entry['vars']:
+            return None
+        # 3 引用的流程模板入参: 只比较当前已知的, 从集群拉取的认为没变
+        for wft, hash in entry['refs'].items():
+            if wft in wft2template_inputs and data_hash(wft2template_inputs[wft]) != hash:
+                return None
+        # 4 生成的文件
+        for output, hash in entry['outputs'].items():
+            if file_hash(output) != hash:
+                return None
+        return entry
+
+    def record(self, step_file, deps, refs, wfts, outputs, start=None, end=None):
+        '''
+        记录步骤文件的构建
+        :param step_file: 步骤文件的绝对路径
+        :param deps: 依赖文件的绝对路径
+        :param refs: 引用的流程模板入参, key是流程模板名
+        :param wfts: 定义的流程模板入参, key是流程模板名
+        :param outputs: 生成的文件
+        :param start: 开始时的执行状态
+        :param end: 结束时的执行状态
+        '''
+        deps = sorted(set(deps))
+        # 读到的外部变量: 步骤文件与依赖文件中引用的变量
+        names = set()
+        for file in [step_file] + deps:
+            if os.path.isfile(file):
+                names |= VarParser().parse_vars(read_byte_file(file).decode('utf-8', 'ignore'))
+        self.entries[step_file] = {
+            'hash': file_hash(step_file),
+            'deps': {dep: file_hash(dep) for dep in deps},
+            'vars': self.build_vars_hash(names),
+            'refs': {wft: data_hash(inputs) for wft, inputs in refs.items()},
+            'wfts': wfts,
+            'outputs': {output: file_hash(output) for output in outputs},
+            'start': start,
+            'end': end,
+        }
+
+    # 外部变量值的hash, 没有值的变量记为None, 以便发现后续新传入的变量
+    def build_vars_hash(self, names):
+        return {name: data_hash(self.vars[name]) if name in self.vars else None for name in sorted(names)}
+
+# 文件内容的hash, 文件不存在则为None
+def file_hash(file):
+    if not os.path.isfile(file):
+        return None
+    return hashlib.sha1(read_byte_file(file)).hexdigest()
+
+# 数据的hash
+def data_hash(data):
+    txt = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(txt.encode('utf-8')).hexdigest()
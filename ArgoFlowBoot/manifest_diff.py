@@ -0,0 +1,288 @@
+import json
+import os
+import re
+import yaml
+from pyutilb.log import log
+from ArgoFlowBoot.emitter import write_file_if_changed
+from ArgoFlowBoot.parse_cache import safe_loader
+
+'''
+与上次应用的资源做语义比较: 只输出新增/修改的资源, 并输出变更清单(json), 以缩小 kubectl apply/GitOps 同步的范围
+    1 快照目录: 上次应用的资源文件(yaml/json, 可多文档, 也支持 kind: List), 一般是上次的输出目录的拷贝, 或 kubectl get -o yaml 的导出;
+      有 kubectl.kubernetes.io/last-applied-configuration 注解的, 则用注解中的资源来比较
+    2 资源的标识: (类型, 名字), 用 generateName 的以 generateName 为名字, 快照中由 generateName 生成的名字(加5位随机后缀)也能对上;
+      生成的资源没指定命名空间时, 可对上快照中任意命名空间的同名资源
+    3 语义比较, 忽略:
+      key的顺序; 有name的元素的list(如模板/参数/任务)中元素的顺序;
+      服务端填充的字段: status, metadata 的 uid/resourceVersion/creationTimestamp 等, 以及控制器加的标签与注解;
+      默认值: null, CronWorkflow的默认选项, 参数值的类型(服务端会转为字符串);
+      空的dict/list/字符串不忽略, 如 emptyDir: {} 与 suspend: {} 是有意义的;
+      命名空间也要比较, 以便发现命名空间的变更; 但生成的资源没指定命名空间时, 忽略快照中的命名空间
+    4 快照中有但本次没生成的资源, 记为删除(只记录在变更清单中, 不会删除)
+'''
+
+# 服务端填充的元数据字段
+server_meta_fields = ('uid', 'resourceVersion', 'generation', 'creationTimestamp', 'managedFields', 'selfLink', 'deletionGracePeriodSeconds')
+
+# 服务端加的标签与注解的前缀
+server_label_prefixes = ('workflows.argoproj.io/', 'kubectl.kubernetes.io/')
+
+# 上次应用的资源的注解
+last_applied_annotation = 'kubectl.kubernetes.io/last-applied-configuration'
+
+# 资源类型 -> {spec中的字段: 默认值}
+kind2defaults = {
+    'CronWorkflow': {
+        'concurrencyPolicy': 'Allow',
+        'startingDeadlineSeconds': 0,
+        'suspend': False,
+        'successfulJobsHistoryLimit': 3,
+        'failedJobsHistoryLimit': 1,
+    },
+}
+
+# 值为字符串的字段: 服务端会将数字/布尔转为字符串
+str_fields = ('value', 'default')
+
+# 快照文件的扩展名
+snapshot_exts = ('.yml', '.yaml', '.json')
+
+def normalize(data, field=None):
+    '''
+    规范化资源的值, 以便语义比较: 去掉null, 将有name的元素的list转为以 [name] 为key的dict
+    :param data: 值
+    :param field: 值所在的字段名
+    '''
+    if isinstance(data, dict):
+        ret = {}
+        for k, v in data.items():
+            v = normalize(v, k)
+            if v is not None:
+                ret[k] = v
+        return ret
+    if isinstance(data, list):
+        items = [normalize(v) for v in data]
+        names = [item.get('name') for item in items if isinstance(item, dict)]
+        if len(names) == len(items) and all(isinstance(name, str) for name in names) and len(set(names)) == len(names):
+            return {f"[{name}]": item for name, item in zip(names, items)}
+        return items
+    if field in str_fields and isinstance(data, (int, float, bool)):
+        return json.dumps(data) if isinstance(data, bool) else str(data)
+    return data
+
+def normalize_doc(doc):
+    '''
+    规范化资源, 以便语义比较
+    :param doc: 资源
+    :return: 规范化的资源
+    '''
+    meta = doc.get('metadata') or {}
+    meta = {k: v for k, v in meta.items() if k not in server_meta_fields}
+    if meta.get('generateName'): # 名字是生成的
+        meta.pop('name', None)
+    for key in ('labels', 'annotations'):
+        if meta.get(key):
+            meta[key] = {k: v for k, v in meta[key].items() if not k.startswith(server_label_prefixes)}
+    doc = {k: v for k, v in doc.items() if k != 'status'}
+    doc['metadata'] = meta
+    defaults = kind2defaults.get(doc.get('kind'))
+    if defaults and isinstance(doc.get('spec'), dict):
+        doc['spec'] = {k: v for k, v in doc['spec'].items() if k not in defaults or v != defaults[k]}
+    return normalize(doc)
+
+def get_doc_key(doc):
+    '''
+    获得资源的标识
+    :return: (类型, 名字), 用 generateName 的以 generateName 为名字
+    '''
+    meta = doc.get('metadata') or {}
+    return doc.get('kind'), meta.get('generateName') or meta.get('name')
+
+def diff_paths(old, new, path='', ret=None, limit=20):
+    '''
+    找出变化的字段路径
+    :param old: 旧值(规范化后)
+    :param new: 新值(规范化后)
+    :param path: 当前路径
+    :param ret: 变化的路径
+    :param limit: 最多找出几个
+    :return: 变化的路径, 如 spec.templates[main].container.image
+    '''
+    if ret is None:
+        ret = []
+    if len(ret) >= limit or old == new:
+        return ret
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k in list(old) + [k for k in new if k not in old]:
+            sub = path + k if k.startswith('[') or not path else f"{path}.{k}"
+            diff_paths(old.get(k), new.get(k), sub, ret, limit)
+        return ret
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (o, n) in enumerate(zip(old, new)):
+            diff_paths(o, n, f"{path}[{i}]", ret, limit)
+        return ret
+    ret.append(path)
+    return ret
+
+class SnapshotDoc(object):
+    '''
+    快照中的资源
+    '''
+
+    def __init__(self, doc, file):
+        self.file = file
+        self.ns = (doc.get('metadata') or {}).get('namespace')
+        self.norm = normalize_doc(doc)
+        self.matched = False
+
+    def get_norm(self, with_ns=True):
+        '''
+        获得规范化的资源
+        :param with_ns: 是否带命名空间, 生成的资源没指定命名空间时不带, 以便对上任意命名空间的资源
+        '''
+        if with_ns or 'namespace' not in self.norm['metadata']:
+            return self.norm
+        meta = {k: v for k, v in self.norm['metadata'].items() if k != 'namespace'}
+        return {**self.norm, 'metadata': meta}
+
+class ManifestDiffer(object):
+
+    def __init__(self, snapshot_dir, out='argoflowboot-changes.json'):
+        '''
+        构造函数
+        :param snapshot_dir: 快照目录: 上次应用的资源文件
+        :param out: 变更清单的json文件
+        '''
+        if not os.path.isdir(snapshot_dir):
+            raise Exception(f"快照目录不存在: {snapshot_dir}")
+        self.snapshot_dir = snapshot_dir
+        self.out = out
+        self.snapshot = {} # 快照中的资源, key是(类型, 名字), value是 SnapshotDoc 的list
+        self.changes = [] # 变更
+        self.unchanged = 0 # 未变的资源数
+        self.load_snapshot()
+
+    def load_snapshot(self):
+        '''
+        加载快照目录中的资源
+        '''
+        for dir, _, files in os.walk(self.snapshot_dir):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() not in snapshot_exts:
+                    continue
+                file = os.path.join(dir, name)
+                try:
+                    with open(file, encoding='utf-8') as f:
+                        docs = list(yaml.load_all(f, Loader=safe_loader))
+                except Exception as ex:
+                    raise Exception(f"快照文件[{file}]不是合法的yaml: {ex}")
+                for doc in docs:
+                    self.add_snapshot_doc(doc, file)
+        log.info(f"已从快照目录%s加载%s个资源", self.snapshot_dir, sum(len(docs) for docs in self.snapshot.values()))
+
+    def add_snapshot_doc(self, doc, file):
+        if not isinstance(doc, dict) or not doc.get('kind'):
+            return
+        if doc['kind'].endswith('List') and isinstance(doc.get('items'), list): # kubectl get -o yaml 的导出
+            for item in doc['items']:
+                self.add_snapshot_doc(item, file)
+            return
+        last = ((doc.get('metadata') or {}).get('annotations') or {}).get(last_applied_annotation)
+        if last:
+            try:
+                doc = json.loads(last)
+            except ValueError:
+                pass
+        key = get_doc_key(doc)
+        if key[1]:
+            self.snapshot.setdefault(key, []).append(SnapshotDoc(doc, file))
+
+    def find_snapshot_docs(self, doc):
+        '''
+        找出快照中对应的资源
+        :param doc: 生成的资源
+        :return: SnapshotDoc 的list
+        '''
+        kind, name = key = get_doc_key(doc)
+        ns = doc['metadata'].get('namespace')
+        found = self.snapshot.get(key)
+        if not found and doc['metadata'].get('generateName'): # 快照中是由 generateName 生成的名字
+            reg = re.compile(re.escape(name) + r'[a-z0-9]{5}$')
+            found = [sdoc for (k, n), sdocs in self.snapshot.items() if k == kind and reg.match(n) for sdoc in sdocs]
+        if not found:
+            return []
+        if ns: # 快照中的资源没有命名空间, 也算对上
+            return [sdoc for sdoc in found if sdoc.ns in (ns, None)]
+        return found
+
+    def accept(self, data, file):
+        '''
+        比较生成的资源, 只留下新增/修改的
+        :param data: 资源, 可以是list(多个资源)
+        :param file: 输出文件
+        :return: 新增/修改的资源, list的则为list; 都没变则返回None
+        '''
+        if not isinstance(data, list):
+            return data if self.check(data, file) else None
+        ret = [doc for doc in data if self.check(doc, file)]
+        return ret or None
+
+    def accept_file(self, path, file):
+        '''
+        比较文件中生成的资源, 用于流式写的大文件
+        :param path: 文件路径
+        :param file: 输出文件名
+        :return: 是否有新增/修改的资源
+        '''
+        with open(path, encoding='utf-8') as f:
+            docs = list(yaml.load_all(f, Loader=safe_loader))
+        return bool(self.accept(docs, file))
+
+    def check(self, doc, file):
+        '''
+        比较单个资源
+        :return: 是否新增/修改
+        '''
+        if not isinstance(doc, dict) or not isinstance(doc.get('metadata'), dict): # 无法比较, 当作修改
+            return True
+        kind, name = get_doc_key(doc)
+        change = {'change': None, 'kind': kind, 'name': name, 'namespace': doc['metadata'].get('namespace'), 'file': file}
+        sdocs = self.find_snapshot_docs(doc)
+        if not sdocs:
+            change['change'] = 'added'
+            self.changes.append(change)
+            return True
+        for sdoc in sdocs:
+            sdoc.matched = True
+        norm = normalize_doc(doc)
+        snorms = [sdoc.get_norm(change['namespace'] is not None) for sdoc in sdocs]
+        if norm in snorms:
+            self.unchanged += 1
+            return False
+        change['change'] = 'changed'
+        change['snapshot_file'] = sdocs[0].file
+        change['paths'] = diff_paths(snorms[0], norm)
+        self.changes.append(change)
+        return True
+
+    def save(self):
+        '''
+        记录删除的资源, 并保存变更清单
+        :return: 变更清单
+        '''
+        for (kind, name), sdocs in self.snapshot.items():
+            for sdoc in sdocs:
+                if not sdoc.matched:
+                    self.changes.append({'change': 'removed', 'kind': kind, 'name': name, 'namespace': sdoc.ns, 'snapshot_file': sdoc.file})
+        summary = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': self.unchanged}
+        for change in self.changes:
+            summary[change['change']] += 1
+        report = {
+            'snapshot': self.snapshot_dir,
+            'summary': summary,
+            'changes': self.changes,
+        }
+        write_file_if_changed(self.out, json.dumps(report, indent=1, ensure_ascii=False))
+        log.info(f"与快照比较: 新增%s个, 修改%s个, 删除%s个, 未变%s个(未输出), 变更清单已保存到 %s",
+                 summary['added'], summary['changed'], summary['removed'], summary['unchanged'], self.out)
+        return report
@@ -0,0 +1,45 @@
+import sys
+from argparse import ArgumentParser, SUPPRESS
+
+'''
+ArgoFlowBoot特有的命令行选项
+    pyutilb.cmd.parse_cmd() 的选项是固定的, 遇到未知选项会报错,
+    因此先从 sys.argv 中摘出本项目特有的选项, 剩下的再交给 parse_cmd() 解析
+    -h/--help 也留给 parse_cmd() 输出帮助并退出, 但要先输出本项目特有选项的帮助
+'''
+def parse_boot_options():
+    parser = ArgumentParser(usage=SUPPRESS, description='Options specific to ArgoFlowBoot, followed by the common options', add_help=False)
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, help='Number of worker processes to generate step files in parallel')
+    parser.add_argument('--incr', dest='incr', action='store_true', help='Incremental build: skip step files whose inputs have not changed since last build')
+    parser.add_argument('--wft-cache-ttl', dest='wft_cache_ttl', type=int, default=600, help='Seconds to cache remote WorkflowTemplate signatures on disk, 0 to disable the cache')
+    parser.add_argument('--refresh-wft', dest='refresh_wft', action='store_true', help='Ignore cached remote WorkflowTemplate signatures and pull them again')
+    parser.add_argument('--watch', dest='watch', action='store_true', help='Keep running, watch step files and their dependencies, and regenerate affected flows on change')
+    parser.add_argument('--watch-interval', dest='watch_interval', type=float, default=0.5, help='Seconds between polls in watch mode')
+    parser.add_argument('--profile', dest='profile', action='store_true', help='Profile actions, template body builders and save_yaml, and write a JSON report plus a collapsed-stack file')
+    parser.add_argument('--profile-out', dest='profile_out', default='argoflowboot-profile', help='File prefix of the profile report, default argoflowboot-profile')
+    parser.add_argument('--analyze', dest='analyze', action='store_true', help='Statically analyze generated flows: max width, depth, critical path and makespan estimate from template `duration` hints')
+    parser.add_argument('--analyze-out', dest='analyze_out', default='argoflowboot-analysis.json', help='JSON file of the analysis report, default argoflowboot-analysis.json')
+    parser.add_argument('--size-limit', dest='size_limit', default='512Ki', help='Max serialized size of a flow, e.g. 512Ki/1Mi; above it script sources, resource manifests and withItems are offloaded to a generated ConfigMap; 0 to disable')
+    parser.add_argument('--size-strict', dest='size_strict', action='store_true', help='Fail when a flow still exceeds --size-limit after offloading')
+    parser.add_argument('--size-report', dest='size_report', action='store_true', help='Log the serialized size of every flow and its largest templates')
+    parser.add_argument('--dedup', dest='dedup', action='store_true', help='Move templates shared by several Workflows/CronWorkflows of this run into a generated WorkflowTemplate and call them via templateRef')
+    parser.add_argument('--dedup-name', dest='dedup_name', default='argoflowboot-shared', help='Name of the generated shared WorkflowTemplate, default argoflowboot-shared')
+    parser.add_argument('--bundle', dest='bundle', help='Stream all generated documents into this single multi-document YAML file instead of one file per resource; `-o -` streams them to stdout')
+    parser.add_argument('--no-parse-cache', dest='no_parse_cache', action='store_true', help='Do not use the on-disk cache of parsed step files and template libraries')
+    parser.add_argument('--parse-cache-dir', dest='parse_cache_dir', help='Directory of the parse cache, default ~/.cache/ArgoFlowBoot/parsed')
+    parser.add_argument('--cache-stats', dest='cache_stats', action='store_true', help='Log hit/miss statistics of the parse cache at the end')
+    parser.add_argument('--submit', dest='submit', action='store_true', help='After generating, post WorkflowTemplates and then Workflows/CronWorkflows directly to the Argo Server REST API')
+    parser.add_argument('--argo-server', dest='argo_server', help='Address of the Argo Server to submit to, e.g. https://localhost:2746, default $ARGO_SERVER')
+    parser.add_argument('--submit-ns', dest='submit_ns', help='Namespace of submitted resources that do not specify one, default $ARGO_NAMESPACE or default')
+    parser.add_argument('--submit-jobs', dest='submit_jobs', type=int, default=8, help='Max concurrent requests to the Argo Server, default 8')
+    parser.add_argument('--submit-retries', dest='submit_retries', type=int, default=3, help='Retries of a request on connection errors, timeouts, 5xx and 429, with exponential backoff, default 3')
+    parser.add_argument('--token', dest='token', help='Token of the Argo Server, default $ARGO_TOKEN')
+    parser.add_argument('--insecure', dest='insecure', action='store_true', help='Do not verify the TLS certificate of the Argo Server, default $ARGO_INSECURE_SKIP_VERIFY')
+    parser.add_argument('--diff-against', dest='diff_against', help='Snapshot directory of last-applied manifests; compare generated resources semantically against it and only output the added/changed ones')
+    parser.add_argument('--diff-out', dest='diff_out', default='argoflowboot-changes.json', help='JSON file of the change list of --diff-against, default argoflowboot-changes.json')
+    if '-h' in sys.argv[1:] or '--help' in sys.argv[1:]:
+        print(parser.format_help())
+    # 解析已知选项, 未知的(如 -o -d 与步骤文件)原样留给 parse_cmd()
+    option, rest = parser.parse_known_args(sys.argv[1:])
+    sys.argv = sys.argv[:1] + rest
+    return option
@@ -0,0 +1,186 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+import yaml
+from collections import OrderedDict
+from pyutilb.file import read_yaml, is_http_file
+from pyutilb.log import log
+from ArgoFlowBoot.wft_cache import default_cache_dir
+
+'''
+步骤文件与模板库的解析缓存: 每次执行都要用纯python的yaml解析器解析所有步骤文件与 include_templates 的模板库, 文件多时耗时明显
+    1 解析结果用pickle存到磁盘 ~/.cache/ArgoFlowBoot/parsed/ 下, 一个源文件对应一个缓存文件, 多进程并行执行时也不会相互覆盖
+    2 缓存项记录源文件的路径、mtime、大小与内容hash:
+      mtime与大小都没变则直接用缓存; 否则读文件计算hash, hash没变(如git checkout只改了mtime)也用缓存, 并更新mtime
+    3 未命中则用libyaml的C解析器(CFullLoader/CSafeLoader, 没装libyaml则退回纯python的)解析, 再写缓存
+    4 http文件不缓存
+    5 缓存项还记录了解析器与缓存格式的版本, 变了则失效
+    6 模板库另有进程内的LRU缓存: 模板构建不修改模板选项, 因此被多个流程引入的模板库只需解析一次, 且共享同一份数据
+'''
+
+# 缓存格式的版本
+cache_version = 1
+
+# 解析器: 步骤文件跟 pyutilb.file.read_yaml() 一样用FullLoader, 模板库跟原来一样用SafeLoader
+full_loader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+safe_loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# 模板库的内存缓存的容量(个数)
+library_cache_size = 64
+
+class ParseCache(object):
+
+    def __init__(self, dir=None, enabled=True):
+        '''
+        构造函数
+        :param dir: 缓存目录
+        :param enabled: 是否启用缓存, 不启用也会用C解析器
+        '''
+        self.dir = dir or os.path.join(default_cache_dir(), 'parsed')
+        self.enabled = enabled
+        self.libraries = OrderedDict() # 模板库的内存缓存, key是路径, value是 ((路径, mtime, 大小), 数据)
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            'hits': 0, # 命中
+            'touched': 0, # mtime变了但内容没变, 也算命中
+            'misses': 0, # 未命中: 没缓存或内容变了
+            'memory_hits': 0, # 模板库命中内存缓存
+            'errors': 0, # 读写缓存出错
+            'parse_seconds': 0.0, # 未命中时解析的耗时
+            'load_seconds': 0.0, # 命中时读缓存的耗时
+        }
+
+    def pop_stats(self):
+        '''
+        取出并重置统计, 用于汇总工作进程的统计
+        '''
+        ret = self.stats
+        self.reset_stats()
+        return ret
+
+    def merge_stats(self, stats):
+        for k, v in stats.items():
+            self.stats[k] += v
+
+    def read_yaml(self, file, safe=False):
+        '''
+        读yaml文件, 有缓存则用缓存
+        :param file: yaml文件
+        :param safe: 是否用SafeLoader解析, 否则用FullLoader
+        :return: 解析结果, 每次都是新的对象, 调用方可随意修改
+        '''
+        if is_http_file(file):
+            return read_yaml(file)
+        loader = safe_loader if safe else full_loader
+        path = os.path.abspath(file)
+        st = os.stat(path)
+        cache_file = self.get_cache_file(path)
+        entry = self.load_entry(cache_file, path, loader) if self.enabled else None
+        # 1 mtime与大小都没变
+        if entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            self.stats['hits'] += 1
+            return entry['data']
+        # 2 比较内容hash
+        with open(path, 'rb') as f:
+            content = f.read()
+        hash = hashlib.sha1(content).hexdigest()
+        if entry is not None and entry['hash'] == hash:
+            self.stats['touched'] += 1
+            data = entry['data']
+        else:
+            self.stats['misses'] += 1
+            start = time.time()
+            data = yaml.load(content, Loader=loader)
+            self.stats['parse_seconds'] += time.time() - start
+        if self.enabled:
+            self.save_entry(cache_file, {
+                'version': cache_version,
+                'loader': loader.__name__,
+                'path': path,
+                'mtime': st.st_mtime_ns,
+                'size': st.st_size,
+                'hash': hash,
+                'data': data,
+            })
+        return data
+
+    def read_template_library(self, file):
+        '''
+        读模板库(include_templates的文件), 有内存缓存则用内存缓存
+        :param file: 模板库文件
+        :return: 解析结果, 是共享的数据, 调用方不能修改
+        '''
+        if is_http_file(file):
+            return self.read_yaml(file, True)
+        path = os.path.abspath(file)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        item = self.libraries.get(path)
+        if item is not None and item[0] == key:
+            self.libraries.move_to_end(path)
+            self.stats['memory_hits'] += 1
+            return item[1]
+        data = self.read_yaml(path, True)
+        self.libraries[path] = (key, data)
+        self.libraries.move_to_end(path)
+        # 淘汰最久未用的
+        while len(self.libraries) > library_cache_size:
+            self.libraries.popitem(last=False)
+        return data
+
+    def get_cache_file(self, path):
+        return os.path.join(self.dir, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.pickle')
+
+    def load_entry(self, cache_file, path, loader):
+        '''
+        读缓存项
+        :return: 缓存项, 没缓存或失效则返回None
+        '''
+        if not os.path.isfile(cache_file):
+            return None
+        start = time.time()
+        try:
+            with open(cache_file, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception as ex: # 缓存损坏则忽略
+            self.stats['errors'] += 1
+            log.debug(f"Ignore broken parse cache file: %s, %s", cache_file, ex)
+            return None
+        self.stats['load_seconds'] += time.time() - start
+        if not isinstance(entry, dict) or entry.get('version') != cache_version \
+                or entry.get('loader') != loader.__name__ or entry.get('path') != path:
+            return None
+        return entry
+
+    def save_entry(self, cache_file, entry):
+        '''
+        写缓存项: 先写临时文件再替换, 以免并行的工作进程读到写了一半的缓存
+        '''
+        try:
+            if not os.path.exists(self.dir):
+                os.makedirs(self.dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, cache_file)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        except Exception as ex: # 写不了缓存(如目录只读)不影响执行
+            self.stats['errors'] += 1
+            log.debug(f"Fail to write parse cache file: %s, %s", cache_file, ex)
+
+    def log_stats(self):
+        '''
+        打印缓存统计
+        '''
+        s = self.stats
+        total = s['hits'] + s['touched'] + s['misses']
+        rate = (s['hits'] + s['touched']) * 100 / total if total else 0
+        log.info(f"解析缓存: 共读%s个文件, 命中%s个(其中%s个只是mtime变了), 未命中%s个, 命中率%.1f%%, 模板库命中内存缓存%s次, 解析耗时%.3fs, 读缓存耗时%.3fs, 出错%s次, 缓存目录%s",
+                 total, s['hits'] + s['touched'], s['touched'], s['misses'], rate, s['memory_hits'], s['parse_seconds'], s['load_seconds'], s['errors'], self.dir if self.enabled else '(已禁用)')
@@ -0,0 +1,246 @@
+import fnmatch
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pyutilb.util import get_vars, set_vars, clear_vars, custom_funs
+from pyutilb.file import is_http_file
+from pyutilb.module_loader import load_module_funs
+from pyutilb.log import log
+from ArgoFlowBoot.manifest import BuildManifest
+
+'''
+多进程并行生成: 将步骤文件分散到多个工作进程中执行
+    1 每个步骤文件在工作进程中用独立的 Boot 与变量来执行，互不干扰
+      但流程外的动作(ns/semaphores)设置的执行状态(见 Boot.get_run_state())在串行执行时会带到之后的步骤文件,
+      因此按顺序推算每个文件开始时的执行状态并传给工作进程, 实际开始状态与推算的不一致(前面的文件改了状态)则下一轮重跑该文件
+    2 引用其他文件定义的流程模板(WorkflowTemplate)时，如果该模板的入参还未知，则该文件延迟到下一轮执行，
+      每一轮都会将已执行成功的文件中定义的流程模板入参带给下一轮
+    3 如果某一轮没有任何进展(剩下的文件都在等待未知的流程模板)，则在主进程中串行执行剩下的文件，此时会从集群中拉取流程模板
+    4 如果多个步骤文件生成了同名文件，则最后在主进程中按顺序重跑最后生成该文件的步骤文件，以保证结果跟串行执行一致
+'''
+
+def list_step_files(paths):
+    '''
+    展开步骤文件: 支持文件/目录/目录下的文件模式, 依次展开所有路径
+        串行执行(Boot.do_run())、多进程并行执行与监视模式都用本函数遍历, 以保证执行的文件一致;
+        注: YamlBoot.do_run() 遇到目录或模式时执行完就返回, 会忽略之后的路径, Boot.do_run() 已改为执行所有路径
+    :param paths: 步骤配置文件或目录的列表
+    :return: 步骤文件列表
+    '''
+    files = []
+    for path in paths:
+        # 1 模式文件
+        if '*' in path:
+            dir, pattern = path.rsplit(os.sep, 1)  # 从后面分割，分割为目录+模式
+            if not os.path.exists(dir):
+                raise Exception(f'Step config directory not exist: {dir}')
+            files.extend(list_dir_step_files(dir, pattern))
+            continue
+
+        # 2 不存在
+        if (not is_http_file(path)) and not os.path.exists(path):
+            raise Exception(f'Step config file or directory not exist: {path}')
+
+        # 3 目录: 遍历子文件
+        if os.path.isdir(path):
+            files.extend(list_dir_step_files(path))
+            continue
+
+        # 4 纯文件
+        files.append(path)
+    return files
+
+def list_dir_step_files(dir, pattern='*.yml'):
+    ret = []
+    names = os.listdir(dir)
+    names.sort() # 按文件名排序
+    for name in names:
+        if fnmatch.fnmatch(name, pattern): # 匹配文件名模式
+            file = os.path.join(dir, name)
+            if os.path.isfile(file):
+                ret.append(file)
+    return ret
+
+# 工作进程中的增量构建清单
+_manifest = None
+# 工作进程中的流程大小检查
+_size_guard = None
+# 工作进程中的解析缓存
+_parse_cache = None
+
+def init_worker(funs_file, manifest_args, size_guard=None, parse_cache=None):
+    '''
+    工作进程的初始化
+    :param funs_file: 自定义函数的python文件
+    :param manifest_args: 增量构建清单的构造参数, 为None则全量构建
+    :param size_guard: 流程大小的检查, 为None则用默认的
+    :param parse_cache: 步骤文件与模板库的解析缓存, 为None则不缓存
+    '''
+    global _manifest, _size_guard, _parse_cache
+    _size_guard = size_guard
+    _parse_cache = parse_cache
+    # 加载自定义函数
+    if funs_file:
+        custom_funs.update(load_module_funs(funs_file))
+    # 加载增量构建清单(只读, 由主进程合并保存)
+    if manifest_args is not None:
+        _manifest = BuildManifest(*manifest_args)
+
+def run_step_file(step_file, output_dir, vars, wft2template_inputs, state):
+    '''
+    在工作进程中执行单个步骤文件
+    :param step_file: 步骤文件
+    :param output_dir: 输出目录
+    :param vars: 主进程中通过命令行设置的变量
+    :param wft2template_inputs: 已知的流程模板入参
+    :param state: 开始时的执行状态, 即串行执行时前面的文件执行完的状态
+    :return: (是否执行完毕, 缺失的流程模板名, 本文件中定义的流程模板入参, 生成的文件, 增量构建清单项, 解析缓存的统计, 结束时的执行状态)
+    '''
+    from ArgoFlowBoot.boot import Boot, WftNotFoundException
+    # 独立的变量与Boot
+    clear_vars('*')
+    set_vars(vars)
+    boot = Boot(output_dir)
+    boot.pull_wft = False # 未知流程模板不从集群拉取，而是延迟到下一轮
+    boot.manifest = _manifest
+    if _size_guard is not None:
+        boot.size_guard = _size_guard
+    boot.parse_cache = _parse_cache
+    boot.set_run_state(state)
+    boot._wft2template_inputs.update(wft2template_inputs)
+    known = dict(boot._wft2template_inputs)
+    try:
+        boot.run([step_file])
+    except WftNotFoundException as ex:
+        log.debug(f"Step file %s waits for WorkflowTemplate: %s", step_file, ex.wft)
+        return False, ex.wft, {}, [], None, pop_parse_stats(), None
+    except Exception as ex:
+        log.error(f"Exception occurs: current step file is %s", boot.step_file, exc_info=ex)
+        raise ex
+    # 本文件中定义的流程模板入参
+    defined = {k: v for k, v in boot._wft2template_inputs.items() if known.get(k) is not v}
+    entry = _manifest.entries.get(step_file) if _manifest is not None else None
+    return True, None, defined, boot.output_files, entry, pop_parse_stats(), boot.get_run_state()
+
+def pop_parse_stats():
+    '''
+    取出工作进程中解析缓存的统计, 交给主进程汇总
+    '''
+    if _parse_cache is None:
+        return None
+    return _parse_cache.pop_stats()
+
+def run_in_pool(step_files, output_dir, jobs, funs_file=None, manifest=None, wft_cache=None, size_guard=None, parse_cache=None):
+    '''
+    多进程并行执行步骤文件, 结果跟串行执行一致
+    :param step_files: 步骤配置文件或目录的列表
+    :param output_dir: 输出目录
+    :param jobs: 工作进程数
+    :param funs_file: 自定义函数的python文件
+    :param manifest: 增量构建的清单, 为None则全量构建
+    :param wft_cache: 远程流程模板签名的磁盘缓存, 用于串行兜底
+    :param size_guard: 流程大小的检查, 为None则用默认的
+    :param parse_cache: 步骤文件与模板库的解析缓存, 为None则不缓存, 会汇总工作进程的统计
+    '''
+    from ArgoFlowBoot.boot import Boot
+    # 用绝对路径: 步骤文件执行中途抛异常时工作进程的当前目录可能未恢复
+    step_files = [file if is_http_file(file) else os.path.abspath(file) for file in list_step_files(step_files)]
+    output_dir = os.path.abspath(output_dir or 'out')
+    vars = get_vars(True)
+    init_state = Boot(output_dir).get_run_state() # 初始的执行状态
+    wft2template_inputs = {} # 已知的流程模板入参
+    results = {} # 执行完的文件, key是步骤文件, value是 (开始时的执行状态, 结束时的执行状态, 生成的文件)
+    manifest_args = None
+    if manifest is not None:
+        manifest_args = (output_dir, manifest.vars, manifest.version)
+    verified = 0 # 开始状态已确认的文件数: 前面的文件都执行完且开始状态跟推算的一致
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(funs_file, manifest_args, size_guard, parse_cache)) as pool:
+        while True:
+            verified, starts = guess_start_states(step_files, init_state, results)
+            # 待执行: 未执行完的, 或开始状态跟推算的不一致的
+            pending = [file for file in step_files if file not in results or results[file][0] != starts[file]]
+            if not pending:
+                break
+            futures = [pool.submit(run_step_file, file, output_dir, vars, wft2template_inputs, starts[file]) for file in pending]
+            defined_any = False
+            for file, future in zip(pending, futures):
+                done, _, defined, outputs, entry, stats, end = future.result()
+                if stats is not None:
+                    parse_cache.merge_stats(stats)
+                if done:
+                    defined_any = defined_any or any(wft2template_inputs.get(k) != v for k, v in defined.items())
+                    wft2template_inputs.update(defined)
+                    results[file] = (starts[file], end, outputs)
+                    if entry is not None:
+                        manifest.entries[file] = entry
+            # 没有进展(确认的文件没增加, 也没定义新的流程模板入参)，则退出循环，走串行兜底
+            if guess_start_states(step_files, init_state, results)[0] == verified and not defined_any:
+                break
+
+    # 串行兜底: 在主进程中从第一个未确认的文件开始按顺序执行，允许从集群拉取流程模板
+    if verified < len(step_files):
+        _, starts = guess_start_states(step_files, init_state, results)
+        results.update(run_serially(step_files[verified:], output_dir, wft2template_inputs, starts[step_files[verified]], results, manifest, wft_cache, size_guard, parse_cache))
+
+    # 同名文件冲突: 按顺序重跑最后的生成者(跟串行执行一样后写的覆盖先写的)
+    output2step_files = {} # 记录生成文件是由哪些步骤文件生成的
+    for file in step_files:
+        for output in results[file][2]:
+            output2step_files.setdefault(output, []).append(file)
+    order = {file: i for i, file in enumerate(step_files)}
+    last_writers = {max(files, key=order.get) for files in output2step_files.values() if len(files) > 1}
+    if last_writers:
+        log.debug(f"Rerun step files for conflict output files: %s", last_writers)
+        # 不走增量构建: 跳过的话就不会覆盖; 每个文件从自己的开始状态执行
+        for file in sorted(last_writers, key=order.get):
+            run_serially([file], output_dir, wft2template_inputs, results[file][0], wft_cache=wft_cache, size_guard=size_guard, parse_cache=parse_cache)
+
+def guess_start_states(step_files, init_state, results):
+    '''
+    按顺序推算每个步骤文件开始时的执行状态: 串行执行时为前一个文件结束时的状态
+        未执行完的文件, 假定不改变状态; 开始状态跟推算的不一致的文件, 用其结束状态来推算(需重跑确认)
+    :param step_files: 步骤文件
+    :param init_state: 初始的执行状态
+    :param results: 执行完的文件, key是步骤文件, value是 (开始时的执行状态, 结束时的执行状态, 生成的文件)
+    :return: (开始状态已确认的文件数, 推算的开始状态的dict)
+    '''
+    state = init_state
+    starts = {}
+    verified = 0
+    for i, file in enumerate(step_files):
+        starts[file] = state
+        if file in results:
+            if verified == i and results[file][0] == state:
+                verified += 1
+            state = results[file][1]
+    return verified, starts
+
+def run_serially(step_files, output_dir, wft2template_inputs, state, results=None, manifest=None, wft_cache=None, size_guard=None, parse_cache=None):
+    '''
+    在主进程中串行执行步骤文件
+    :param state: 开始时的执行状态
+    :param results: 已在工作进程中执行完的文件, 开始状态跟当前一致的则不重跑, 直接用其结束状态与生成的文件
+    :return: dict, key是步骤文件, value是 (开始时的执行状态, 结束时的执行状态, 生成的文件)
+    '''
+    from ArgoFlowBoot.boot import Boot
+    boot = Boot(output_dir)
+    boot.manifest = manifest
+    boot.wft_cache = wft_cache
+    if size_guard is not None:
+        boot.size_guard = size_guard
+    boot.parse_cache = parse_cache
+    boot._wft2template_inputs.update(wft2template_inputs)
+    boot.set_run_state(state)
+    ret = {}
+    for file in step_files:
+        start = boot.get_run_state()
+        if results and file in results and results[file][0] == start:
+            boot.set_run_state(results[file][1])
+            continue
+        i = len(boot.output_files)
+        try:
+            boot.run([file])
+        except Exception as ex:
+            log.error(f"Exception occurs: current step file is %s", boot.step_file, exc_info=ex)
+            raise ex
+        ret[file] = (start, boot.get_run_state(), boot.output_files[i:])
+    return ret
@@ -0,0 +1,83 @@
+import copy
+import json
+from pyutilb.log import log
+
+'''
+性能预设: 预设流程的 podGC/ttlStrategy/activeDeadlineSeconds 与容器的默认资源
+    已完成的pod与流程不回收, 会越积越多, 拖慢控制器与api server; 没有资源请求的pod不好调度
+    1 throughput: 大批量的短任务, pod完成即回收, 流程保留10分钟, 资源请求尽量小以便多调度
+    2 low-latency: 交互式的短流程, 成功的pod即回收(失败的保留以便排查), 超时短, 资源请求稍大以免被挤占
+    3 debug: 保留pod与流程以便排查, 超时长
+    字段除了 resources(容器的默认资源, 跟容器选项中的resources格式一样) 外, 都是流程的spec字段
+'''
+
+# 预设
+profile_presets = {
+    'throughput': {
+        'podGC': {'strategy': 'OnPodCompletion'},
+        'ttlStrategy': {'secondsAfterCompletion': 600},
+        'activeDeadlineSeconds': 86400,
+        'resources': {'cpu': '100m', 'memory': '128Mi'},
+    },
+    'low-latency': {
+        'podGC': {'strategy': 'OnPodSuccess'},
+        'ttlStrategy': {'secondsAfterSuccess': 300, 'secondsAfterFailure': 3600},
+        'activeDeadlineSeconds': 1800,
+        'resources': {'cpu': '250m', 'memory': '256Mi'},
+    },
+    'debug': {
+        'ttlStrategy': {'secondsAfterCompletion': 86400},
+        'activeDeadlineSeconds': 14400,
+    },
+}
+
+# 预设名的key
+preset_key = 'preset'
+
+def build_profile(option):
+    '''
+    解析profile动作的参数
+    :param option: 预设名, 或dict{preset: 预设名(可省), 字段: 值}, 字段值会覆盖预设
+    :return: dict{字段: 值}, 预设名记在 preset 字段
+    '''
+    if isinstance(option, str):
+        option = {preset_key: option}
+    if not isinstance(option, dict):
+        raise Exception(f"profile动作只接收预设名, 或dict")
+    option = dict(option)
+    name = option.get(preset_key)
+    if name is None:
+        return option
+    if name not in profile_presets:
+        raise Exception(f"未知性能预设: {name}, 仅支持 {'/'.join(profile_presets)}")
+    return {**copy.deepcopy(profile_presets[name]), **option}
+
+def merge_profile(*profiles):
+    '''
+    合并多个预设, 后者覆盖前者
+    :return: dict{字段: (值, 来源)}
+    '''
+    ret = {}
+    for src, profile in profiles:
+        for k, v in profile.items():
+            if k != preset_key:
+                ret[k] = (v, profile.get(preset_key) or src)
+    return ret
+
+def log_profile(flow, fields, spec, resources_count):
+    '''
+    打印流程最终的预设字段
+    :param flow: 流程名
+    :param fields: dict{字段: (值, 来源)}
+    :param spec: 流程的spec, 其中字段可能被 spec 动作覆盖
+    :param resources_count: 用了默认资源的容器数
+    '''
+    items = []
+    for k, (v, src) in fields.items():
+        if k == 'resources':
+            items.append(f"默认资源={json.dumps(v)}({src}, 用于{resources_count}个容器)")
+        elif spec.get(k) is not v: # 被覆盖
+            items.append(f"{k}={json.dumps(spec.get(k))}(spec)")
+        else:
+            items.append(f"{k}={json.dumps(v)}({src})")
+    log.info(f"流程[%s]的性能预设: %s", flow, ', '.join(items))
@@ -0,0 +1,155 @@
+import functools
+import json
+import time
+import tracemalloc
+from pyutilb.log import log
+from ArgoFlowBoot.emitter import write_file_if_changed
+
+'''
+性能剖析: 对 Boot 的动作、模板主体构建器与 save_yaml() 计时
+    1 统计每个动作/构建器的调用次数与耗时(总耗时/最大/最小)
+    2 按流程统计耗时、调用次数与内存峰值(tracemalloc, 相对于流程开始时的内存)
+    3 输出json报告, 与折叠栈文件(collapsed stack, 每行为 `步骤文件;动作;构建器 自身耗时微秒`), 后者可用 flamegraph.pl 或 speedscope 等工具生成火焰图
+'''
+
+# 流程动作
+flow_actions = ('wf', 'wft', 'cwft', 'cwf')
+
+class Profiler(object):
+
+    def __init__(self):
+        self.boot = None
+        self.stack = [] # 调用栈, 元素为 [帧名, 子调用耗时]
+        self.root = None # 最外层调用所在的步骤文件
+        self.stats = {} # 动作/构建器的统计, key是名字
+        self.collapsed = {} # 折叠栈的自身耗时, key是栈
+        self.flows = {} # 流程的统计, key是流程名
+        self.flow = None # 当前流程的统计
+        self.start_time = None
+
+    def install(self, boot):
+        '''
+        给Boot装上剖析: 包装动作、模板主体构建器与 save_yaml()
+        :param boot:
+        '''
+        self.boot = boot
+        for name, func in boot.actions.items():
+            boot.actions[name] = self.wrap('action:' + name, func, name in flow_actions)
+        for name, func in boot.template_body_builders.items():
+            boot.template_body_builders[name] = self.wrap('builder:' + name, func)
+        boot.save_yaml = self.wrap('save_yaml', boot.save_yaml)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.start_time = time.perf_counter()
+
+    def wrap(self, name, func, is_flow=False):
+        '''
+        包装函数来计时
+        :param name: 名字
+        :param func: 被包装的函数
+        :param is_flow: 是否流程动作, 其参数为 (子步骤, 流程名)
+        '''
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frame = name
+            if is_flow and len(args) > 1:
+                frame = f"{name}({args[1]})"
+                self.enter_flow(name[len('action:'):])
+            self.enter(frame)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit(name, time.perf_counter() - start)
+                if is_flow and len(args) > 1:
+                    self.exit_flow()
+        return wrapper
+
+    def enter(self, frame):
+        if not self.stack:
+            self.root = str(self.boot.step_file or '-')
+        self.stack.append([frame, 0])
+
+    def exit(self, name, elapsed):
+        frames = [self.root] + [f[0] for f in self.stack]
+        frame = self.stack.pop()
+        # 折叠栈: 记录自身耗时, 即扣掉子调用的耗时
+        key = ';'.join(f.replace(';', '_') for f in frames)
+        self.collapsed[key] = self.collapsed.get(key, 0) + elapsed - frame[1]
+        if self.stack:
+            self.stack[-1][1] += elapsed
+        # 统计
+        add_stat(self.stats, name, elapsed)
+        if self.flow is not None:
+            add_stat(self.flow['calls'], name, elapsed)
+            # 流程名: 以执行中的为准, 因为流程名可能带变量, 而流程结束时会清空
+            if self.boot._flow:
+                self.flow['name'] = self.boot._flow
+
+    def enter_flow(self, type):
+        # 重置内存峰值, 以便统计流程内的峰值
+        if hasattr(tracemalloc, 'reset_peak'): # python3.9+
+            tracemalloc.reset_peak()
+        self.flow = {
+            'name': None,
+            'type': type,
+            'file': str(self.boot.step_file),
+            'start': time.perf_counter(),
+            'start_memory': tracemalloc.get_traced_memory()[0],
+            'calls': {},
+        }
+
+    def exit_flow(self):
+        flow = self.flow
+        self.flow = None
+        if flow is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        name = flow['name'] or f"{flow['type']}@{len(self.flows)}"
+        self.flows[name] = {
+            'type': flow['type'],
+            'file': flow['file'],
+            'time': time.perf_counter() - flow['start'],
+            'peak_memory': peak - flow['start_memory'], # 流程内的内存峰值, 相对于流程开始时
+            'memory_delta': current - flow['start_memory'], # 流程结束后增加的内存
+            'calls': flow['calls'],
+        }
+
+    def build_report(self):
+        return {
+            'total_time': time.perf_counter() - self.start_time,
+            'peak_memory': tracemalloc.get_traced_memory()[1],
+            'stats': self.stats,
+            'flows': self.flows,
+        }
+
+    def save(self, prefix):
+        '''
+        保存报告
+        :param prefix: 文件前缀, 会生成 前缀.json 与 前缀.collapsed
+        '''
+        report = self.build_report()
+        write_file_if_changed(prefix + '.json', json.dumps(report, indent=1, ensure_ascii=False))
+        # 折叠栈: 耗时转为整数微秒
+        lines = [f"{stack} {int(t * 1000000)}" for stack, t in sorted(self.collapsed.items()) if t > 0]
+        write_file_if_changed(prefix + '.collapsed', "\n".join(lines) + "\n")
+        # 打印最耗时的动作
+        top = sorted(self.stats.items(), key=lambda item: -item[1]['total'])[:10]
+        summary = "\n".join(f"  {name}: {s['calls']}次, 共{s['total'] * 1000:.1f}ms, 最大{s['max'] * 1000:.1f}ms" for name, s in top)
+        log.info(f"性能剖析报告已保存到 %s.json 与 %s.collapsed, 总耗时%.1fms, 最耗时的动作:\n%s", prefix, prefix, report['total_time'] * 1000, summary)
+
+def add_stat(stats, name, elapsed):
+    '''
+    累计耗时统计
+    :param stats: dict, key是名字
+    :param name: 名字
+    :param elapsed: 本次耗时
+    '''
+    s = stats.get(name)
+    if s is None:
+        stats[name] = {'calls': 1, 'total': elapsed, 'max': elapsed, 'min': elapsed}
+        return
+    s['calls'] += 1
+    s['total'] += elapsed
+    s['max'] = max(s['max'], elapsed)
+    s['min'] = min(s['min'], elapsed)
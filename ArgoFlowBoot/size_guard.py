@@ -0,0 +1,213 @@
+import json
+import re
+from pyutilb.log import log
+
+'''
+流程大小的检查: argo将流程存在etcd中(单个对象约1MB的上限), 且大对象会拖慢控制器
+    1 保存流程前计算其序列化(json)后的大小
+    2 超过上限, 则将大段内容按从大到小的顺序转移到生成的ConfigMap中, 直到不超过上限:
+      script模板的源码(source), resource模板的资源清单(manifest), 步骤/任务的withItems
+    3 模板通过输入参数引用ConfigMap中的内容(valueFrom.configMapKeyRef):
+      source/manifest 改为 {{inputs.parameters.argoflowboot-source}} 之类, withItems 改为 withParam
+    4 带argo变量(即包含`{{`)的内容不转移, 因为参数值中的变量不会再被替换
+    5 转移后仍超过上限, 严格模式下报错, 否则警告
+'''
+
+# 大小单位对字节数
+size_units = {'': 1, 'k': 1000, 'm': 1000 ** 2, 'ki': 1024, 'mi': 1024 ** 2}
+
+# 默认上限: etcd中的流程对象还要存运行状态(每个节点一项), 因此要留足余量
+default_limit = 512 * 1024
+
+# ConfigMap的数据上限(1MiB), 扣掉元数据的余量
+configmap_limit = 1000 * 1024
+
+# 太小的内容不转移, 转移了也省不了多少
+min_offload_size = 1024
+
+# 引用ConfigMap的输入参数名前缀
+param_prefix = 'argoflowboot-'
+
+def parse_size(val):
+    '''
+    解析大小
+    :param val: 数字(字节数)或字符串, 如 512Ki, 1Mi, 500K
+    :return: 字节数
+    '''
+    if isinstance(val, int):
+        return val
+    mat = re.match(r'^\s*(\d+)\s*([kKmM]i?)?\s*$', str(val))
+    if mat is None:
+        raise Exception(f"无法识别大小: {val}, 格式如 512Ki/1Mi/500K")
+    return int(mat.group(1)) * size_units[(mat.group(2) or '').lower()]
+
+def measure(data):
+    '''
+    计算序列化(json)后的大小(字节数), 即存到etcd中的大小
+    '''
+    return len(json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=str).encode('utf-8'))
+
+def format_size(size):
+    return f"{size / 1024:.1f}KiB"
+
+class SizeGuard(object):
+
+    def __init__(self, limit=default_limit, strict=False, report=False):
+        '''
+        构造函数
+        :param limit: 流程大小的上限(字节数), 为0则不检查
+        :param strict: 严格模式, 转移后仍超过上限则报错
+        :param report: 是否打印每个流程的大小报告
+        '''
+        self.limit = parse_size(limit)
+        self.strict = strict
+        self.report = report
+
+    def guard(self, flow, name, ns=None):
+        '''
+        检查流程大小, 超过上限则将大段内容转移到ConfigMap, 会直接修改流程
+        :param flow: 流程, 即 Workflow/WorkflowTemplate/ClusterWorkflowTemplate/CronWorkflow
+        :param name: 流程名, 用作ConfigMap名的前缀
+        :param ns: 命名空间
+        :return: 生成的ConfigMap列表, 没有转移则为空
+        '''
+        if not self.limit:
+            return []
+        size = measure(flow)
+        templates = get_templates(flow)
+        if self.report:
+            self.log_report(name, size, templates)
+        if size <= self.limit:
+            return []
+
+        # 按从大到小的顺序转移
+        bins = [] # ConfigMap的数据, 元素为 [ConfigMap名, 数据, 大小]
+        offloaded = 0
+        for item in sorted(find_offload_items(templates), key=lambda item: -item[0]):
+            item_size, key, value, apply = item
+            if size - offloaded <= self.limit or item_size < min_offload_size:
+                break
+            cm = self.alloc_bin(bins, name, key, value)
+            apply({'name': cm, 'key': key})
+            offloaded += item_size
+        new_size = measure(flow)
+        if bins:
+            log.info(f"流程[%s]的大小为%s, 超过上限%s, 已将%s段大内容转移到ConfigMap[%s], 流程大小降为%s",
+                     name, format_size(size), format_size(self.limit), sum(len(b[1]) for b in bins), ', '.join(b[0] for b in bins), format_size(new_size))
+        if new_size > self.limit:
+            msg = f"流程[{name}]的大小为{format_size(new_size)}, 超过上限{format_size(self.limit)}, 剩下的内容无法转移到ConfigMap(太小或带argo变量)"
+            if self.strict:
+                raise Exception(msg)
+            log.warning(msg)
+        return [build_configmap(cm, data, name, ns) for cm, data, _ in bins]
+
+    def alloc_bin(self, bins, name, key, value):
+        '''
+        分配ConfigMap: 单个ConfigMap放不下就新建
+        :return: ConfigMap名
+        '''
+        size = len(key) + len(value.encode('utf-8'))
+        if size > configmap_limit:
+            raise Exception(f"流程[{name}]的{key}大小为{format_size(size)}, 超过ConfigMap的上限, 无法转移")
+        if not bins or bins[-1][2] + size > configmap_limit:
+            cm = f"{name}-src" if not bins else f"{name}-src-{len(bins)}"
+            bins.append([cm, {}, 0])
+        bin = bins[-1]
+        bin[1][key] = value
+        bin[2] += size
+        return bin[0]
+
+    def log_report(self, name, size, templates):
+        '''
+        打印大小报告: 流程大小与最大的几个模板
+        '''
+        sizes = sorted(((measure(tpl), tpl['name']) for tpl in templates), reverse=True)[:5]
+        top = ', '.join(f"{tpl}={format_size(s)}" for s, tpl in sizes)
+        log.info(f"流程[%s]的大小为%s(上限%s), 最大的模板: %s", name, format_size(size), format_size(self.limit), top)
+
+def get_templates(flow):
+    spec = flow['spec']
+    if flow['kind'] == 'CronWorkflow':
+        spec = spec['workflowSpec']
+    return spec.get('templates', [])
+
+def find_offload_items(templates):
+    '''
+    找出可转移的内容
+    :return: 元素为 (大小, ConfigMap中的key, 内容, 转移函数(参数为configMapKeyRef))
+    '''
+    ret = []
+    for tpl in templates:
+        name = tpl['name']
+        # script模板的源码
+        script = tpl.get('script')
+        if script and isinstance(script.get('source'), str) and '{{' not in script['source']:
+            ret.append((len(script['source']), f"{name}.source", script['source'], wrap_replace_field(tpl, script, 'source')))
+        # resource模板的资源清单
+        res = tpl.get('resource')
+        if res and isinstance(res.get('manifest'), str) and '{{' not in res['manifest']:
+            ret.append((len(res['manifest']), f"{name}.manifest", res['manifest'], wrap_replace_field(tpl, res, 'manifest')))
+        # 步骤/任务的withItems
+        if 'steps' in tpl:
+            steps = [step for group in tpl['steps'] for step in (group if isinstance(group, list) else [group])]
+        elif 'dag' in tpl:
+            steps = tpl['dag'].get('tasks', [])
+        else:
+            steps = []
+        for step in steps:
+            if 'withItems' not in step:
+                continue
+            items = json.dumps(step['withItems'], ensure_ascii=False)
+            if '{{' not in items:
+                ret.append((len(items), f"{name}.{step['name']}.items", items, wrap_replace_items(tpl, step)))
+    return ret
+
+def wrap_replace_field(tpl, body, field):
+    '''
+    转移函数: 将模板主体的字段改为引用输入参数
+    '''
+    def apply(ref):
+        body[field] = add_input(tpl, field, ref)
+    return apply
+
+def wrap_replace_items(tpl, step):
+    '''
+    转移函数: 将步骤的withItems改为withParam, 并引用输入参数
+    '''
+    def apply(ref):
+        del step['withItems']
+        step['withParam'] = add_input(tpl, 'items-' + step['name'], ref)
+    return apply
+
+def add_input(tpl, name, ref):
+    '''
+    给模板添加引用ConfigMap的输入参数
+    :return: 参数的引用表达式
+    '''
+    name = param_prefix + name
+    inputs = tpl.get('inputs')
+    if inputs is None:
+        inputs = tpl['inputs'] = {}
+    inputs.setdefault('parameters', []).append({
+        'name': name,
+        'valueFrom': {
+            'configMapKeyRef': ref
+        }
+    })
+    return '{{inputs.parameters.' + name + '}}'
+
+def build_configmap(name, data, flow, ns=None):
+    meta = {
+        'name': name,
+        'labels': {
+            'flow': flow
+        }
+    }
+    if ns:
+        meta['namespace'] = ns
+    return {
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': meta,
+        'data': data,
+    }
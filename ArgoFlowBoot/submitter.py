@@ -0,0 +1,295 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pyutilb.log import log
+from ArgoFlowBoot.dedup import get_spec, iterate_steps
+
+'''
+批量提交到argo服务器: 直接调用 Argo Server 的 REST API, 而不是每个资源启动一次 argo 命令
+    1 连接池: 所有请求共用一个 requests.Session, 连接池大小跟并发数一致, 复用https连接
+    2 有上限的并发: 用线程池提交, 默认8个并发
+    3 失败重试: 连接出错、超时、5xx与429时重试, 重试间隔指数增长(带随机抖动);
+      但创建流程(Workflow)不是幂等的(用generateName, 重复提交就会多跑一个流程), 只在请求没发出去(连接失败)或服务端明确没处理(429/503)时重试
+    4 先创建后更新: 流程模板/集群级流程模板/定时流程先创建, 已存在(409)则拉取其 resourceVersion 再更新;
+      流程(Workflow)只创建, 一般用 generateName, 每次提交都是新流程
+    5 顺序: 先提交所有流程模板, 再提交引用它们的流程与定时流程; 引用的流程模板提交失败, 则不提交该流程
+    6 Argo Server 不支持的资源(ConfigMap与WorkflowEventBinding)不提交, 只提示要用 kubectl apply
+    服务器地址与token默认跟argo命令一样取环境变量 ARGO_SERVER 与 ARGO_TOKEN, 也支持 http:// 开头的地址, 以便对接本地的模拟服务器
+'''
+
+# 资源类型 -> (api路径, 请求体的key, 是否集群级)
+kind2api = {
+    'WorkflowTemplate': ('workflow-templates', 'template', False),
+    'ClusterWorkflowTemplate': ('cluster-workflow-templates', 'template', True),
+    'CronWorkflow': ('cron-workflows', 'cronWorkflow', False),
+    'Workflow': ('workflows', 'workflow', False),
+}
+
+# 先提交的资源类型: 被其他资源引用
+template_kinds = ('WorkflowTemplate', 'ClusterWorkflowTemplate')
+
+# 重试的状态码
+retry_status = (429, 500, 502, 503, 504)
+
+# 非幂等请求(创建流程)重试的状态码: 服务端没处理该请求
+unprocessed_status = (429, 503)
+
+class SubmitException(Exception):
+    '''
+    提交失败的异常
+    '''
+
+    def __init__(self, msg, status=None):
+        super().__init__(msg)
+        self.status = status
+
+class ArgoSubmitter(object):
+
+    def __init__(self, server=None, token=None, ns=None, jobs=8, retries=3, backoff=0.5, timeout=30, insecure=None):
+        '''
+        构造函数
+        :param server: 服务器地址, 如 https://localhost:2746, 没有协议则用https, 默认取环境变量 ARGO_SERVER
+        :param token: 认证token, 如 Bearer xxx, 默认取环境变量 ARGO_TOKEN
+        :param ns: 资源没指定命名空间时用的命名空间, 默认取环境变量 ARGO_NAMESPACE, 否则为 default
+        :param jobs: 并发数
+        :param retries: 重试次数
+        :param backoff: 首次重试的间隔(秒), 之后每次翻倍
+        :param timeout: 请求超时(秒)
+        :param insecure: 是否不校验https证书, 默认取环境变量 ARGO_INSECURE_SKIP_VERIFY
+        '''
+        server = server or os.environ.get('ARGO_SERVER')
+        if not server:
+            raise Exception("请用 --argo-server 指定argo服务器地址, 或设置环境变量 ARGO_SERVER")
+        if '://' not in server:
+            server = ('http://' if os.environ.get('ARGO_SECURE') == 'false' else 'https://') + server
+        self.server = server.rstrip('/') + os.environ.get('ARGO_BASE_HREF', '').rstrip('/')
+        self.token = token if token is not None else os.environ.get('ARGO_TOKEN')
+        self.ns = ns or os.environ.get('ARGO_NAMESPACE') or 'default'
+        self.jobs = max(1, jobs)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        if insecure is None:
+            insecure = os.environ.get('ARGO_INSECURE_SKIP_VERIFY') == 'true'
+        self.insecure = insecure
+        self.docs = {} # 待提交的资源, key是(类型, 命名空间, 名字), 同一资源多次生成则只提交最后一次的, value是资源
+        self.skipped = [] # 不支持提交的资源的文件
+        self._session = None
+
+    @property
+    def session(self):
+        '''
+        共用的http会话, 延迟创建
+        '''
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.jobs) # 连接池大小跟并发数一致
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Content-Type'] = 'application/json'
+            if self.token:
+                session.headers['Authorization'] = self.token if ' ' in self.token else 'Bearer ' + self.token
+            session.verify = not self.insecure
+            if self.insecure:
+                import urllib3
+                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+            self._session = session
+        return self._session
+
+    def add(self, data, file):
+        '''
+        暂存要提交的资源, 执行结束时统一提交
+        :param data: 资源, 可以是list(多个资源)
+        :param file: 输出文件
+        '''
+        docs = data if isinstance(data, list) else [data]
+        for doc in docs:
+            if isinstance(doc, dict) and doc.get('kind') in kind2api:
+                meta = doc['metadata']
+                key = (doc['kind'], meta.get('namespace'), meta.get('name')) if meta.get('name') else len(self.docs)
+                self.docs.pop(key, None)
+                self.docs[key] = doc
+            else:
+                self.skip(file)
+
+    def skip(self, file):
+        '''
+        记录不支持提交的资源的文件, 提交时提示要用 kubectl apply 提交
+        :param file: 输出文件
+        '''
+        if file not in self.skipped:
+            self.skipped.append(file)
+
+    def submit(self):
+        '''
+        提交暂存的资源: 先提交流程模板, 再提交流程与定时流程
+        :return: 成功提交的资源数
+        '''
+        docs = list(self.docs.values())
+        self.docs = {}
+        if self.skipped:
+            log.warning(f"Argo服务器不支持提交ConfigMap/WorkflowEventBinding等资源, 请用 kubectl apply -f 提交: %s", ', '.join(self.skipped))
+            self.skipped = []
+        if not docs:
+            return 0
+        start = time.time()
+        templates = [doc for doc in docs if doc['kind'] in template_kinds]
+        flows = [doc for doc in docs if doc['kind'] not in template_kinds]
+        failures = [] # 元素为 (资源名, 原因)
+        ok = 0
+        with ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix='argo-submit') as pool:
+            # 1 流程模板
+            failed_wfts = set()
+            for doc, result in zip(templates, pool.map(self.try_submit_doc, templates)):
+                if result is None:
+                    ok += 1
+                else:
+                    failures.append((get_doc_name(doc), result))
+                    failed_wfts.add(get_wft_key(doc))
+            # 2 流程与定时流程: 引用的流程模板提交失败了则不提交
+            pending = []
+            for doc in flows:
+                refs = find_wft_refs(doc, self.get_ns(doc)) & failed_wfts
+                if refs:
+                    failures.append((get_doc_name(doc), f"引用的流程模板提交失败: {', '.join(sorted(ref[1] for ref in refs))}"))
+                else:
+                    pending.append(doc)
+            for doc, result in zip(pending, pool.map(self.try_submit_doc, pending)):
+                if result is None:
+                    ok += 1
+                else:
+                    failures.append((get_doc_name(doc), result))
+        log.info(f"已提交%s个资源到argo服务器%s, 失败%s个, 耗时%.2fs", ok, self.server, len(failures), time.time() - start)
+        if failures:
+            raise Exception(f"提交到argo服务器失败:\n" + '\n'.join(f"  {name}: {reason}" for name, reason in failures))
+        return ok
+
+    def get_ns(self, doc):
+        return doc['metadata'].get('namespace') or self.ns
+
+    def try_submit_doc(self, doc):
+        '''
+        提交单个资源, 不抛异常
+        :return: 失败原因, 成功则为None
+        '''
+        try:
+            self.submit_doc(doc)
+            return None
+        except Exception as ex:
+            return str(ex)
+
+    def submit_doc(self, doc):
+        '''
+        提交单个资源: 先创建, 已存在则更新
+        '''
+        kind = doc['kind']
+        path, key, cluster = kind2api[kind]
+        ns = self.get_ns(doc)
+        base = f"/api/v1/{path}" if cluster else f"/api/v1/{path}/{ns}"
+        if not cluster:
+            doc = {**doc, 'metadata': {**doc['metadata'], 'namespace': ns}}
+        name = doc['metadata'].get('name')
+        try:
+            res = self.request('POST', base, {key: doc}, kind != 'Workflow')
+            log.debug(f"已创建%s[%s]", kind, get_doc_name(res or doc))
+            return
+        except SubmitException as ex:
+            # 流程只创建; 其他资源已存在则更新
+            if ex.status != 409 or kind == 'Workflow' or not name:
+                raise
+        # 更新: 要带上已有资源的 resourceVersion
+        url = f"{base}/{name}"
+        old = self.request('GET', url)
+        meta = {**doc['metadata'], 'resourceVersion': old['metadata']['resourceVersion']}
+        self.request('PUT', url, {key: {**doc, 'metadata': meta}})
+        log.debug(f"已更新%s[%s]", kind, name)
+
+    def request(self, method, path, body=None, idempotent=True):
+        '''
+        发送请求, 连接出错、超时、5xx与429时重试
+        :param idempotent: 是否幂等, 非幂等的请求只在请求没发出去或服务端没处理(429/503)时重试, 以免重复创建
+        :return: 响应的json
+        '''
+        import requests
+        url = self.server + path
+        for i in range(self.retries + 1):
+            last = i == self.retries
+            try:
+                res = self.session.request(method, url, json=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if not idempotent and not is_unsent_error(ex):
+                    raise SubmitException(f"{method} {url} 出错: {ex}, 服务端可能已处理该请求, 为免重复创建不重试")
+                if last:
+                    raise SubmitException(f"{method} {url} 出错: {ex}")
+                self.sleep_backoff(i, method, url, ex)
+                continue
+            if res.status_code < 300:
+                return res.json() if res.content else None
+            if res.status_code in (retry_status if idempotent else unprocessed_status) and not last:
+                self.sleep_backoff(i, method, url, f"HTTP {res.status_code}")
+                continue
+            raise SubmitException(f"{method} {url} 失败: HTTP {res.status_code} {get_error_message(res)}", res.status_code)
+
+    def sleep_backoff(self, i, method, url, reason):
+        delay = self.backoff * (2 ** i) * (0.5 + random.random()) # 随机抖动, 以免并发请求同时重试
+        log.debug(f"%s %s 出错: %s, %.2fs后第%s次重试", method, url, reason, delay, i + 1)
+        time.sleep(delay)
+
+def is_unsent_error(ex):
+    '''
+    是否请求没发出去的错误: 连接超时或建立连接失败(如拒绝连接/域名解析失败)
+    '''
+    import requests
+    from urllib3.exceptions import ConnectTimeoutError
+    if isinstance(ex, requests.ConnectTimeout):
+        return True
+    reason = getattr(ex.args[0], 'reason', None) if ex.args else None # urllib3 的 MaxRetryError
+    return isinstance(reason, ConnectTimeoutError) # 包括子类 NewConnectionError
+
+def get_error_message(res):
+    '''
+    获得argo服务器的错误信息: 响应的json中的 message 字段
+    '''
+    try:
+        return res.json().get('message') or res.text
+    except ValueError:
+        return res.text
+
+def get_doc_name(doc):
+    meta = doc['metadata']
+    return f"{doc['kind']}/{meta.get('name') or meta.get('generateName')}"
+
+def get_wft_key(doc):
+    '''
+    流程模板的key: (命名空间, 名字), 集群级的命名空间为 ~
+    '''
+    if doc['kind'] == 'ClusterWorkflowTemplate':
+        return '~', doc['metadata']['name']
+    return doc['metadata'].get('namespace') or '', doc['metadata']['name']
+
+def find_wft_refs(doc, ns):
+    '''
+    找出资源引用的流程模板: spec.workflowTemplateRef 与 步骤/任务的 templateRef
+    :param doc: 资源
+    :param ns: 资源的命名空间
+    :return: set{(命名空间, 名字)}, 集群级的命名空间为 ~
+    '''
+    refs = []
+    spec = get_spec(doc)
+    if spec.get('workflowTemplateRef'):
+        refs.append(spec['workflowTemplateRef'])
+    for tpl in spec.get('templates', []):
+        for step in iterate_steps(tpl):
+            if step.get('templateRef'):
+                refs.append(step['templateRef'])
+    ret = set()
+    for ref in refs:
+        if ref.get('clusterScope'):
+            ret.add(('~', ref['name']))
+        else: # 流程模板可能没有指定命名空间
+            ret.add((ns, ref['name']))
+            ret.add(('', ref['name']))
+    return ret
@@ -1,20 +1,75 @@
 import re
 from abc import ABC, abstractmethod
 from typing import Union
-from pyutilb.util import md5, parse_func
+from pyutilb.util import md5
+from ArgoFlowBoot.expr import parse_func
 
 # 任务命名者, 给step/dag task命名
+#   任务表达式只转换一次key, 并维护 任务表达式->任务名 与 任务名->任务表达式 的双向索引, 查询都是O(1)
 class TaskNamer(ABC):
 
+    # 任务名的最大长度, 跟k8s资源名一样
+    max_len = 63
+
+    # 超长或重名时加的hash后缀长度
+    hash_len = 8
+
     def __init__(self):
-        self.task2name = {}
+        self.task2name = {} # 任务表达式 -> 任务名
+        self.name2task = {} # 任务名 -> 任务表达式, 用于反查(如报错信息)
+
+    # 清空状态, 如换了流程
+    def clear(self):
+        self.task2name.clear()
+        self.name2task.clear()
+
+    # 任务表达式转key
+    def get_key(self, task: Union[str, list]):
+        return task if isinstance(task, str) else str(task) # task可能是list
 
     # 获得任务名, 有缓存, 统一入口
     def get_name(self, task: Union[str, list]):
-        key = str(task) # task可能是list
-        if task not in self.task2name:
-            self.task2name[key] = self.build_name(task)
-        return self.task2name[key]
+        key = self.get_key(task)
+        name = self.task2name.get(key)
+        if name is None:
+            name = self.new_name(task)
+            self.task2name[key] = name
+        return name
+
+    def new_name(self, task: Union[str, list]):
+        '''
+        生成新的任务名, 无缓存, 如steps中同名模板的多次调用要生成不同的任务名
+            会登记到反查索引, 并保证任务名不超长且不重名
+        :param task: 任务表达式
+        :return:
+        '''
+        key = self.get_key(task)
+        name = self.build_name(task)
+        # 超长或重名: 截断并加上任务表达式的hash后缀
+        if len(name) > self.max_len or name in self.name2task:
+            name = self.add_hash_suffix(name, key)
+        self.name2task[name] = key
+        return name
+
+    def add_hash_suffix(self, name, key):
+        '''
+        加上任务表达式的hash后缀, 结果是确定的
+        :param name: 任务名
+        :param key: 任务表达式
+        :return:
+        '''
+        pref = name[:self.max_len - self.hash_len - 1]
+        i = 0
+        while True:
+            suffix = md5(key if i == 0 else f"{key}#{i}")[:self.hash_len]
+            ret = f"{pref}-{suffix}"
+            if ret not in self.name2task:
+                return ret
+            i += 1
+
+    # 反查任务表达式, 没有则返回None
+    def get_task(self, name):
+        return self.name2task.get(name)
 
     # 构建任务名, 无缓存, 子类实现
     @abstractmethod
@@ -48,6 +103,10 @@ class IncrTaskNamer(TaskNamer):
         self.incr_letter = incr_letter
         self.counter = 0
 
+    def clear(self):
+        super().clear()
+        self.counter = 0
+
     def build_name(self, task: Union[str, list]):
         # 计数+1
         self.counter += 1
@@ -68,6 +127,10 @@ class FuncIncrTaskNamer(TaskNamer):
         super().__init__()
         self.counters = {}
 
+    def clear(self):
+        super().clear()
+        self.counters.clear()
+
     def build_name(self, task: Union[str, list]):
         # 拆分出函数名
         func, _ = parse_func(task, True)
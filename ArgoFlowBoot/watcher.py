@@ -0,0 +1,287 @@
+import copy
+import os
+import time
+from pyutilb.util import get_vars, set_vars, clear_vars
+from pyutilb.file import is_http_file
+from pyutilb.log import log
+from ArgoFlowBoot.pool import list_step_files
+from ArgoFlowBoot.manifest import data_hash
+
+'''
+监视模式: 进程常驻, 轮询步骤文件及其依赖文件, 有变化时只重新生成受影响的流程
+    1 以步骤文件中的顶级动作为单位(称为块)来记录依赖, 其中流程块(wf/wft/cwft/cwf)记录执行时 Boot.add_dep() 收集的依赖文件与引用的流程模板
+    2 步骤文件变了: 非流程块(如ns/include)变了则重跑整个文件, 否则只重跑内容变了的流程块
+    3 依赖文件变了: 重跑依赖它的流程块, 非流程块依赖它则重跑整个文件
+    4 流程模板的入参变了: 重跑引用它的流程块
+    重跑时恢复块(或文件)执行前的变量与执行状态(ns/semaphores/profile, 见 Boot.get_run_state()), 而不是沿用最后执行的文件留下的
+'''
+
+# 流程动作
+flow_actions = ('wf', 'wft', 'cwft', 'cwf')
+
+class Block(object):
+    '''
+    步骤文件中的一个顶级动作
+    '''
+
+    def __init__(self, action, param):
+        self.action = action
+        self.param = param
+        self.hash = data_hash([action, param]) # 内容hash, 用于识别变化
+        self.is_flow = action.split('(', 1)[0] in flow_actions
+        # 执行时收集
+        self.deps = set() # 依赖的文件
+        self.refs = set() # 引用的流程模板
+        self.state = None # 执行前的执行状态, 即 Boot.get_run_state()
+        self.vars = {} # 执行前的变量
+
+class StepFile(object):
+    '''
+    被监视的步骤文件
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.blocks = []
+        self.state = None # 执行前的执行状态, 即 Boot.get_run_state()
+        self.vars = {} # 执行前的变量
+
+    # 上下文, 即非流程块, 变了要重跑整个文件
+    @property
+    def context(self):
+        return [(i, b.hash) for i, b in enumerate(self.blocks) if not b.is_flow]
+
+    # 整个文件依赖的文件: 非流程块的依赖
+    @property
+    def deps(self):
+        ret = set()
+        for b in self.blocks:
+            if not b.is_flow:
+                ret |= b.deps
+        return ret
+
+class Watcher(object):
+
+    def __init__(self, boot, step_files, interval=0.5):
+        '''
+        构造函数
+        :param boot: 常驻的Boot
+        :param step_files: 步骤配置文件或目录的列表
+        :param interval: 轮询间隔(秒)
+        '''
+        self.boot = boot
+        self.step_files = step_files
+        self.interval = interval
+        self.files = {} # 被监视的步骤文件, key是绝对路径
+        self.mtimes = {} # 被监视文件的修改时间
+
+    def run(self):
+        # 首次全量生成
+        start = time.time()
+        self.build()
+        log.info(f"生成完毕, 耗时 %.0f ms, 开始监视文件变化...", (time.time() - start) * 1000)
+        # 轮询
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.check()
+        except KeyboardInterrupt:
+            log.info("停止监视")
+
+    def build(self):
+        '''
+        全量生成, 并记录被监视文件的修改时间
+        :return: 生成的流程数
+        '''
+        n = 0
+        for file in self.list_files():
+            n += self.run_file(file)
+        self.boot.on_end()
+        self.snapshot()
+        return n
+
+    def list_files(self):
+        return [file if is_http_file(file) else os.path.abspath(file) for file in list_step_files(self.step_files)]
+
+    def snapshot(self):
+        '''
+        记录被监视文件的修改时间
+        '''
+        files = set()
+        for step_file in self.files.values():
+            if is_http_file(step_file.file):
+                continue
+            files.add(step_file.file)
+            for b in step_file.blocks:
+                files |= b.deps
+        self.mtimes = {file: get_mtime(file) for file in files}
+
+    def check(self):
+        '''
+        检查文件变化, 并重新生成受影响的流程
+        :return: 重新生成的流程数
+        '''
+        changed = {file for file, mtime in self.mtimes.items() if get_mtime(file) != mtime}
+        files = self.list_files()
+        added = [file for file in files if file not in self.files]
+        removed = [file for file in self.files if file not in files]
+        if not changed and not added and not removed:
+            return 0
+
+        start = time.time()
+        for file in removed:
+            del self.files[file]
+        n = 0 # 重新生成的流程数
+        wfts = dict(self.boot._wft2template_inputs)
+        # 1 步骤文件的变化
+        for file in files:
+            if file in added:
+                n += self.run_file(file)
+            elif file in changed:
+                n += self.rerun_step_file(file)
+        # 2 依赖文件(也可能是被include的步骤文件)的变化
+        if changed:
+            for file in files:
+                step_file = self.files.get(file)
+                if step_file is None or file in changed or file in added:
+                    continue
+                if step_file.deps & changed: # 非流程块依赖它
+                    n += self.run_file(file)
+                else:
+                    n += self.run_blocks(step_file, [b for b in step_file.blocks if b.is_flow and b.deps & changed])
+        # 3 流程模板入参的变化: 重跑引用它的流程块
+        done = set()
+        while True:
+            wfts2 = self.boot._wft2template_inputs
+            diff = {k for k in wfts2 if k not in done and data_hash(wfts2[k]) != data_hash(wfts.get(k))}
+            if not diff:
+                break
+            done |= diff
+            wfts = dict(wfts2)
+            for file in files:
+                step_file = self.files.get(file)
+                if step_file is not None:
+                    n += self.run_blocks(step_file, [b for b in step_file.blocks if b.is_flow and b.refs & diff])
+        self.boot.on_end()
+        self.snapshot()
+        log.info(f"检测到文件变化, 重新生成 %s 个流程, 耗时 %.0f ms", n, (time.time() - start) * 1000)
+        return n
+
+    def rerun_step_file(self, file):
+        '''
+        步骤文件变了: 非流程块变了则重跑整个文件, 否则只重跑内容变了的流程块
+        :return: 重新生成的流程数
+        '''
+        old = self.files[file]
+        try:
+            steps = self.boot.read_cached_step_file(file)
+        except Exception as ex:
+            log.error(f"Fail to load step file: %s", file, exc_info=ex)
+            return 0
+        new = StepFile(file)
+        new.state = old.state
+        new.vars = old.vars
+        new.blocks = self.build_blocks(steps)
+        if new.context != old.context:
+            return self.run_file(file, steps)
+        # 继承未变的流程块
+        hash2block = {b.hash: b for b in old.blocks if b.is_flow}
+        blocks = []
+        for i, b in enumerate(new.blocks):
+            if b.hash in hash2block:
+                new.blocks[i] = hash2block.pop(b.hash)
+            elif b.is_flow:
+                # 新流程块沿用所在位置的上下文
+                prev = old.blocks[i] if i < len(old.blocks) else (old.blocks[-1] if old.blocks else None)
+                if prev is not None:
+                    b.state = prev.state
+                    b.vars = prev.vars
+                blocks.append(b)
+        self.files[file] = new
+        return self.run_blocks(new, blocks)
+
+    def build_blocks(self, steps):
+        blocks = []
+        for step in steps or []:
+            for action, param in step.items():
+                blocks.append(Block(action, param))
+        return blocks
+
+    def run_file(self, file, steps=None):
+        '''
+        执行整个步骤文件
+        :return: 生成的流程数
+        '''
+        step_file = StepFile(file)
+        # 重跑时恢复执行前的上下文
+        old = self.files.get(file)
+        if old is not None:
+            self.boot.set_run_state(old.state)
+            clear_vars('*')
+            set_vars(old.vars)
+        step_file.state = self.boot.get_run_state()
+        step_file.vars = get_vars(True)
+        self.files[file] = step_file
+        try:
+            if steps is None:
+                steps = self.boot.read_cached_step_file(file)
+        except Exception as ex:
+            log.error(f"Fail to load step file: %s", file, exc_info=ex)
+            return 0
+        step_file.blocks = self.build_blocks(steps)
+        n = 0
+        for b in step_file.blocks:
+            b.state = self.boot.get_run_state()
+            b.vars = get_vars(True)
+            if self.run_block(step_file, b) and b.is_flow:
+                n += 1
+        return n
+
+    def run_blocks(self, step_file, blocks):
+        '''
+        执行多个流程块
+        :return: 生成的流程数
+        '''
+        n = 0
+        for b in blocks:
+            # 恢复执行前的上下文
+            self.boot.set_run_state(b.state)
+            clear_vars('*')
+            set_vars(b.vars)
+            if self.run_block(step_file, b):
+                n += 1
+        return n
+
+    def run_block(self, step_file, block):
+        '''
+        执行单个块, 并收集其依赖
+        :return: 是否成功
+        '''
+        boot = self.boot
+        file = step_file.file
+        # 步骤文件目录作为当前目录, 跟 YamlBoot.run_1file() 一样
+        boot.step_file = file
+        boot.step_dir = os.path.dirname(file)
+        cur_dir = os.getcwd()
+        os.chdir(boot.step_dir)
+        boot._deps = []
+        boot._wft_refs = {}
+        try:
+            boot.run_action(block.action, copy.deepcopy(block.param)) # 拷贝: 动作会修改参数, 而重跑要用原参数
+            return True
+        except Exception as ex:
+            log.error(f"Exception occurs: current step file is %s", file, exc_info=ex)
+            boot.clear_flow()
+            return False
+        finally:
+            os.chdir(cur_dir)
+            block.deps = set(boot._deps)
+            block.refs = set(boot._wft_refs)
+
+# 文件的修改时间, 文件不存在则为None
+def get_mtime(file):
+    try:
+        st = os.stat(file)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
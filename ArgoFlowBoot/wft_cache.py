@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from pyutilb.cmd import run_command
+from pyutilb.file import read_file
+from pyutilb.log import log
+from ArgoFlowBoot.emitter import write_file_if_changed
+
+'''
+远程流程模板(WorkflowTemplate/ClusterWorkflowTemplate)的签名(即流程入参+模板入参)
+    1 批量拉取: 一次性拉取命名空间下的所有流程模板, 而不是每引用一个就调用一次 argo template get
+    2 磁盘缓存: 拉取的签名缓存到 ~/.cache/ArgoFlowBoot/wft-signatures.json, 在有效期内直接复用, 无需访问集群
+'''
+
+def fetch_argo_wfts(ns, cluster=False):
+    '''
+    批量拉取流程模板定义
+        argo template list 只支持输出名字, 因此先列出名字, 再用一次 argo template get 获得所有流程模板的json
+    :param ns: 命名空间
+    :param cluster: 是否ClusterWorkflowTemplate
+    :return: 流程模板定义的列表
+    '''
+    if cluster:
+        res = 'cluster-template'
+        ns_option = ''
+    else:
+        res = 'template'
+        ns_option = f' -n {ns}'
+    # 1 列出名字
+    cmd = f"argo {res} list{ns_option} -o name"
+    names = run_command(cmd).split()
+    if not names:
+        log.debug(f"No WorkflowTemplate found by command: %s", cmd)
+        return []
+    # 2 获得所有流程模板: 输出多个连在一起的json
+    cmd = f"argo {res} get {' '.join(names)}{ns_option} -o json"
+    txt = run_command(cmd)
+    if not txt:
+        raise Exception(f"无法通过命令获得流程模板定义: {cmd}")
+    return parse_json_stream(txt)
+
+def parse_json_stream(txt):
+    '''
+    解析多个连在一起的json
+    :param txt:
+    :return: list
+    '''
+    decoder = json.JSONDecoder()
+    ret = []
+    i = 0
+    n = len(txt)
+    while True:
+        # 跳过空白
+        while i < n and txt[i].isspace():
+            i += 1
+        if i >= n:
+            return ret
+        obj, i = decoder.raw_decode(txt, i)
+        ret.append(obj)
+
+class WftSignatureCache(object):
+
+    def __init__(self, ttl=600, refresh=False, file=None):
+        '''
+        构造函数
+        :param ttl: 缓存有效期(秒), <=0 则不用缓存
+        :param refresh: 是否强制刷新, 即忽略已缓存的签名, 重新拉取
+        :param file: 缓存文件
+        '''
+        self.ttl = ttl
+        self.refresh = refresh
+        self.file = file or default_cache_file()
+        self.entries = None # 延迟加载
+        self.changed = False
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def load(self):
+        if self.entries is not None:
+            return self.entries
+        self.entries = {}
+        if self.enabled and os.path.isfile(self.file):
+            try:
+                self.entries = json.loads(read_file(self.file))
+            except ValueError: # 缓存损坏则忽略
+                log.warning(f"Ignore broken WorkflowTemplate cache file: %s", self.file)
+        return self.entries
+
+    def get(self, ns, wft):
+        '''
+        获得缓存的流程模板签名
+        :param ns: 命名空间
+        :param wft: 流程模板名，如果是~开头，则为ClusterWorkflowTemplate
+        :return: 流程模板签名, 即 dict{模板名: 模板入参名}, key=''表示流程级输入参数名; 没缓存或过期则返回None
+        '''
+        if not self.enabled or self.refresh:
+            return None
+        entry = self.load().get(self.build_key(ns, wft))
+        if entry is None or time.time() - entry['time'] > self.ttl:
+            return None
+        return entry['inputs']
+
+    def put(self, ns, wft, inputs):
+        '''
+        缓存流程模板签名
+        :param ns: 命名空间
+        :param wft: 流程模板名，如果是~开头，则为ClusterWorkflowTemplate
+        :param inputs: 流程模板签名
+        '''
+        if not self.enabled:
+            return
+        self.load()[self.build_key(ns, wft)] = {
+            'time': time.time(),
+            'inputs': inputs,
+        }
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        dir = os.path.dirname(self.file)
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+        # 清理过期的
+        now = time.time()
+        entries = {k: v for k, v in self.entries.items() if now - v['time'] <= self.ttl}
+        write_file_if_changed(self.file, json.dumps(entries, indent=1, sort_keys=True))
+        self.changed = False
+
+    def build_key(self, ns, wft):
+        '''
+        缓存key: kubeconfig + 命名空间 + 流程模板名, 其中ClusterWorkflowTemplate不分命名空间
+        '''
+        if wft.startswith('~'):
+            ns = ''
+        return f"{os.environ.get('KUBECONFIG', '')}|{ns}|{wft}"
+
+# 默认的缓存目录
+def default_cache_dir():
+    dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(dir, 'ArgoFlowBoot')
+
+# 默认的缓存文件
+def default_cache_file():
+    return os.path.join(default_cache_dir(), 'wft-signatures.json')
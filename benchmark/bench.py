@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+'''
+生成器的基准测试: 合成指定规模的步骤文件, 分阶段统计生成耗时, 并与基准结果比较
+    1 语料: 大量模板, 有大量依赖边的dag, 深层嵌套的steps, 大的withItems, 大量引用流程模板(本地定义的流程模板作为替身),
+           选项树大且多处引用变量的模板(测变量替换与函数调用解析)
+    2 阶段: build_template, build_dag_deps, build_steps, build_flow, save_yaml, 嵌套调用只统计最外层
+    3 结果保存为json, 与基准结果比较, 变慢超过阈值则标记为退化
+用法:
+    python benchmark/bench.py                              # 执行并与 benchmark/baseline.json 比较
+    python benchmark/bench.py --scale 4 --repeat 5         # 放大语料规模
+    python benchmark/bench.py --save-baseline              # 保存为基准结果
+    python benchmark/bench.py --corpus dag --corpus steps  # 只执行指定语料
+'''
+
+# 项目根目录
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+# 统计的阶段, 即 Boot 的方法
+phases = ['build_template', 'build_dag_deps', 'build_steps', 'build_flow', 'save_yaml']
+
+# 默认的基准结果文件
+default_baseline = os.path.join(root_dir, 'benchmark', 'baseline.json')
+
+# ------------------------ 合成语料 ------------------------
+def gen_templates(scale):
+    '''
+    大量模板: N个容器模板, main并行调用所有模板
+    '''
+    n = 200 * scale
+    lines = ["- wf(bench-templates):", "    - templates:"]
+    for i in range(n):
+        lines += [
+            f"        t{i}(msg):",
+            f"            container:",
+            f"              image: alpine:3.{i % 10}",
+            f"              command: echo t{i} $msg",
+            f"              resources: {{cpu: 0.1~0.5, memory: 100Mi~200Mi}}",
+        ]
+    lines += ["        main():", "            steps:", "            - - t0(start)"]
+    lines += [f"              - t{i}(m{i})" for i in range(1, n)]
+    return "\n".join(lines) + "\n"
+
+def gen_dag(scale):
+    '''
+    dag: N个节点, M条依赖边(只从小序号指向大序号, 保证无环)
+    '''
+    n = 100 * scale
+    m = 300 * scale
+    rand = random.Random(n)
+    lines = ["- wf(bench-dag):", "    - templates:",
+             "        echo(msg):", "            container:", "              command: echo $msg",
+             "        main():", "            dag:"]
+    # 保证所有节点都出现
+    edges = [(i, i + 1) for i in range(n - 1)]
+    while len(edges) < m:
+        i = rand.randrange(n - 1)
+        edges.append((i, rand.randrange(i + 1, n)))
+    lines += [f"               - echo(n{i}) -> echo(n{j})" for i, j in edges]
+    return "\n".join(lines) + "\n"
+
+def gen_steps(scale):
+    '''
+    深层嵌套的steps: 模板链 s0 -> s1 -> ... 每个模板的steps有多组串行与并行步骤
+    '''
+    depth = 30 * scale
+    width = 5
+    lines = ["- wf(bench-steps):", "    - templates:",
+             "        echo(msg):", "            container:", "              command: echo $msg"]
+    for d in range(depth, -1, -1): # 被调用的模板要先定义
+        name = 'main' if d == 0 else f's{d}'
+        lines += [f"        {name}():", "            steps:"]
+        for w in range(width):
+            lines += [f"            - - echo(d{d}-w{w}-a)", f"              - echo(d{d}-w{w}-b)"]
+        if d < depth:
+            lines += [f"            - - s{d + 1}()"]
+    return "\n".join(lines) + "\n"
+
+def gen_with_items(scale):
+    '''
+    大的withItems: 一个步骤遍历N个元素
+    '''
+    n = 2000 * scale
+    lines = ["- wf(bench-items):", "    - templates:",
+             "        cat(image,tag):", "            container:", "              image: $image:$tag", "              command: cat /etc/os-release",
+             "        main():", "            steps:",
+             "            - - template: cat({{item.image}},{{item.tag}})",
+             "                withItems:"]
+    lines += [f"                  - {{ image: 'img{i}', tag: '{i % 17}.{i % 5}' }}" for i in range(n)]
+    return "\n".join(lines) + "\n"
+
+def gen_wft_refs(scale):
+    '''
+    大量引用流程模板: 本地定义的流程模板作为替身, 流程调用其中的模板
+    '''
+    n_tpls = 50
+    n_refs = 300 * scale
+    lines = ["- wft(bench-lib):", "    - templates:"]
+    for i in range(n_tpls):
+        lines += [f"        lib{i}(a,b):", "            container:", f"              command: echo lib{i} $a $b"]
+    lines += ["- wf(bench-refs):", "    - templates:", "        main():", "            steps:"]
+    for i in range(n_refs):
+        lines += [f"            - - bench-lib.lib{i % n_tpls}(x{i},y{i})"]
+    return "\n".join(lines) + "\n"
+
+def gen_vars(scale):
+    '''
+    选项树大且多处引用变量的模板: 每个模板有多个环境变量/资源/重试选项, 部分值引用变量, main以不同参数调用所有模板
+    '''
+    n = 200 * scale
+    lines = ["- set_vars:", "    registry: docker.io/library", "    tag: '3.18'", "    env: {region: cn, zone: a}",
+             "- wf(bench-vars):", "    - templates:"]
+    for i in range(n):
+        lines += [
+            f"        v{i}(msg, level):",
+            f"            container:",
+            f"              image: $registry/alpine:${{tag}}",
+            f"              command: echo v{i} ${{msg}} $level",
+            f"              env:",
+        ]
+        lines += [f"                K{j}: {'${env.region}-' if j % 3 == 0 else ''}v{i}-{j}" for j in range(8)]
+        lines += [
+            f"              resources: {{cpu: 0.1~0.5, memory: 100Mi~200Mi}}",
+            f"            retryStrategy:",
+            f"              limit: 2",
+            f"              retryPolicy: Always",
+            f"              backoff: {{duration: 1s, factor: 2, maxDuration: 1m}}",
+        ]
+    lines += ["        main():", "            steps:", "            - - v0(start, $tag)"]
+    lines += [f"              - v{i}(m{i}, info)" for i in range(1, n)]
+    return "\n".join(lines) + "\n"
+
+corpora = {
+    'templates': gen_templates,
+    'dag': gen_dag,
+    'steps': gen_steps,
+    'items': gen_with_items,
+    'wft_refs': gen_wft_refs,
+    'vars': gen_vars,
+}
+
+# ------------------------ 分阶段计时 ------------------------
+class PhaseTimer(object):
+
+    def __init__(self):
+        self.times = {}
+        self.depths = {}
+
+    def wrap(self, phase, func):
+        '''
+        包装方法来计时, 嵌套(递归)调用只统计最外层
+        '''
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            depth = self.depths.get(phase, 0)
+            self.depths[phase] = depth + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.depths[phase] = depth
+                if depth == 0:
+                    self.times[phase] = self.times.get(phase, 0) + time.perf_counter() - start
+        return wrapper
+
+    def install(self, cls):
+        '''
+        给类的方法装上计时, 要在创建实例前调用, 因为实例会缓存绑定方法(如 template_body_builders)
+        :return: 原方法, 用于卸载
+        '''
+        originals = {}
+        for phase in phases:
+            originals[phase] = cls.__dict__[phase]
+            setattr(cls, phase, self.wrap(phase, originals[phase]))
+        return originals
+
+def run_corpus(file, repeat):
+    '''
+    执行语料, 重复多次, 各阶段取最快的一次
+    :return: dict{阶段: 秒数}, 其中total为整体耗时
+    '''
+    from ArgoFlowBoot.boot import Boot
+    from pyutilb.util import clear_vars
+    best = None
+    for _ in range(repeat):
+        timer = PhaseTimer()
+        originals = timer.install(Boot)
+        out = tempfile.mkdtemp(prefix='bench-out-') # 每次都用新的输出目录, 以免跳过内容相同的文件
+        try:
+            clear_vars('*')
+            boot = Boot(out)
+            start = time.perf_counter()
+            boot.run([file])
+            timer.times['total'] = time.perf_counter() - start
+        finally:
+            for phase, func in originals.items():
+                setattr(Boot, phase, func)
+            shutil.rmtree(out, ignore_errors=True)
+        if best is None:
+            best = timer.times
+        else:
+            best = {k: min(v, timer.times.get(k, v)) for k, v in best.items()}
+    return {k: round(v, 6) for k, v in best.items()}
+
+# ------------------------ 比较 ------------------------
+def compare(results, baseline, threshold, min_delta):
+    '''
+    与基准结果比较
+    :param threshold: 变慢的比例阈值, 如0.2表示变慢20%
+    :param min_delta: 变慢的最小秒数, 太小的变化视为噪声
+    :return: 退化的列表[(语料, 阶段, 基准秒数, 当前秒数)]
+    '''
+    regressions = []
+    for corpus, times in results.items():
+        base_times = baseline.get(corpus)
+        if not base_times:
+            continue
+        for phase, t in times.items():
+            base = base_times.get(phase)
+            if base is None:
+                continue
+            if t - base > min_delta and t > base * (1 + threshold):
+                regressions.append((corpus, phase, base, t))
+    return regressions
+
+def print_table(results, baseline):
+    cols = ['total'] + phases
+    print(f"{'corpus':<10}" + ''.join(f"{c:>16}" for c in cols))
+    for corpus, times in results.items():
+        row = f"{corpus:<10}"
+        for c in cols:
+            t = times.get(c)
+            cell = '-' if t is None else f"{t * 1000:.1f}ms"
+            base = baseline.get(corpus, {}).get(c)
+            if t is not None and base:
+                cell += f"({(t / base - 1) * 100:+.0f}%)"
+            row += f"{cell:>16}"
+        print(row)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ArgoFlowBoot generation on synthetic corpora')
+    parser.add_argument('--scale', type=int, default=1, help='Scale factor of the synthetic corpora')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs per corpus, the fastest one is kept')
+    parser.add_argument('--corpus', action='append', choices=list(corpora), help='Corpus to run, can be repeated, default all')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--baseline', default=default_baseline, help='Baseline JSON file to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Flag a phase as regressed when it is this ratio slower than the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=2, help='Ignore slowdowns smaller than this many milliseconds')
+    option = parser.parse_args()
+
+    # 日志只记警告以上, 以免日志耗时干扰
+    from pyutilb.log import log
+    log.setLevel('WARNING')
+
+    names = option.corpus or list(corpora)
+    work_dir = tempfile.mkdtemp(prefix='bench-')
+    results = {}
+    try:
+        for name in names:
+            file = os.path.join(work_dir, f"{name}.yml")
+            with open(file, 'w', encoding='utf-8') as f:
+                f.write(corpora[name](option.scale))
+            results[name] = run_corpus(file, option.repeat)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'scale': option.scale,
+            'repeat': option.repeat,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+    txt = json.dumps(data, indent=1, sort_keys=True)
+    if option.output:
+        with open(option.output, 'w', encoding='utf-8') as f:
+            f.write(txt)
+
+    # 加载基准结果: 规模不同则不比较
+    baseline = {}
+    if not option.save_baseline and os.path.isfile(option.baseline):
+        with open(option.baseline, encoding='utf-8') as f:
+            base_data = json.load(f)
+        if base_data['meta'].get('scale') == option.scale:
+            baseline = base_data['results']
+        else:
+            print(f"基准结果的规模为{base_data['meta'].get('scale')}, 跟当前规模{option.scale}不同, 不比较")
+
+    print_table(results, baseline)
+
+    if option.save_baseline:
+        with open(option.baseline, 'w', encoding='utf-8') as f:
+            f.write(txt)
+        print(f"已保存基准结果: {option.baseline}")
+        return
+
+    regressions = compare(results, baseline, option.threshold, option.min_delta_ms / 1000)
+    for corpus, phase, base, t in regressions:
+        print(f"退化: {corpus}.{phase} {base * 1000:.1f}ms -> {t * 1000:.1f}ms ({(t / base - 1) * 100:+.0f}%)")
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+'''
+冷启动的导入耗时检查: 用 python -X importtime 统计导入 ArgoFlowBoot.boot 的耗时
+    1 耗时超过预算则失败, 默认预算380ms: 延迟加载重型依赖后约300ms, 之前约410ms, 预算要能发现退回之前的水平
+    2 延迟加载的重型依赖(如k8sboot/kubernetes/curl解析)在导入时就被加载了, 也失败
+用法:
+    python benchmark/coldstart.py
+    python benchmark/coldstart.py --budget-ms 350 --runs 10 --top 20
+'''
+
+# 项目根目录
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入时不应该加载的模块: 只有构建容器/定时选项/curl请求时才加载
+lazy_modules = ['K8sBoot', 'K8sBoot.boot', 'kubernetes', 'pyutilb.curl']
+
+# -X importtime 的输出行, 如 import time:       662 |       5605 |           tempfile
+line_pattern = re.compile(r'^import time:\s*(\d+)\s*\|\s*(\d+)\s*\|( *)(\S+)')
+
+def run_importtime(code):
+    '''
+    在子进程中执行代码, 并解析 -X importtime 的输出
+    :param code: python代码
+    :return: list[(模块名, 自身耗时(微秒), 累计耗时(微秒), 层级)]
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root_dir + os.pathsep + env.get('PYTHONPATH', '')
+    cmd = [sys.executable, '-X', 'importtime', '-c', code]
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise Exception(f"执行代码[{code}]失败: {proc.stderr}")
+    ret = []
+    for line in proc.stderr.splitlines():
+        mat = line_pattern.match(line)
+        if mat is not None:
+            ret.append((mat.group(4), int(mat.group(1)), int(mat.group(2)), len(mat.group(3))))
+    return ret
+
+def measure(module, startup_modules):
+    '''
+    统计导入模块的耗时
+    :param module: 模块名
+    :param startup_modules: 解释器启动时就导入的模块, 不计入
+    :return: (总耗时(微秒), dict{模块名: 自身耗时(微秒)})
+    '''
+    total = 0
+    selfs = {}
+    for name, self_us, cumulative_us, level in run_importtime(f'import {module}'):
+        if name in startup_modules:
+            continue
+        selfs[name] = self_us
+        # 顶级导入的累计耗时之和即为总耗时
+        if level == 1:
+            total += cumulative_us
+    return total, selfs
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the cold start import time of ArgoFlowBoot')
+    parser.add_argument('--module', default='ArgoFlowBoot.boot', help='Module to import')
+    parser.add_argument('--budget-ms', type=float, default=380, help='Import time budget in milliseconds, default 380: about 300ms after the lazy imports, about 410ms before')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs, the fastest one is reported')
+    parser.add_argument('--top', type=int, default=15, help='Number of slowest modules to print')
+    option = parser.parse_args()
+
+    # 解释器启动时就导入的模块
+    startup_modules = {item[0] for item in run_importtime('pass')}
+    # 多次执行取最快的一次, 以减少干扰
+    results = [measure(option.module, startup_modules) for _ in range(option.runs)]
+    total, selfs = min(results, key=lambda r: r[0])
+    total_ms = total / 1000
+
+    print(f"导入 {option.module} 耗时: {total_ms:.1f} ms (预算 {option.budget_ms:.0f} ms, 共{option.runs}次取最快)")
+    print(f"自身耗时最多的{option.top}个模块:")
+    for name, us in sorted(selfs.items(), key=lambda item: -item[1])[:option.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    ok = True
+    loaded = [name for name in lazy_modules if name in selfs]
+    if loaded:
+        print(f"失败: 导入时加载了应延迟加载的模块: {', '.join(loaded)}")
+        ok = False
+    if total_ms > option.budget_ms:
+        print(f"失败: 导入耗时 {total_ms:.1f} ms 超过预算 {option.budget_ms:.0f} ms")
+        ok = False
+    if ok:
+        print("通过")
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
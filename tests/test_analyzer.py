@@ -0,0 +1,46 @@
+import pytest
+from ArgoFlowBoot.analyzer import FlowAnalyzer
+from ArgoFlowBoot.dag_parser import parse_depends
+
+'''
+流程分析(--analyze)的测试
+'''
+
+def build_flow(tasks):
+    templates = [
+        {'name': 'work', 'container': {'image': 'alpine'}},
+        {'name': 'main', 'dag': {'tasks': tasks}},
+    ]
+    return {'kind': 'Workflow', 'metadata': {'name': 'test'}, 'spec': {'entrypoint': 'main', 'templates': templates}}
+
+def test_parse_depends():
+    assert parse_depends('A && (B.Succeeded || !C-1.Failed) && A') == ['A', 'B', 'C-1']
+
+def test_dag_depends():
+    # A -> (B, C) -> D, 其中D用 depends 表达式
+    tasks = [
+        {'name': 'A', 'template': 'work'},
+        {'name': 'B', 'template': 'work', 'dependencies': ['A']},
+        {'name': 'C', 'template': 'work', 'depends': 'A.Succeeded'},
+        {'name': 'D', 'template': 'work', 'depends': 'B && (C.Succeeded || C.Skipped)'},
+    ]
+    report = FlowAnalyzer().analyse(build_flow(tasks), {'work': 10})
+    assert report['makespan_seconds'] == 30
+    assert report['max_width'] == 2
+    assert report['depth'] == 3
+
+def test_suspend_var_duration():
+    flow = build_flow([{'name': 'A', 'template': 'wait'}])
+    flow['spec']['templates'].insert(0, {'name': 'wait', 'suspend': {'duration': '{{inputs.parameters.sec}}'}})
+    report = FlowAnalyzer(default_duration=5).analyse(flow)
+    assert report['makespan_seconds'] == 5
+    assert report['max_width'] == 0
+    assert report['unhinted_templates'] == ['wait']
+
+def test_dag_cycle():
+    tasks = [
+        {'name': 'A', 'template': 'work', 'depends': 'B'},
+        {'name': 'B', 'template': 'work', 'dependencies': ['A']},
+    ]
+    with pytest.raises(Exception, match='存在环'):
+        FlowAnalyzer().analyse(build_flow(tasks), {'work': 10})
@@ -0,0 +1,69 @@
+import pytest
+from ArgoFlowBoot.dag_parser import parse_deps, split_line, parse_depends, check_cycle, find_cycle
+
+'''
+dag依赖关系表达式的解析(dag_parser)的测试
+'''
+
+def test_split_line():
+    assert split_line('echo(A) -> echo(B);echo(C) -> echo(D)') == [['echo(A)'], ['echo(B)', 'echo(C)'], ['echo(D)']]
+    # 分隔符两边的空格, 空的点, 点内重复的节点
+    assert split_line(' a ; b ->  -> c;c ') == [['a', 'b'], ['c']]
+
+def test_split_line_quotes_brackets():
+    # 括号与引号内的 -> ; 不作为分隔符
+    assert split_line("echo('a;b') -> echo(\"x->y\")") == [["echo('a;b')"], ['echo("x->y")']]
+    assert split_line('f(g(1;2), h(3)) -> k') == [['f(g(1;2),h(3))'], ['k']]
+    assert split_line('''echo("it's") -> echo('say "hi"')''') == [['echo("it\'s")'], ['echo(\'say "hi"\')']]
+
+@pytest.mark.parametrize('line', [
+    "echo(it's) -> b", # 参数中的单引号: 之前当作普通字符, 现在当作引号, 不匹配则报错
+    'echo(a -> b',
+    'echo(a)) -> b',
+    'echo("a) -> b',
+])
+def test_split_line_unmatched(line):
+    with pytest.raises(Exception, match='括号或引号不匹配'):
+        split_line(line)
+
+def test_parse_deps():
+    nodes, deps = parse_deps([
+        'a;b -> c',
+        'a;b -> c', # 重复的行: 依赖关系去重
+        'b -> c -> d',
+        'e',
+    ])
+    assert nodes == ['a', 'b', 'c', 'd', 'e']
+    assert deps == {'a': [], 'b': [], 'c': ['a', 'b'], 'd': ['c'], 'e': []}
+
+def test_parse_depends():
+    assert parse_depends('A && (B.Succeeded || !C.Failed) && A.Failed') == ['A', 'B', 'C']
+    assert parse_depends(None) == []
+
+def test_check_cycle():
+    # 拓扑排序: 依赖节点在前
+    assert check_cycle({'c': ['a', 'b'], 'd': ['c'], 'a': [], 'b': ['a']}) == ['a', 'b', 'c', 'd']
+    # 依赖了没声明的节点
+    assert check_cycle({'b': ['a']}) == ['a', 'b']
+
+def rotations(cycle):
+    '''
+    环的所有旋转: 找环的起点取决于集合的遍历顺序
+    '''
+    nodes = cycle[:-1]
+    return [nodes[i:] + nodes[:i] + [nodes[i]] for i in range(len(nodes))]
+
+def test_find_cycle():
+    # b依赖a, c依赖b, a依赖c
+    deps = {'a': ['c'], 'b': ['a'], 'c': ['b'], 'd': ['a']}
+    assert find_cycle(deps, {'a', 'b', 'c'}) in rotations(['a', 'b', 'c', 'a'])
+    # 剩下的节点不全在环上: d依赖环, 但不在环上
+    assert find_cycle(deps, {'a', 'b', 'c', 'd'}) in rotations(['a', 'b', 'c', 'a'])
+
+def test_check_cycle_error():
+    with pytest.raises(Exception) as ex:
+        check_cycle({'a': ['b'], 'b': ['a'], 'c': []})
+    assert str(ex.value) in [f"dag依赖关系存在环: {' -> '.join(c)}" for c in rotations(['a', 'b', 'a'])]
+    # 自环, 并自定义节点显示
+    with pytest.raises(Exception, match=r'^dag依赖关系存在环: <a> -> <a>$'):
+        check_cycle({'a': ['a']}, label=lambda node: f"<{node}>")
@@ -0,0 +1,129 @@
+import pytest
+from ArgoFlowBoot.dedup import TemplateDeduper, fingerprint, replace_calls
+from tests.test_pool import run_boot
+
+'''
+跨流程的模板去重(--dedup)的测试
+'''
+
+def container(cmd, name='echo'):
+    return {'name': name, 'container': {'image': 'alpine', 'command': ['sh', '-c', cmd]}}
+
+def build_flow(name, templates, ns=None, kind='Workflow', **spec):
+    main = {'name': 'main', 'steps': [[{'name': tpl['name'], 'template': tpl['name'], 'arguments': {'parameters': []}} for tpl in templates]]}
+    spec = {'entrypoint': 'main', 'templates': [main] + templates, **spec}
+    meta = {'name': name}
+    if ns:
+        meta['namespace'] = ns
+    if kind == 'CronWorkflow':
+        spec = {'schedule': '* * * * *', 'workflowSpec': spec}
+    return {'apiVersion': 'argoproj.io/v1alpha1', 'kind': kind, 'metadata': meta, 'spec': spec}
+
+def dedup(*flows):
+    deduper = TemplateDeduper()
+    for flow in flows:
+        deduper.add(flow, flow['metadata']['name'] + '.yml')
+    return deduper.dedup()
+
+def shared_names(wft):
+    return [tpl['name'] for tpl in wft['spec']['templates']]
+
+def local_names(flow):
+    spec = flow['spec'].get('workflowSpec', flow['spec'])
+    return [tpl['name'] for tpl in spec['templates']]
+
+def test_fingerprint():
+    # 指纹不含模板名, 且跟字段顺序无关
+    assert fingerprint(container('echo 1', 'a')) == fingerprint(container('echo 1', 'b'))
+    assert fingerprint({'name': 'a', 'x': 1, 'y': 2}) == fingerprint({'y': 2, 'x': 1, 'name': 'a'})
+    assert fingerprint(container('echo 1')) != fingerprint(container('echo 2'))
+
+def test_group_by_fingerprint():
+    # 跨流程相同的模板(即使名字不同)才移走, 只出现在一个流程中的保留
+    flow1 = build_flow('flow1', [container('echo 1', 'a'), container('echo only1', 'b')])
+    flow2 = build_flow('flow2', [container('echo 1', 'c')], kind='CronWorkflow')
+    ret = dedup(flow1, flow2)
+    assert [file for _, file in ret] == ['argoflowboot-shared.yml', 'flow1.yml', 'flow2.yml']
+    wft = ret[0][0]
+    assert wft['kind'] == 'WorkflowTemplate' and wft['metadata'] == {'name': 'argoflowboot-shared', 'labels': {'flow': 'argoflowboot-shared'}}
+    assert wft['spec']['templates'] == [container('echo 1', 'a')]
+    assert local_names(flow1) == ['main', 'b']
+    assert local_names(flow2) == ['main']
+
+def test_no_shared():
+    flow1 = build_flow('flow1', [container('echo 1')])
+    flow2 = build_flow('flow2', [container('echo 2')])
+    assert dedup(flow1, flow2) == [(flow1, 'flow1.yml'), (flow2, 'flow2.yml')]
+    assert local_names(flow1) == ['main', 'echo']
+    assert TemplateDeduper().dedup() == []
+
+def test_exclude_entry_and_exit():
+    # 入口模板与(流程级/步骤级)退出处理模板不移走
+    exit_tpl = container('echo exit', 'exit')
+    step_exit = container('echo step-exit', 'step-exit')
+    flows = []
+    for name in ('flow1', 'flow2'):
+        flow = build_flow(name, [container('echo 1')], onExit='exit')
+        flow['spec']['templates'][0]['steps'][0][0]['onExit'] = 'step-exit'
+        flow['spec']['templates'] += [exit_tpl, step_exit]
+        flows.append(flow)
+    # 入口模板是叶子模板
+    leaf1 = build_flow('flow3', [], entrypoint='echo')
+    leaf1['spec']['templates'] = [container('echo entry')]
+    leaf2 = build_flow('flow4', [], entrypoint='echo')
+    leaf2['spec']['templates'] = [container('echo entry')]
+    ret = dedup(*flows, leaf1, leaf2)
+    assert shared_names(ret[0][0]) == ['echo']
+    assert local_names(flows[0]) == ['main', 'exit', 'step-exit']
+    assert local_names(leaf1) == ['echo']
+
+def test_rename_on_collision():
+    # 同名但内容不同的两个共享模板: 后者加上指纹后缀
+    a1 = container('echo 1')
+    a2 = container('echo 2')
+    flows = [build_flow('flow0', [dict(a1)]), build_flow('flow1', [dict(a1)]), build_flow('flow2', [dict(a2)]), build_flow('flow3', [dict(a2)])]
+    ret = dedup(*flows)
+    suffix = fingerprint(a2)[:8]
+    assert shared_names(ret[0][0]) == ['echo', 'echo-' + suffix]
+    refs = [flow['spec']['templates'][0]['steps'][0][0]['templateRef'] for flow in flows]
+    assert refs == [{'name': 'argoflowboot-shared', 'template': name} for name in ('echo', 'echo', 'echo-' + suffix, 'echo-' + suffix)]
+
+def test_shared_wft_per_namespace():
+    # 每个命名空间一个共享流程模板
+    tpl = container('echo 1')
+    flows = [build_flow('flow1', [dict(tpl)], ns='a'), build_flow('flow2', [dict(tpl)], ns='b'), build_flow('flow3', [dict(tpl)], ns='a')]
+    ret = dedup(*flows)
+    assert [file for _, file in ret[:2]] == ['argoflowboot-shared-a.yml', 'argoflowboot-shared-b.yml']
+    assert [wft['metadata']['namespace'] for wft, _ in ret[:2]] == ['a', 'b']
+    assert [shared_names(wft) for wft, _ in ret[:2]] == [['echo'], ['echo']]
+    assert all(local_names(flow) == ['main'] for flow in flows)
+
+def test_replace_calls():
+    # 调用处改为 templateRef, 保持字段顺序
+    templates = [
+        {'name': 'main', 'steps': [[{'name': 's1', 'template': 'a', 'arguments': {}}], {'name': 's2', 'template': 'b', 'when': 'x'}]},
+        {'name': 'dag', 'dag': {'tasks': [{'name': 't1', 'depends': 's1', 'template': 'a', 'withItems': [1]}]}},
+    ]
+    replace_calls(templates, {'a': 'a-shared'}, 'wft')
+    s1 = templates[0]['steps'][0][0]
+    assert list(s1.items()) == [('name', 's1'), ('templateRef', {'name': 'wft', 'template': 'a-shared'}), ('arguments', {})]
+    assert templates[0]['steps'][1] == {'name': 's2', 'template': 'b', 'when': 'x'}
+    t1 = templates[1]['dag']['tasks'][0]
+    assert list(t1) == ['name', 'depends', 'templateRef', 'withItems']
+
+def test_cli(tmp_path):
+    flow = '''- wf({name}):
+    - templates:
+        echo(msg):
+          container:
+            command: echo $msg
+        main():
+          steps:
+            - - echo(hi)
+'''
+    (tmp_path / 'flows.yml').write_text(flow.format(name='flow1') + flow.format(name='flow2'), encoding='utf-8')
+    run_boot([str(tmp_path / 'flows.yml'), '-o', 'out', '--dedup'], tmp_path)
+    out = tmp_path / 'out'
+    assert sorted(file.name for file in out.iterdir()) == ['argoflowboot-shared.yml', 'flow1.yml', 'flow2.yml']
+    txt = (out / 'flow1.yml').read_text(encoding='utf-8')
+    assert 'templateRef' in txt and 'command: echo' not in txt
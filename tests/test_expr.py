@@ -0,0 +1,131 @@
+import pytest
+from pyutilb import util
+from pyutilb.util import set_vars, clear_vars
+from ArgoFlowBoot import expr
+from ArgoFlowBoot.expr import LruCache, replace_var, parse_func
+
+'''
+编译的变量替换与函数调用解析(expr)的测试: 结果要跟 pyutilb.util 的 replace_var()/parse_func() 一致
+'''
+
+@pytest.fixture(autouse=True)
+def vars(monkeypatch):
+    clear_vars('*')
+    set_vars({'name': 'argo', 'n': 3, 'data': {'msg': 'hi', 'list': [1, 2]}, '@ref': 'at'})
+    monkeypatch.setitem(util.custom_funs, 'upper', lambda s: s.upper())
+    monkeypatch.setitem(util.custom_funs, 'join', lambda *args: '+'.join(args))
+    yield
+    clear_vars('*')
+
+def call(fun, *args):
+    '''
+    调用函数, 异常也作为结果以便比较
+    '''
+    try:
+        return fun(*args)
+    except Exception as ex:
+        return type(ex), str(ex)
+
+var_cases = [
+    # $var
+    '$name',
+    '$@ref',
+    'hello $name!',
+    '$name-$n',
+    '$1 and $2', # 数字不替换
+    '$none', # 变量不存在
+    # ${expr}
+    '${name}',
+    '${data.msg}',
+    '${data}',
+    'msg: ${data.msg}, n: ${n}',
+    '${upper(abc)}',
+    'x ${join(a, b,c)} y',
+    # 嵌套的函数调用与变量
+    '${upper(${name})}',
+    '${upper($name)}',
+    'a ${join(${upper(x)}, $name)} b',
+    '${unknown(1)}',
+    # 转义
+    'price \\$name and $name',
+    '\\${name} ${name}',
+    '\\$',
+    # 无需替换
+    '',
+    'plain text',
+    'cost $',
+    # 非字符串
+    None,
+    1,
+    2.5,
+    True,
+    {'a': '$name', 'b': [1, '${data.msg}', None, {'c': '$n'}], 'd': 'x'},
+    ['$n', ('x', '$name'), {'$name'}, range(2)],
+    ('$name', None),
+]
+
+@pytest.mark.parametrize('txt', var_cases)
+@pytest.mark.parametrize('to_str', [True, False])
+def test_replace_var(txt, to_str):
+    # 执行2次: 第2次用编译的缓存
+    expected = call(util.replace_var, txt, to_str)
+    assert call(replace_var, txt, to_str) == expected
+    assert call(replace_var, txt, to_str) == expected
+
+def test_replace_var_copy():
+    # dict/list要拷贝, 调用方会修改返回值
+    data = {'a': ['x'], 'b': {'c': 'y'}}
+    ret = replace_var(data)
+    assert ret == data
+    assert ret is not data and ret['a'] is not data['a'] and ret['b'] is not data['b']
+
+func_cases = [
+    ('echo(a)', False),
+    ('echo(a, b,c)', False),
+    ('echo()', False),
+    ('echo( )', False),
+    ('wft.tpl($x, ${y})', False),
+    ('outer(inner(a, b), c)', False), # 嵌套的函数调用
+    ('echo(a\\,b, c)', False), # 转义的逗号
+    ('echo', True),
+    ('echo', False),
+    (['echo', 'a', 1], False),
+]
+
+@pytest.mark.parametrize('expr_, allow_no_bracket', func_cases)
+def test_parse_func(expr_, allow_no_bracket):
+    expected = call(util.parse_func, expr_, allow_no_bracket)
+    assert call(parse_func, expr_, allow_no_bracket) == expected
+    ret = call(parse_func, expr_, allow_no_bracket)
+    assert ret == expected
+    # 返回的参数列表是拷贝, 修改了也不影响缓存
+    if isinstance(expr_, str) and not isinstance(ret[0], type):
+        ret[1].append('changed')
+        assert parse_func(expr_, allow_no_bracket) == expected
+
+def test_lru_cache():
+    cache = LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1 # a变成最近使用的
+    cache.put('c', 3) # 淘汰最久未用的b
+    assert list(cache) == ['a', 'c']
+    assert cache.get('b') is None
+    assert cache.get('b', 0) == 0
+    cache.put('a', 4) # 更新也算使用
+    cache.put('d', 5)
+    assert list(cache.items()) == [('a', 4), ('d', 5)]
+
+def test_cache_evict(monkeypatch):
+    # 编译结果缓存满了则淘汰, 淘汰后重新编译结果不变
+    monkeypatch.setattr(expr, 'compiled_vars', LruCache(2))
+    monkeypatch.setattr(expr, 'parsed_funcs', LruCache(2))
+    for txt in ('$name', 'a $n', '${data.msg}'):
+        replace_var(txt)
+    assert list(expr.compiled_vars) == ['a $n', '${data.msg}']
+    assert replace_var('$name') == 'argo'
+    assert list(expr.compiled_vars) == ['${data.msg}', '$name']
+    for txt in ('f(1)', 'g(2)', 'h(3)'):
+        parse_func(txt)
+    assert list(expr.parsed_funcs) == [('g(2)', False), ('h(3)', False)]
+    assert parse_func('f(1)') == ('f', ['1'])
@@ -0,0 +1,125 @@
+import json
+import subprocess
+import sys
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from ArgoFlowBoot import http_batch
+from ArgoFlowBoot.http_batch import to_py_condition, build_batch_request, build_batch_source
+
+'''
+批量http请求(http_batch模板)的测试
+'''
+
+@pytest.mark.parametrize('cond, expected', [
+    ('response.statusCode == 200', 'response.statusCode == 200'),
+    ('response.statusCode == 200 && response.body contains "ok"', 'response.statusCode == 200 and response.body |_contains| "ok"'),
+    ('response.statusCode == 201 || response.statusCode == 202', 'response.statusCode == 201 or response.statusCode == 202'),
+    ('!(response.statusCode >= 500)', 'not (response.statusCode >= 500)'),
+    ('response.body startsWith "{" and response.body endsWith "}"', 'response.body |_startsWith| "{" and response.body |_endsWith| "}"'),
+    ("response.body matches 'v[0-9]+'", "response.body |_matches| 'v[0-9]+'"),
+    ('response.statusCode in [200, 204]', 'response.statusCode in [200, 204]'),
+    ('response.headers["Content-Type"] == "application/json"', 'response.headers["Content-Type"] == "application/json"'),
+    ('not response.body contains "error" && true', 'not response.body |_contains| "error" and True'),
+])
+def test_to_py_condition(cond, expected):
+    assert to_py_condition(cond) == expected
+
+@pytest.mark.parametrize('cond, error', [
+    ('status == 200', '不支持的标识符: status'),
+    ('__import__("os")', '不支持的标识符: __import__'),
+    ('response.statusCode = 200', '不支持的语法'),
+])
+def test_to_py_condition_reject(cond, error):
+    with pytest.raises(Exception, match=error):
+        to_py_condition(cond)
+
+def test_build_batch_request():
+    req = build_batch_request({'url': 'http://svc/api', 'body': {'a': 1}, 'headers': [{'name': 'X-A', 'value': 1}]}, {'timeoutSeconds': '5'})
+    assert req == {
+        'name': 'POST http://svc/api',
+        'method': 'POST',
+        'url': 'http://svc/api',
+        'headers': {'X-A': '1', 'Content-Type': 'application/json'},
+        'body': '{"a": 1}',
+        'timeout': 5,
+        'condition': 'response.statusCode == 200',
+        'insecure': False,
+    }
+    req = build_batch_request('curl -k https://svc/health', {'successCondition': 'response.statusCode < 400'})
+    assert (req['method'], req['url'], req['insecure'], req['condition']) == ('GET', 'https://svc/health', True, 'response.statusCode < 400')
+    with pytest.raises(Exception, match='不支持选项: retries'):
+        build_batch_request({'url': 'http://svc', 'retries': 3}, {})
+    with pytest.raises(Exception, match='未指定url'):
+        build_batch_request({'method': 'GET'}, {})
+    with pytest.raises(Exception, match='超时必须是秒数'):
+        build_batch_request({'url': 'http://svc', 'timeoutSeconds': '5m'}, {})
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0)) # 读完请求体, 连接才能复用
+        if self.path == '/slow':
+            threading.Event().wait(2)
+        status = 500 if self.path == '/fail' else 200
+        data = json.dumps({'path': self.path, 'status': 'ok'}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_POST = do_GET
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def run_batch(tmp_path, monkeypatch, requests):
+    '''
+    执行生成的批量请求脚本
+    :return: (退出码, 结果, 标准输出)
+    '''
+    results = tmp_path / 'artifacts' / 'results.json'
+    monkeypatch.setattr(http_batch, 'results_path', str(results))
+    source = build_batch_source([build_batch_request(req, {}) for req in requests], concurrency=2)
+    proc = subprocess.run([sys.executable, '-c', source], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    return proc.returncode, json.loads(results.read_text(encoding='utf-8')), proc
+
+def test_runner(server, tmp_path, monkeypatch):
+    requests = [
+        {'name': 'a', 'url': server + '/a'},
+        {'name': 'b', 'url': server + '/b', 'method': 'POST', 'body': {'x': 1}, 'successCondition': 'response.body contains "/b" && response.headers["Content-Type"] == "application/json"'},
+        'curl ' + server + '/c',
+    ]
+    code, results, proc = run_batch(tmp_path, monkeypatch, requests)
+    assert code == 0, proc.stderr
+    assert [(r['index'], r['name'], r['statusCode'], r['ok']) for r in results] == [
+        (0, 'a', 200, True),
+        (1, 'b', 200, True),
+        (2, 'GET ' + server + '/c', 200, True),
+    ]
+    assert json.loads(proc.stdout) == {'total': 3, 'ok': 3, 'failed': 0, 'elapsed': json.loads(proc.stdout)['elapsed']}
+
+def test_runner_failures(server, tmp_path, monkeypatch):
+    requests = [
+        {'name': 'ok', 'url': server + '/ok'},
+        {'name': 'status', 'url': server + '/fail'},
+        {'name': 'cond', 'url': server + '/ok', 'successCondition': 'response.body contains "nope"'},
+        {'name': 'timeout', 'url': server + '/slow', 'timeoutSeconds': 0.5},
+    ]
+    code, results, proc = run_batch(tmp_path, monkeypatch, requests)
+    assert code == 1
+    assert [r['ok'] for r in results] == [True, False, False, False]
+    assert results[1]['statusCode'] == 500
+    assert results[3]['error'] == 'timeout after 0.5s'
+    assert 'FAIL status: statusCode=500' in proc.stderr
+    assert json.loads(proc.stdout)['failed'] == 3
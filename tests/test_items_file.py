@@ -0,0 +1,41 @@
+import os
+import pytest
+from ArgoFlowBoot import items_file
+from ArgoFlowBoot.items_file import ItemsConfigMap
+
+'''
+循环元素的ConfigMap的测试
+'''
+
+def test_add(tmp_path):
+    data = tmp_path / 'items.jsonl'
+    data.write_text('{"a": 1}\n{"a": 2}\n', encoding='utf-8')
+    cm = ItemsConfigMap(str(tmp_path / 'flow-items.yml'), 'flow-items', 'flow', 'argo')
+    assert cm.add('loop', str(data)) == 'loop'
+    assert cm.add('loop', str(data)) == 'loop-2'
+    assert cm.close()
+    assert sorted(os.listdir(tmp_path)) == ['flow-items.yml', 'items.jsonl']
+    assert '{"a": 2}' in (tmp_path / 'flow-items.yml').read_text(encoding='utf-8')
+
+def test_add_over_limit(tmp_path, monkeypatch):
+    # 超过上限则马上失败, 不读完数据文件, 且不残留临时文件
+    read = []
+    def iterate_items(file, format=None):
+        for i in range(10000):
+            read.append(i)
+            yield {'i': i}
+    monkeypatch.setattr(items_file, 'configmap_limit', 1000)
+    monkeypatch.setattr(items_file, 'iterate_items', iterate_items)
+    cm = ItemsConfigMap(str(tmp_path / 'flow-items.yml'), 'flow-items', 'flow')
+    with pytest.raises(Exception, match='大小超过上限'):
+        cm.add('loop', 'items.jsonl')
+    assert len(read) < 100
+    assert os.listdir(tmp_path) == []
+
+def test_add_abort_on_error(tmp_path):
+    data = tmp_path / 'items.json'
+    data.write_text('[{"a": 1}, {"a": ', encoding='utf-8')
+    cm = ItemsConfigMap(str(tmp_path / 'flow-items.yml'), 'flow-items', 'flow')
+    with pytest.raises(Exception, match='不是合法的json'):
+        cm.add('loop', str(data))
+    assert os.listdir(tmp_path) == ['items.json']
@@ -0,0 +1,55 @@
+import yaml
+from ArgoFlowBoot.manifest_diff import ManifestDiffer
+
+'''
+与快照比较(--diff-against)的测试
+'''
+
+def build_wft(ns=None, volumes=None, tpl=None):
+    meta = {'name': 'my-wft'}
+    if ns is not None:
+        meta['namespace'] = ns
+    spec = {'templates': [tpl or {'name': 'main', 'container': {'image': 'alpine'}}]}
+    if volumes is not None:
+        spec['volumes'] = volumes
+    return {'apiVersion': 'argoproj.io/v1alpha1', 'kind': 'WorkflowTemplate', 'metadata': meta, 'spec': spec}
+
+def build_differ(tmp_path, doc, name='snapshot'):
+    snapshot = tmp_path / name
+    snapshot.mkdir()
+    (snapshot / 'my-wft.yml').write_text(yaml.safe_dump(doc), encoding='utf-8')
+    return ManifestDiffer(str(snapshot), str(tmp_path / f'{name}-changes.json'))
+
+def test_unchanged(tmp_path):
+    # 服务端填充的字段与null不算修改
+    old = build_wft('argo')
+    old['metadata'].update(uid='xxx', resourceVersion='1')
+    old['status'] = {}
+    differ = build_differ(tmp_path, old)
+    new = build_wft('argo')
+    new['spec']['arguments'] = None
+    assert not differ.check(new, 'my-wft.yml')
+
+def test_empty_values_changed(tmp_path):
+    # 空值是有意义的: emptyDir: {} 与 suspend: {}
+    differ = build_differ(tmp_path, build_wft('argo', volumes=[{'name': 'tmp'}], tpl={'name': 'main', 'suspend': {}}))
+    assert differ.check(build_wft('argo', volumes=[{'name': 'tmp', 'emptyDir': {}}], tpl={'name': 'main', 'suspend': {}}), 'my-wft.yml')
+    assert differ.changes[-1]['paths'] == ['spec.volumes[tmp].emptyDir']
+    assert differ.check(build_wft('argo', volumes=[{'name': 'tmp'}], tpl={'name': 'main'}), 'my-wft.yml')
+    assert differ.changes[-1]['paths'] == ['spec.templates[main].suspend']
+
+def test_namespace_changed(tmp_path):
+    # 快照没命名空间, 生成的有
+    differ = build_differ(tmp_path, build_wft())
+    assert differ.check(build_wft('argo'), 'my-wft.yml')
+    assert differ.changes[-1]['change'] == 'changed'
+    assert differ.changes[-1]['paths'] == ['metadata.namespace']
+    # 命名空间不同: 新增+删除
+    differ = build_differ(tmp_path, build_wft('prod'), 'prod')
+    assert differ.check(build_wft('argo'), 'my-wft.yml')
+    assert differ.save()['summary'] == {'added': 1, 'changed': 0, 'removed': 1, 'unchanged': 0}
+
+def test_namespace_unset(tmp_path):
+    # 生成的资源没指定命名空间, 可对上快照中任意命名空间的资源
+    differ = build_differ(tmp_path, build_wft('argo'))
+    assert not differ.check(build_wft(), 'my-wft.yml')
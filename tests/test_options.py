@@ -0,0 +1,14 @@
+from tests.test_pool import run_boot
+
+'''
+命令行选项的测试
+'''
+
+def test_help(tmp_path):
+    # -h 要输出本项目特有选项与 parse_cmd() 的通用选项
+    for arg in ('-h', '--help'):
+        out = run_boot([arg], tmp_path)
+        assert 'Options specific to ArgoFlowBoot' in out
+        assert '--jobs' in out and '--submit' in out and '--diff-out' in out
+        assert 'Usage: ArgoFlowBoot' in out and '--output' in out
+        assert out.index('--jobs') < out.index('Usage: ArgoFlowBoot')
@@ -0,0 +1,92 @@
+import filecmp
+import os
+import subprocess
+import sys
+from ArgoFlowBoot.pool import list_step_files
+
+'''
+多进程并行生成(-j)的测试: 结果要跟串行执行一致
+'''
+
+# 项目根目录
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 示例目录
+example_dirs = [os.path.join(root_dir, 'example', 'base'), os.path.join(root_dir, 'example', 'adv')]
+
+# 不参与比较的示例: 非法的步骤文件, 串行与并行都会失败
+broken_examples = ['test-pv.yml']
+
+def list_examples():
+    return [file for file in list_step_files(example_dirs) if os.path.basename(file) not in broken_examples]
+
+def run_boot(args, cwd):
+    '''
+    在子进程中执行ArgoFlowBoot, 当前目录为临时目录, 以免日志写到项目目录
+    :return: 输出
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = root_dir + os.pathsep + env.get('PYTHONPATH', '')
+    cmd = [sys.executable, '-m', 'ArgoFlowBoot.boot'] + args
+    proc = subprocess.run(cmd, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert proc.returncode == 0, proc.stdout
+    return proc.stdout
+
+def diff_dirs(dir1, dir2):
+    '''
+    递归比较目录
+    :return: 不同的文件
+    '''
+    cmp = filecmp.dircmp(dir1, dir2)
+    ret = cmp.left_only + cmp.right_only + cmp.diff_files + cmp.funny_files
+    for sub in cmp.common_dirs:
+        ret += [os.path.join(sub, file) for file in diff_dirs(os.path.join(dir1, sub), os.path.join(dir2, sub))]
+    return ret
+
+def test_list_step_files_expands_all_paths():
+    # 目录之后的路径也要展开
+    files = list_step_files(example_dirs + [os.path.join(root_dir, 'example', 'adv', 'ci.yml')])
+    assert any(file.startswith(example_dirs[0]) for file in files)
+    assert any(file.startswith(example_dirs[1]) for file in files)
+    assert files[-1].endswith('ci.yml')
+
+def test_jobs_same_as_serial(tmp_path):
+    files = list_examples()
+    run_boot(files + ['-o', 'serial'], tmp_path)
+    run_boot(files + ['-o', 'parallel', '-j', '4'], tmp_path)
+    assert diff_dirs(str(tmp_path / 'serial'), str(tmp_path / 'parallel')) == []
+    # 其他文件继承了 event-test.yml 中 ns 动作设置的命名空间
+    assert 'namespace: argo' in (tmp_path / 'parallel' / 'steps-test.yml').read_text(encoding='utf-8')
+
+def test_jobs_pass_profile(tmp_path):
+    # 流程外声明的性能预设作用于之后的步骤文件
+    (tmp_path / 'a-profile.yml').write_text("- profile: throughput\n", encoding='utf-8')
+    (tmp_path / 'b-flow.yml').write_text('''- wf(profile-test):
+    - templates:
+        main():
+          container:
+            command: echo hello
+''', encoding='utf-8')
+    files = [str(tmp_path / 'a-profile.yml'), str(tmp_path / 'b-flow.yml')]
+    run_boot(files + ['-o', 'serial'], tmp_path)
+    run_boot(files + ['-o', 'parallel', '-j', '2'], tmp_path)
+    assert diff_dirs(str(tmp_path / 'serial'), str(tmp_path / 'parallel')) == []
+    assert 'podGC' in (tmp_path / 'parallel' / 'profile-test.yml').read_text(encoding='utf-8')
+
+def test_incr_keeps_run_state(tmp_path):
+    # 增量构建跳过的步骤文件, 其设置的执行状态也要带给之后的步骤文件
+    (tmp_path / 'a-ns.yml').write_text("- ns: argo\n", encoding='utf-8')
+    flow = tmp_path / 'b-flow.yml'
+    files = [str(tmp_path / 'a-ns.yml'), str(flow)]
+    for jobs in ('1', '2'):
+        for msg in ('hello', 'world'): # 第二次只有 b-flow.yml 变了
+            flow.write_text(f'''- wf(ns-test):
+    - templates:
+        main():
+          container:
+            command: echo {msg}
+''', encoding='utf-8')
+            run_boot(files + ['-o', 'out' + jobs, '--incr', '-j', jobs], tmp_path)
+        out = (tmp_path / ('out' + jobs) / 'ns-test.yml').read_text(encoding='utf-8')
+        assert 'echo world' in out
+        assert 'namespace: argo' in out
@@ -0,0 +1,35 @@
+import yaml
+from tests.test_pool import run_boot
+
+'''
+信号量(semaphores动作)的测试
+'''
+
+def flow_yaml(name, before=''):
+    return f'''{before}- wf({name}):
+    - templates:
+        main():
+          limits:
+            semaphore: db
+          container:
+            command: migrate up
+'''
+
+def test_semaphores_per_namespace(tmp_path):
+    # 每个命名空间一个ConfigMap, 以便该命名空间的流程引用
+    (tmp_path / 'a.yml').write_text(flow_yaml('flow-a', '- semaphores:\n    db: 2\n'), encoding='utf-8')
+    (tmp_path / 'b.yml').write_text(flow_yaml('flow-b', '- ns: argo\n- semaphores:\n    db: 5\n    cache: 1\n'), encoding='utf-8')
+    files = [str(tmp_path / 'a.yml'), str(tmp_path / 'b.yml')]
+    run_boot(files + ['-o', 'out'], tmp_path)
+    with open(tmp_path / 'out' / 'argoflowboot-semaphores.yml', encoding='utf-8') as f:
+        docs = list(yaml.safe_load_all(f))
+    assert [(doc['metadata'].get('namespace'), doc['data']) for doc in docs] == [
+        (None, {'db': '2'}),
+        ('argo', {'db': '5', 'cache': '1'}),
+    ]
+    flow = yaml.safe_load((tmp_path / 'out' / 'flow-b.yml').read_text(encoding='utf-8'))
+    assert flow['metadata']['namespace'] == 'argo'
+    assert flow['spec']['templates'][0]['synchronization']['semaphore'] == {'configMapKeyRef': {'name': 'argoflowboot-semaphores', 'key': 'db'}}
+    # 并行生成的结果一样
+    run_boot(files + ['-o', 'parallel', '-j', '2'], tmp_path)
+    assert (tmp_path / 'parallel' / 'argoflowboot-semaphores.yml').read_text(encoding='utf-8') == (tmp_path / 'out' / 'argoflowboot-semaphores.yml').read_text(encoding='utf-8')
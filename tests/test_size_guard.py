@@ -0,0 +1,97 @@
+import json
+import pytest
+from ArgoFlowBoot import size_guard
+from ArgoFlowBoot.size_guard import SizeGuard, parse_size, measure
+from tests.test_pool import run_boot
+
+'''
+流程大小检查(--size-limit/--size-strict)的测试
+'''
+
+def build_flow(templates):
+    return {'apiVersion': 'argoproj.io/v1alpha1', 'kind': 'Workflow', 'metadata': {'name': 'big'}, 'spec': {'entrypoint': 'main', 'templates': templates}}
+
+def script_template(name, source):
+    return {'name': name, 'script': {'image': 'python:3', 'command': ['python'], 'source': source}}
+
+def test_parse_size():
+    assert parse_size('512Ki') == 512 * 1024
+    assert parse_size('1Mi') == 1024 ** 2
+    assert parse_size('500K') == 500 * 1000
+    assert parse_size(100) == 100
+    with pytest.raises(Exception, match='无法识别大小'):
+        parse_size('1GB')
+
+def test_under_limit():
+    flow = build_flow([script_template('main', 'print(1)\n' * 1000)])
+    old = json.dumps(flow)
+    assert SizeGuard(limit='64Ki').guard(flow, 'big') == []
+    assert json.dumps(flow) == old
+
+def test_offload_source():
+    source = 'print("hello")\n' * 1000
+    flow = build_flow([script_template('small', 'print(1)'), script_template('main', source)])
+    configmaps = SizeGuard(limit='4Ki').guard(flow, 'big', 'argo')
+    assert configmaps == [{
+        'apiVersion': 'v1',
+        'kind': 'ConfigMap',
+        'metadata': {'name': 'big-src', 'labels': {'flow': 'big'}, 'namespace': 'argo'},
+        'data': {'main.source': source},
+    }]
+    tpl = flow['spec']['templates'][1]
+    assert tpl['script']['source'] == '{{inputs.parameters.argoflowboot-source}}'
+    assert tpl['inputs']['parameters'] == [{
+        'name': 'argoflowboot-source',
+        'valueFrom': {'configMapKeyRef': {'name': 'big-src', 'key': 'main.source'}},
+    }]
+    # 小模板不转移
+    assert flow['spec']['templates'][0]['script']['source'] == 'print(1)'
+    assert measure(flow) <= 4 * 1024
+
+def test_offload_with_items():
+    items = [{'id': i, 'name': f"item-{i}"} for i in range(500)]
+    main = {'name': 'main', 'steps': [[{'name': 'loop', 'template': 'echo', 'withItems': items}]]}
+    flow = build_flow([{'name': 'echo', 'container': {'image': 'alpine'}}, main])
+    configmaps = SizeGuard(limit='4Ki').guard(flow, 'big')
+    assert json.loads(configmaps[0]['data']['main.loop.items']) == items
+    assert 'namespace' not in configmaps[0]['metadata']
+    step = main['steps'][0][0]
+    assert 'withItems' not in step
+    assert step['withParam'] == '{{inputs.parameters.argoflowboot-items-loop}}'
+    assert main['inputs']['parameters'][0]['valueFrom']['configMapKeyRef'] == {'name': 'big-src', 'key': 'main.loop.items'}
+
+def test_skip_argo_vars():
+    # 带argo变量的内容不转移: 参数值中的变量不会再被替换
+    source = 'print("{{inputs.parameters.msg}}")\n' * 1000
+    flow = build_flow([script_template('main', source)])
+    assert SizeGuard(limit='4Ki').guard(flow, 'big') == []
+    assert flow['spec']['templates'][0]['script']['source'] == source
+    with pytest.raises(Exception, match='无法转移到ConfigMap'):
+        SizeGuard(limit='4Ki', strict=True).guard(flow, 'big')
+
+def test_alloc_bin(monkeypatch):
+    # 单个ConfigMap放不下就新建
+    monkeypatch.setattr(size_guard, 'configmap_limit', 2500)
+    guard = SizeGuard()
+    bins = []
+    assert guard.alloc_bin(bins, 'big', 'a.source', 'a' * 1000) == 'big-src'
+    assert guard.alloc_bin(bins, 'big', 'b.source', 'b' * 1000) == 'big-src'
+    assert guard.alloc_bin(bins, 'big', 'c.source', 'c' * 1000) == 'big-src-1'
+    assert [list(b[1]) for b in bins] == [['a.source', 'b.source'], ['c.source']]
+    with pytest.raises(Exception, match='超过ConfigMap的上限'):
+        guard.alloc_bin(bins, 'big', 'd.source', 'd' * 3000)
+
+def test_size_strict(tmp_path):
+    # 命令行: 转移后仍超过上限则报错
+    (tmp_path / 'big.yml').write_text('''- wf(big):
+    - templates:
+        main(msg):
+          script:
+            image: python:3
+            command: [python]
+            source: |
+''' + '              print("$msg")\n' * 500, encoding='utf-8')
+    run_boot([str(tmp_path / 'big.yml'), '-o', 'loose', '--size-limit', '4Ki'], tmp_path)
+    assert (tmp_path / 'loose' / 'big.yml').exists()
+    with pytest.raises(AssertionError, match='无法转移到ConfigMap'):
+        run_boot([str(tmp_path / 'big.yml'), '-o', 'strict', '--size-limit', '4Ki', '--size-strict'], tmp_path)
@@ -0,0 +1,224 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from ArgoFlowBoot.submitter import ArgoSubmitter
+
+'''
+批量提交到argo服务器(--submit)的测试: 用 http.server 模拟 Argo Server 的 REST API
+'''
+
+class MockArgoServer(ThreadingHTTPServer):
+    '''
+    模拟的argo服务器
+        创建(POST): 已存在则返回409, 名字含bad则返回400
+        拉取(GET)/更新(PUT): 更新要带上已有资源的 resourceVersion
+        failures: 前几个请求返回的错误状态码, 用于测试重试
+        delays: 前几个创建请求在创建后才超时(响应慢于客户端的超时), 用于测试非幂等请求的重试
+    '''
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), MockArgoHandler)
+        self.store = {} # 已有的资源, key是(api路径, 命名空间, 名字)
+        self.requests = [] # 收到的请求: (方法, 路径)
+        self.failures = []
+        self.delays = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+class MockArgoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_api(self):
+        n = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(n)) if n else None
+        with self.server.lock:
+            status, body, delay = self.process(body)
+        if delay: # 已处理, 但响应慢
+            time.sleep(1)
+        self.reply(status, body)
+
+    def process(self, body):
+        '''
+        处理请求
+        :return: (状态码, 响应体, 是否延迟响应)
+        '''
+        server = self.server
+        server.requests.append((self.command, self.path))
+        if server.failures:
+            return server.failures.pop(0), {'message': 'server error'}, False
+        key = tuple(self.path.split('/')[3:]) # 去掉 /api/v1
+        if self.command == 'POST':
+            doc = list(body.values())[0]
+            meta = doc['metadata']
+            name = meta.get('name') or meta['generateName'] + 'abcde'
+            if 'bad' in name:
+                return 400, {'message': 'invalid spec'}, False
+            key += (name,)
+            if key in server.store:
+                return 409, {'message': 'already exists'}, False
+            meta['resourceVersion'] = '1'
+            server.store[key] = doc
+            delay = server.delays > 0
+            if delay:
+                server.delays -= 1
+            return 200, doc, delay
+        if key not in server.store:
+            return 404, {'message': 'not found'}, False
+        if self.command == 'GET':
+            return 200, server.store[key], False
+        doc = list(body.values())[0]
+        if doc['metadata'].get('resourceVersion') != server.store[key]['metadata']['resourceVersion']:
+            return 409, {'message': 'resourceVersion conflict'}, False
+        doc['metadata']['resourceVersion'] = str(int(doc['metadata']['resourceVersion']) + 1)
+        server.store[key] = doc
+        return 200, doc, False
+
+    do_GET = do_POST = do_PUT = handle_api
+
+@pytest.fixture
+def server():
+    server = MockArgoServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def build_doc(kind, name, ref=None):
+    spec = {'templates': [{'name': 'main', 'container': {'image': 'alpine'}}]}
+    if ref is not None:
+        spec = {'workflowTemplateRef': {'name': ref}}
+    if kind == 'CronWorkflow':
+        spec = {'schedule': '* * * * *', 'workflowSpec': spec}
+    meta = {'generateName': name + '-'} if kind == 'Workflow' else {'name': name}
+    return {'apiVersion': 'argoproj.io/v1alpha1', 'kind': kind, 'metadata': meta, 'spec': spec}
+
+def build_submitter(server, **options):
+    return ArgoSubmitter(server.url, token='', ns='argo', backoff=0.01, **options)
+
+def test_order(server):
+    # 流程与定时流程在前, 也要先提交流程模板
+    submitter = build_submitter(server, jobs=4)
+    submitter.add([build_doc('Workflow', 'wf', 'wft'), build_doc('CronWorkflow', 'cron', 'wft')], 'wf.yml')
+    submitter.add(build_doc('WorkflowTemplate', 'wft'), 'wft.yml')
+    submitter.add(build_doc('ClusterWorkflowTemplate', 'cwft'), 'cwft.yml')
+    submitter.add({'apiVersion': 'v1', 'kind': 'ConfigMap', 'metadata': {'name': 'cm'}}, 'cm.yml')
+    assert submitter.submit() == 4
+    paths = [path for _, path in server.requests]
+    assert sorted(paths[:2]) == ['/api/v1/cluster-workflow-templates', '/api/v1/workflow-templates/argo']
+    assert sorted(paths[2:]) == ['/api/v1/cron-workflows/argo', '/api/v1/workflows/argo']
+    assert submitter.skipped == [] # 已提示要用 kubectl apply
+
+def test_retry(server):
+    server.failures = [503, 503]
+    submitter = build_submitter(server, retries=3)
+    submitter.add(build_doc('WorkflowTemplate', 'wft'), 'wft.yml')
+    assert submitter.submit() == 1
+    assert server.requests == [('POST', '/api/v1/workflow-templates/argo')] * 3
+
+def test_retry_exhausted(server):
+    server.failures = [503] * 10
+    submitter = build_submitter(server, retries=2)
+    submitter.add(build_doc('WorkflowTemplate', 'wft'), 'wft.yml')
+    with pytest.raises(Exception, match='HTTP 503'):
+        submitter.submit()
+    assert len(server.requests) == 3
+
+def test_update_on_conflict(server):
+    # 已存在(409)则拉取 resourceVersion 再更新
+    submitter = build_submitter(server)
+    submitter.add(build_doc('WorkflowTemplate', 'wft'), 'wft.yml')
+    submitter.submit()
+    server.requests.clear()
+    doc = build_doc('WorkflowTemplate', 'wft')
+    doc['spec']['templates'][0]['container']['image'] = 'busybox'
+    submitter.add(doc, 'wft.yml')
+    assert submitter.submit() == 1
+    assert server.requests == [
+        ('POST', '/api/v1/workflow-templates/argo'),
+        ('GET', '/api/v1/workflow-templates/argo/wft'),
+        ('PUT', '/api/v1/workflow-templates/argo/wft'),
+    ]
+    stored = server.store[('workflow-templates', 'argo', 'wft')]
+    assert stored['metadata']['resourceVersion'] == '2'
+    assert stored['spec']['templates'][0]['container']['image'] == 'busybox'
+
+def test_workflow_create_only(server):
+    # 流程每次提交都是新流程, 不更新
+    submitter = build_submitter(server)
+    submitter.add(build_doc('Workflow', 'wf'), 'wf.yml')
+    submitter.submit()
+    submitter.add(build_doc('Workflow', 'wf'), 'wf.yml')
+    with pytest.raises(Exception, match='HTTP 409'):
+        submitter.submit()
+    assert [method for method, _ in server.requests] == ['POST', 'POST']
+
+def test_skip_flows_of_failed_wft(server):
+    # 引用的流程模板提交失败, 则不提交该流程
+    submitter = build_submitter(server)
+    submitter.add([build_doc('WorkflowTemplate', 'bad-wft'), build_doc('Workflow', 'wf', 'bad-wft'), build_doc('Workflow', 'other')], 'wf.yml')
+    with pytest.raises(Exception) as ex:
+        submitter.submit()
+    assert 'WorkflowTemplate/bad-wft: POST' in str(ex.value)
+    assert '引用的流程模板提交失败: bad-wft' in str(ex.value)
+    assert [path for _, path in server.requests] == ['/api/v1/workflow-templates/argo', '/api/v1/workflows/argo']
+
+def test_workflow_retry(server):
+    # 创建流程不是幂等的: 只在服务端没处理(429/503)时重试
+    server.failures = [503, 429]
+    submitter = build_submitter(server)
+    submitter.add(build_doc('Workflow', 'wf'), 'wf.yml')
+    assert submitter.submit() == 1
+    assert len(server.requests) == 3
+    # 500: 服务端可能已处理, 不重试
+    server.requests.clear()
+    server.failures = [500]
+    submitter.add(build_doc('Workflow', 'wf2'), 'wf.yml')
+    with pytest.raises(Exception, match='HTTP 500'):
+        submitter.submit()
+    assert len(server.requests) == 1
+
+def test_workflow_no_retry_after_timeout(server):
+    # 服务端已创建但响应超时: 不重试, 以免多跑一个流程
+    server.delays = 1
+    submitter = build_submitter(server, timeout=0.3)
+    submitter.add(build_doc('Workflow', 'wf'), 'wf.yml')
+    with pytest.raises(Exception, match='不重试'):
+        submitter.submit()
+    assert server.requests == [('POST', '/api/v1/workflows/argo')]
+    assert list(server.store) == [('workflows', 'argo', 'wf-abcde')]
+    # 流程模板是幂等的(已存在则更新), 超时可重试
+    server.requests.clear()
+    server.delays = 1
+    submitter.add(build_doc('WorkflowTemplate', 'wft'), 'wft.yml')
+    assert submitter.submit() == 1
+    assert [method for method, _ in server.requests] == ['POST', 'POST', 'GET', 'PUT']
+
+def test_workflow_retry_unsent(server, monkeypatch):
+    # 连接失败, 请求没发出去: 创建流程也重试
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    retries = []
+    monkeypatch.setattr(ArgoSubmitter, 'sleep_backoff', lambda self, i, method, url, reason: retries.append(i))
+    submitter = ArgoSubmitter(f"http://127.0.0.1:{port}", token='', ns='argo', retries=2)
+    submitter.add(build_doc('Workflow', 'wf'), 'wf.yml')
+    with pytest.raises(Exception, match='出错'):
+        submitter.submit()
+    assert retries == [0, 1]
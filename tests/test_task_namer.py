@@ -0,0 +1,74 @@
+from pyutilb.util import md5
+from ArgoFlowBoot.task_namer import TaskNamer, Md5TaskNamer, MidlineTaskNamer, IncrTaskNamer, FuncIncrTaskNamer
+
+'''
+任务命名者(task_namer)的测试
+'''
+
+def test_get_key():
+    namer = MidlineTaskNamer()
+    assert namer.get_key('echo(a)') == 'echo(a)'
+    assert namer.get_key(['echo(a)', 'echo(b)']) == "['echo(a)', 'echo(b)']"
+
+def test_get_name_cached():
+    # 同一任务表达式只生成一次任务名
+    namer = IncrTaskNamer()
+    assert namer.get_name('echo(a)') == 'Task1'
+    assert namer.get_name('echo(b)') == 'Task2'
+    assert namer.get_name('echo(a)') == 'Task1'
+    # new_name 无缓存
+    assert namer.new_name('echo(a)') == 'Task3'
+
+def test_reverse_lookup():
+    namer = FuncIncrTaskNamer()
+    assert namer.get_name('echo(a)') == 'echo'
+    assert namer.new_name('echo(b)') == 'echo2'
+    assert namer.get_name('my-wft.whalesay(hi)') == 'my-wft-whalesay'
+    assert namer.get_task('echo') == 'echo(a)'
+    assert namer.get_task('echo2') == 'echo(b)'
+    assert namer.get_task('my-wft-whalesay') == 'my-wft.whalesay(hi)'
+    assert namer.get_task('other') is None
+    assert namer.name2task == {'echo': 'echo(a)', 'echo2': 'echo(b)', 'my-wft-whalesay': 'my-wft.whalesay(hi)'}
+
+def test_max_len():
+    # 超长: 截断并加上8位hash后缀, 总长63
+    task = 'echo(' + 'a' * 100 + ')'
+    namer = MidlineTaskNamer()
+    name = namer.get_name(task)
+    assert len(name) == TaskNamer.max_len == 63
+    assert name == 'echo-' + 'a' * 49 + '-' + md5(task)[:8]
+    assert namer.get_task(name) == task
+    # 不超长则原样
+    assert namer.get_name('echo(' + 'b' * 58 + ')') == 'echo-' + 'b' * 58
+
+def test_collision_suffix():
+    # 重名: 加上任务表达式的hash后缀, 结果是确定的
+    task1 = 'echo(a b)'
+    task2 = 'echo(ab)'
+    names = []
+    for _ in range(2):
+        namer = MidlineTaskNamer()
+        names.append((namer.get_name(task1), namer.get_name(task2)))
+    assert names[0] == names[1] == ('echo-ab', 'echo-ab-' + md5(task2)[:8])
+    # hash后缀也重名: 换个后缀
+    namer = MidlineTaskNamer()
+    namer.name2task['echo-ab-' + md5(task2)[:8]] = 'other'
+    namer.get_name(task1)
+    assert namer.get_name(task2) == 'echo-ab-' + md5(task2 + '#1')[:8]
+
+def test_clear():
+    namer = IncrTaskNamer(incr_letter=True)
+    assert namer.get_name('echo(a)') == 'TaskA'
+    namer.clear()
+    assert namer.task2name == namer.name2task == {}
+    # 计数也清空
+    assert namer.get_name('echo(b)') == 'TaskA'
+    namer = FuncIncrTaskNamer()
+    namer.get_name('echo(a)')
+    namer.clear()
+    assert namer.get_name('echo(b)') == 'echo'
+    # 清空后不再认为重名
+    namer = Md5TaskNamer()
+    name = namer.get_name('echo(a)')
+    namer.clear()
+    assert namer.new_name('echo(a)') == name == md5('echo(a)')
@@ -0,0 +1,143 @@
+import os
+import time
+import pytest
+from pyutilb.util import clear_vars
+from ArgoFlowBoot.boot import Boot
+from ArgoFlowBoot.watcher import Watcher
+
+'''
+监视模式(--watch)的测试: 在临时目录中修改文件, 再调用 Watcher.check(), 检查重新生成了哪些流程及其内容
+'''
+
+def flow_yaml(name, msg, before=''):
+    return f'''{before}- wf({name}):
+    - templates:
+        main():
+          container:
+            command: echo {msg}
+'''
+
+class Env(object):
+    '''
+    临时目录中的监视环境
+    '''
+
+    def __init__(self, dir):
+        self.dir = dir
+        self.mtime = time.time()
+        self.boot = None
+        self.watcher = None
+
+    def write(self, name, txt):
+        '''
+        写文件, 并推后修改时间, 以免跟上次写的在同一时刻而识别不到变化
+        '''
+        path = self.dir / name
+        path.write_text(txt, encoding='utf-8')
+        self.mtime += 10
+        os.utime(path, (self.mtime, self.mtime))
+        return path
+
+    def start(self):
+        clear_vars('*')
+        self.boot = Boot(str(self.dir / 'out'))
+        self.watcher = Watcher(self.boot, [str(self.dir / '*.yml')])
+        return self.watcher.build()
+
+    def check(self):
+        '''
+        检查文件变化
+        :return: (重新生成的流程数, 重新生成的文件名)
+        '''
+        start = len(self.boot.output_files)
+        n = self.watcher.check()
+        return n, sorted(os.path.basename(file) for file in self.boot.output_files[start:])
+
+    def read(self, name):
+        return (self.dir / 'out' / name).read_text(encoding='utf-8')
+
+@pytest.fixture
+def env(tmp_path):
+    cur_dir = os.getcwd()
+    yield Env(tmp_path)
+    os.chdir(cur_dir)
+    clear_vars('*')
+
+def test_edit_flow_block(env):
+    env.write('a.yml', flow_yaml('flow-a1', 'a1') + flow_yaml('flow-a2', 'a2'))
+    env.write('b.yml', flow_yaml('flow-b', 'b'))
+    assert env.start() == 3
+    assert env.check() == (0, [])
+    # 只重跑变了的流程块
+    env.write('a.yml', flow_yaml('flow-a1', 'a1') + flow_yaml('flow-a2', 'changed'))
+    assert env.check() == (1, ['flow-a2.yml'])
+    assert 'echo changed' in env.read('flow-a2.yml')
+
+def test_edit_context_reruns_file(env):
+    env.write('a.yml', flow_yaml('flow-a1', 'a1') + flow_yaml('flow-a2', 'a2'))
+    env.start()
+    # 非流程块变了: 重跑整个文件
+    env.write('a.yml', flow_yaml('flow-a1', 'a1', '- profile: debug\n') + flow_yaml('flow-a2', 'a2'))
+    assert env.check() == (2, ['flow-a1.yml', 'flow-a2.yml'])
+    assert 'activeDeadlineSeconds: 14400' in env.read('flow-a2.yml')
+
+def test_edit_flow_block_keeps_run_state(env):
+    # 重跑的流程块要用其执行前的执行状态, 而不是最后执行的文件留下的
+    env.write('a.yml', flow_yaml('flow-a', 'a', '- profile: debug\n'))
+    env.write('b.yml', flow_yaml('flow-b', 'b', '- profile: throughput\n'))
+    env.start()
+    env.write('a.yml', flow_yaml('flow-a', 'changed', '- profile: debug\n'))
+    assert env.check() == (1, ['flow-a.yml'])
+    out = env.read('flow-a.yml')
+    assert 'echo changed' in out
+    assert 'activeDeadlineSeconds: 14400' in out
+    assert 'podGC' not in out
+    assert 'OnPodCompletion' in env.read('flow-b.yml')
+
+def test_edit_included_file(env):
+    env.write('tpls.yml.inc', '''whalesay(msg):
+  container:
+    command: cowsay $msg
+''')
+    env.write('a.yml', '''- wf(flow-a):
+    - include_templates: tpls.yml.inc
+    - templates:
+        main():
+          steps:
+            - - whalesay(hello)
+''' + flow_yaml('flow-b', 'b'))
+    env.start()
+    # 依赖文件变了: 只重跑依赖它的流程块
+    env.write('tpls.yml.inc', '''whalesay(msg):
+  container:
+    command: echo $msg
+''')
+    assert env.check() == (1, ['flow-a.yml'])
+    assert 'echo {{inputs.parameters.msg}}' in env.read('flow-a.yml')
+
+def test_change_wft_inputs(env):
+    env.write('a-wft.yml', '''- wft(my-wft):
+    - templates:
+        whalesay(msg):
+          container:
+            command: cowsay $msg
+''')
+    env.write('b-flow.yml', '''- wf(flow-ref):
+    - templates:
+        main():
+          steps:
+            - - my-wft.whalesay(hello)
+''' + flow_yaml('flow-other', 'other'))
+    env.start()
+    assert 'name: msg' in env.read('flow-ref.yml')
+    # 流程模板的入参变了: 重跑引用它的流程块
+    env.write('a-wft.yml', '''- wft(my-wft):
+    - templates:
+        whalesay(text):
+          container:
+            command: cowsay $text
+''')
+    assert env.check() == (2, ['flow-ref.yml', 'my-wft.yml'])
+    out = env.read('flow-ref.yml')
+    assert 'name: text' in out
+    assert 'name: msg' not in out
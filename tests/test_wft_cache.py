@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+import pytest
+from tests.test_pool import run_boot
+
+'''
+远程流程模板签名的磁盘缓存(--wft-cache-ttl/--refresh-wft)的测试: 用PATH上的桩argo命令模拟集群, 并记录调用
+'''
+
+# 桩argo命令: 只支持 argo template list/get, 调用记录追加到 $ARGO_STUB_LOG
+argo_stub = '''#!{python}
+import json
+import os
+import sys
+with open(os.environ['ARGO_STUB_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+wft = {{
+    'apiVersion': 'argoproj.io/v1alpha1',
+    'kind': 'WorkflowTemplate',
+    'metadata': {{'name': 'remote-wft', 'namespace': 'argo'}},
+    'spec': {{'templates': [{{'name': 'whalesay', 'inputs': {{'parameters': [{{'name': 'msg'}}]}}, 'container': {{'image': 'docker/whalesay'}}}}]}},
+}}
+if sys.argv[1:3] == ['template', 'list']:
+    print('remote-wft')
+elif sys.argv[1:3] == ['template', 'get']:
+    print(json.dumps(wft, indent=1))
+else:
+    sys.exit('unsupported: ' + ' '.join(sys.argv))
+'''
+
+# 引用远程流程模板的步骤文件
+step_yaml = '''- wf(ref-test):
+    - templates:
+        main():
+          steps:
+            - - remote-wft.whalesay(hello)
+'''
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    argo = bin_dir / 'argo'
+    argo.write_text(argo_stub.format(python=sys.executable), encoding='utf-8')
+    argo.chmod(0o755)
+    monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('ARGO_STUB_LOG', str(tmp_path / 'argo.log'))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    monkeypatch.delenv('KUBECONFIG', raising=False)
+    (tmp_path / 'ref-test.yml').write_text(step_yaml, encoding='utf-8')
+    return tmp_path
+
+def run(env, *args):
+    '''
+    执行步骤文件
+    :return: 本次调用argo的命令
+    '''
+    log = env / 'argo.log'
+    if log.exists():
+        log.unlink()
+    run_boot([str(env / 'ref-test.yml'), '-o', 'out'] + list(args), env)
+    assert 'remote-wft' in (env / 'out' / 'ref-test.yml').read_text(encoding='utf-8')
+    return log.read_text(encoding='utf-8').splitlines() if log.exists() else []
+
+def test_cache_hit(env):
+    # 批量拉取: 1次list + 1次get
+    assert run(env) == ['template list -n argo -o name', 'template get remote-wft -n argo -o json']
+    cache_file = env / 'cache' / 'ArgoFlowBoot' / 'wft-signatures.json'
+    assert '|argo|remote-wft' in json.loads(cache_file.read_text(encoding='utf-8'))
+    # 有效期内不访问集群
+    assert run(env) == []
+
+def test_cache_expired(env):
+    run(env)
+    cache_file = env / 'cache' / 'ArgoFlowBoot' / 'wft-signatures.json'
+    entries = json.loads(cache_file.read_text(encoding='utf-8'))
+    for entry in entries.values():
+        entry['time'] -= 601
+    cache_file.write_text(json.dumps(entries), encoding='utf-8')
+    # 过期了, 默认有效期600秒
+    assert len(run(env)) == 2
+    # 有效期更长则没过期
+    cache_file.write_text(json.dumps(entries), encoding='utf-8')
+    assert run(env, '--wft-cache-ttl', '3600') == []
+
+def test_refresh(env):
+    run(env)
+    assert len(run(env, '--refresh-wft')) == 2
+    # 禁用缓存: 每次都拉取
+    assert len(run(env, '--wft-cache-ttl', '0')) == 2